@@ -2,10 +2,15 @@
 
 import os
 import re
+import ast
+import bisect
+import heapq
 import sys
 import csv      
 import json
 import copy
+import numbers
+import operator
 import shutil
 import string
 import hashlib
@@ -13,6 +18,7 @@ import traceback
 
 import types
 import uuid as uuidmod
+import weakref
 import itertools as it
 import functools as ft
 
@@ -22,6 +28,7 @@ from datetime import datetime
 from warnings import warn,simplefilter
 from itertools import cycle
 from multiprocessing import Pool, Lock
+from collections.abc import Mapping, MutableMapping
 
 # increase the csv field size limit
 #csv.field_size_limit(sys.maxsize) # throws error on some versions of Python
@@ -68,10 +75,13 @@ print('jeanny, Ver.'+__version__)
 
 FILENAME_ID = '$FILENAME$' # parameter defining the filename
 ITEM_ID = '$UUID$' # id that uniquely identifies each item (used in redistribution of items between collections)
+MANIFEST = '.manifest.jeanny' # file with the hashes of the items in the folder (see update_folder)
 
 SETTINGS = {
     'FILENAME_ID': FILENAME_ID,
     'ITEM_ID': ITEM_ID,
+    'MANIFEST': MANIFEST,
+    'COMPACT_KEYS': 8, # minimal number of keys for the compact rows (see compact_items), 0 to disable
     'DEBUG': False,
     #'PLOTTING_BACKEND': 'Agg',
 }
@@ -92,11 +102,14 @@ def json_serial(obj):
     if isinstance(obj, (datetime, date)):
         serial = obj.isoformat()
         return serial
+    if hasattr(obj,'export_to_json'): # item proxies
+        return obj.export_to_json()
     raise TypeError ("Type %s not serializable" % type(obj))
 
 def is_identifier(token):    
     return re.match('^[a-zA-Z_][\w_]*$',token)
     
+@ft.lru_cache(maxsize=1024)
 def process_exp(raw_expression): # think about more proper name
     # change this ('a**2+2') to this ('var["a"]**2+2')
     import shlex
@@ -104,6 +117,813 @@ def process_exp(raw_expression): # think about more proper name
     for i,token in enumerate(tokens):
         if is_identifier(token): tokens[i] = 'var["%s"]'%token
     return ''.join(tokens)
+    
+# literal nodes of the parsed expressions (Python<3.8 doesn't produce ast.Constant)
+if sys.version_info>=(3,8):
+    AST_CONSTANTS = (ast.Constant,)
+else:
+    AST_CONSTANTS = (ast.Num,ast.Str,ast.Bytes,ast.NameConstant)
+    
+class VectorFilter:
+    """
+    Filter expression compiled for the vectorized evaluation over the column arrays.
+    The syntax is the same as for the string filters of Collection.ids:
+    columns are referred either as var["name"], or as bare identifiers
+    (like in the "proc" mode), e.g. 'var["a"]>1 and var["b"]<2' or 'a>1 and b<2'.
+    Supported are comparisons (including the chained ones, "in"/"not in" with
+    constant sequences, and "is None"), boolean operations, arithmetic,
+    and the functions abs, int, float.
+    The items missing any of the referred columns are never selected.
+    The item itself ("var" without the subscript) can not be referred.
+    """
+    
+    def __init__(self,expression):
+        self.expression = expression
+        self.tree = ast.parse(expression.strip(),mode='eval').body
+        self.colnames = []
+        self.__check__(self.tree)
+        
+    def __repr__(self):
+        return 'VectorFilter(%s)'%repr(self.expression)
+        
+    def __colname__(self,node):
+        """
+        Get the column name if the node refers to a column, otherwise None.
+        """
+        if isinstance(node,ast.Name) and node.id=='var':
+            raise NotImplementedError('the whole item is not supported in vectorized filter: %s'%self.expression)
+        if isinstance(node,ast.Name) and node.id not in VECTOR_FILTER_FUNCTIONS:
+            return node.id
+        if isinstance(node,ast.Subscript) and isinstance(node.value,ast.Name) \
+                and node.value.id=='var':
+            slc = node.slice
+            if getattr(ast,'Index',None) and isinstance(slc,ast.Index): # Python<3.9
+                slc = slc.value
+            if isinstance(slc,AST_CONSTANTS) and type(ast.literal_eval(slc)) is str:
+                return ast.literal_eval(slc)
+        return None
+        
+    def __check__(self,node):
+        """
+        Check that the expression is supported and collect the column names.
+        """
+        colname = self.__colname__(node)
+        if colname is not None:
+            if colname not in self.colnames: self.colnames.append(colname)
+        elif isinstance(node,AST_CONSTANTS):
+            pass
+        elif isinstance(node,(ast.Tuple,ast.List,ast.Set)):
+            for elt in node.elts:
+                if not isinstance(elt,AST_CONSTANTS):
+                    raise NotImplementedError('only constant sequences are supported: %s'%self.expression)
+        elif isinstance(node,ast.Compare):
+            for child in [node.left]+node.comparators:
+                self.__check__(child)
+        elif isinstance(node,ast.BoolOp):
+            for child in node.values:
+                self.__check__(child)
+        elif isinstance(node,ast.UnaryOp):
+            self.__check__(node.operand)
+        elif isinstance(node,ast.BinOp) and type(node.op) in VECTOR_FILTER_OPERATORS:
+            self.__check__(node.left)
+            self.__check__(node.right)
+        elif isinstance(node,ast.Call) and isinstance(node.func,ast.Name) and \
+                node.func.id in VECTOR_FILTER_FUNCTIONS and len(node.args)==1 and not node.keywords:
+            self.__check__(node.args[0])
+        else:
+            raise NotImplementedError('unsupported vectorized filter syntax: %s'%self.expression)
+            
+    def conditions(self):
+        """
+        Get the simple conditions "column <op> constant" from the top-level
+        conjunction of the filter, as the list of (colname,op,value) triples,
+        where op is one of "==", "!=", "<", "<=", ">", ">=", "in", "not in".
+        Conditions are used for the index lookups (see Collection.create_index).
+        """
+        if isinstance(self.tree,ast.BoolOp) and isinstance(self.tree.op,ast.And):
+            terms = self.tree.values
+        else:
+            terms = [self.tree]
+        conditions = []
+        for term in terms:
+            if not isinstance(term,ast.Compare): continue
+            operands = [term.left]+term.comparators
+            for op,left,right in zip(term.ops,operands[:-1],operands[1:]):
+                symbol = VECTOR_FILTER_SYMBOLS.get(type(op))
+                if symbol is None: continue
+                lcol = self.__colname__(left)
+                rcol = self.__colname__(right)
+                if lcol is not None and isinstance(right,(ast.Tuple,ast.List,ast.Set)) \
+                        and symbol in {'in','not in'}:
+                    conditions.append((lcol,symbol,[ast.literal_eval(elt) for elt in right.elts]))
+                elif lcol is not None and isinstance(right,AST_CONSTANTS) and symbol not in {'in','not in'}:
+                    conditions.append((lcol,symbol,ast.literal_eval(right)))
+                elif rcol is not None and isinstance(left,AST_CONSTANTS) and symbol in VECTOR_FILTER_MIRRORED:
+                    conditions.append((rcol,VECTOR_FILTER_MIRRORED[symbol],ast.literal_eval(left)))
+        return conditions
+            
+    def evaluate(self,columns,n):
+        """
+        Evaluate filter on the columns. Columns are given in the dictionary
+        {colname:(data,mask)}, where data are numpy arrays of length n
+        and masks are boolean arrays marking the present values.
+        Returns the boolean selection array of length n.
+        """
+        import numpy as np
+        valid = np.ones(n,dtype=bool)
+        for colname in self.colnames:
+            valid &= columns[colname][1]
+        if valid.all():
+            rows = None
+            cols = {colname:columns[colname][0] for colname in self.colnames}
+        else: # evaluate only on the rows having all the columns
+            rows = np.flatnonzero(valid)
+            cols = {colname:columns[colname][0][rows] for colname in self.colnames}
+        m = n if rows is None else len(rows)
+        with np.errstate(all='ignore'):
+            flags = self.__eval__(self.tree,cols)
+        flags = np.broadcast_to(vector_bool(flags),(m,))
+        if rows is None:
+            return np.array(flags)
+        selection = np.zeros(n,dtype=bool)
+        selection[rows] = flags
+        return selection
+        
+    def __eval__(self,node,cols):
+        import numpy as np
+        colname = self.__colname__(node)
+        if colname is not None:
+            return cols[colname]
+        elif isinstance(node,AST_CONSTANTS):
+            return ast.literal_eval(node)
+        elif isinstance(node,(ast.Tuple,ast.List,ast.Set)):
+            return [ast.literal_eval(elt) for elt in node.elts]
+        elif isinstance(node,ast.Compare):
+            left = self.__eval__(node.left,cols)
+            flags = True
+            for op,comparator in zip(node.ops,node.comparators):
+                right = self.__eval__(comparator,cols)
+                flags = flags & vector_compare(op,left,right)
+                left = right
+            return flags
+        elif isinstance(node,ast.BoolOp):
+            return self.__boolop__(node,cols)
+        elif isinstance(node,ast.UnaryOp):
+            operand = self.__eval__(node.operand,cols)
+            if isinstance(node.op,ast.Not):
+                return np.logical_not(vector_bool(operand))
+            elif isinstance(node.op,ast.USub):
+                return -operand
+            elif isinstance(node.op,ast.UAdd):
+                return +operand
+            else:
+                return ~operand
+        elif isinstance(node,ast.BinOp):
+            left = self.__eval__(node.left,cols)
+            right = self.__eval__(node.right,cols)
+            return VECTOR_FILTER_OPERATORS[type(node.op)](left,right)
+        elif isinstance(node,ast.Call):
+            arg = self.__eval__(node.args[0],cols)
+            func,vfunc = VECTOR_FILTER_FUNCTIONS[node.func.id]
+            if type(arg) is not np.ndarray:
+                return func(arg)
+            if arg.dtype==object:
+                return np.frompyfunc(func,1,1)(arg)
+            return vfunc(arg)
+            
+    def __boolop__(self,node,cols):
+        """
+        Evaluate "and"/"or" with short-circuiting: each next operand is evaluated
+        only on the rows not decided by the previous ones, so that the guards 
+        like 'var["a"] is not None and var["a"]>1' work as in the item-wise filters.
+        """
+        import numpy as np
+        decisive = not isinstance(node.op,ast.And) # value deciding the result
+        n = len(next(iter(cols.values()))) if cols else None
+        flags = vector_bool(self.__eval__(node.values[0],cols))
+        for value in node.values[1:]:
+            if n is None: # constant expression
+                if flags==decisive: return flags
+                flags = vector_bool(self.__eval__(value,cols))
+                continue
+            flags = np.array(np.broadcast_to(flags,(n,)))
+            rows = np.flatnonzero(flags!=decisive)
+            if not len(rows): break
+            subcols = {colname:col[rows] for colname,col in cols.items()}
+            flags[rows] = np.broadcast_to(vector_bool(self.__eval__(value,subcols)),(len(rows),))
+        return flags
+            
+def vector_bool(val):
+    """
+    Truth value of the scalar or array (element-wise).
+    """
+    import numpy as np
+    if type(val) is np.ndarray:
+        return val.astype(bool)
+    return bool(val)
+    
+def vector_compare(op,left,right):
+    """
+    Element-wise comparison of arrays and/or scalars.
+    """
+    import numpy as np
+    if isinstance(op,(ast.In,ast.NotIn)):
+        if type(right) is list: # column in constant sequence
+            if type(left) is np.ndarray and left.dtype!=object:
+                flags = np.isin(left,right)
+            elif type(left) is np.ndarray:
+                values = set(right)
+                flags = np.fromiter((val in values for val in left),dtype=bool,count=len(left))
+            else:
+                flags = left in right
+        elif type(right) is np.ndarray: # containment in the column values
+            if type(left) is np.ndarray:
+                pairs = zip(left,right)
+            else:
+                pairs = zip(it.repeat(left),right)
+            flags = np.fromiter((l in r for l,r in pairs),dtype=bool,count=len(right))
+        else:
+            flags = left in right
+        return np.logical_not(flags) if isinstance(op,ast.NotIn) else flags
+    if isinstance(op,(ast.Is,ast.IsNot)):
+        if type(left) is np.ndarray:
+            flags = np.fromiter((val is right for val in left),dtype=bool,count=len(left))
+        else:
+            flags = left is right
+        return np.logical_not(flags) if isinstance(op,ast.IsNot) else flags
+    return VECTOR_FILTER_COMPARISONS[type(op)](left,right)
+    
+VECTOR_FILTER_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+VECTOR_FILTER_COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+VECTOR_FILTER_SYMBOLS = {
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Gt: '>',
+    ast.GtE: '>=',
+    ast.In: 'in',
+    ast.NotIn: 'not in',
+}
+
+VECTOR_FILTER_MIRRORED = { # "constant <op> column" -> "column <mirrored op> constant"
+    '==': '==',
+    '!=': '!=',
+    '<': '>',
+    '<=': '>=',
+    '>': '<',
+    '>=': '<=',
+}
+
+VECTOR_FILTER_FUNCTIONS = { # name -> (scalar function, array function)
+    'abs': (abs, lambda arr: abs(arr)),
+    'int': (int, lambda arr: arr.astype('int64')),
+    'float': (float, lambda arr: arr.astype('float64')),
+}
+
+@ft.lru_cache(maxsize=256)
+def compile_filter(expression):
+    """
+    Compile string filter to VectorFilter (compiled filters are cached).
+    """
+    return VectorFilter(expression)
+
+# =======================================================
+# ============= Column accessors ========================
+# =======================================================
+
+def compact_getter(colnames):
+    """
+    Get the function giving the tuple of values of the compact row (see CompactRow) 
+    by colnames (two or more); getters are compiled once for each schema of the rows.
+    """
+    getters = {}
+    def getter(row):
+        schema = row.__schema__
+        get = getters.get(schema)
+        if get is None:
+            positions = schema.positions
+            get = getters[schema] = operator.itemgetter(*[positions[colname] for colname in colnames])
+        return get(row.__values__)
+    return getter
+
+def column_accessor(colname,functions=None):
+    """
+    Compile the column name to the accessor function on item (see Collection.getcols):
+    user function from the "functions" dictionary, plain key, 
+    or the chain of attributes ("a.b.c" gives item["a"].b.c).
+    """
+    if functions and colname in functions:
+        return functions[colname]
+    if '.' not in colname:
+        return operator.itemgetter(colname)
+    key,attrs = colname.split('.',1)
+    getkey = operator.itemgetter(key)
+    getattrs = operator.attrgetter(attrs)
+    return lambda item: getattrs(getkey(item))
+
+# =======================================================
+# ============= Secondary indexes =======================
+# =======================================================
+
+class ItemPositions:
+    """
+    Ordinal positions of the items in the collection, shared by all 
+    secondary indexes of the collection. Positions are used to return
+    the IDs found by the indexes in the same order as the collection gives them.
+    New items are placed to the end, deleted items leave gaps.
+    """
+    
+    def __init__(self,IDs=()):
+        self.__pos__ = {ID:pos for pos,ID in enumerate(IDs)}
+        self.__counter__ = len(self.__pos__)
+        
+    def __getitem__(self,ID):
+        return self.__pos__[ID]
+        
+    def __contains__(self,ID):
+        return ID in self.__pos__
+        
+    def add(self,ID):
+        if ID not in self.__pos__:
+            self.__pos__[ID] = self.__counter__
+            self.__counter__ += 1
+            
+    def discard(self,ID):
+        self.__pos__.pop(ID,None)
+        
+    def sort(self,IDs):
+        """
+        Sort IDs in the collection order.
+        """
+        return sorted(IDs,key=self.__pos__.__getitem__)
+        
+class HashIndex:
+    """
+    Non-unique secondary hash index on a collection column.
+    Maps each value of the column to the IDs of items having this value.
+    Supports equality lookups and grouping. Unhashable values (e.g. lists)
+    are not indexed: they are never equal to the hashable lookup values,
+    and the grouping by such column falls back to the collection scan.
+    """
+    
+    kind = 'hash'
+    
+    def __init__(self,colname,positions):
+        self.colname = colname
+        self.__positions__ = positions
+        self.__buckets__ = {} # value -> ordered set of IDs {ID:None}
+        self.__values__ = {} # ID -> value
+        self.__unsorted__ = set() # values whose buckets are out of collection order
+        
+    def __len__(self):
+        return len(self.__values__)
+        
+    def __repr__(self):
+        return "%s('%s', %d items, %d values)"%(self.__class__.__name__,
+            self.colname,len(self.__values__),len(self.__buckets__))
+        
+    def build(self,pairs):
+        """
+        Build index from the sequence of (ID,value) pairs in the collection order.
+        """
+        buckets = {}
+        values = {}
+        for ID,val in pairs:
+            try:
+                bucket = buckets.get(val)
+            except TypeError: # unhashable value
+                continue
+            values[ID] = val
+            if bucket is None:
+                buckets[val] = {ID:None}
+            else:
+                bucket[ID] = None
+        self.__buckets__ = buckets
+        self.__values__ = values
+        self.__unsorted__ = set()
+        
+    def prepare(self,nchanges):
+        """
+        Prepare for the given number of changes (used by the bulk updates).
+        """
+        pass
+        
+    def set(self,ID,val):
+        values = self.__values__
+        if ID in values:
+            if values[ID]==val:
+                values[ID] = val
+                return
+            self.discard(ID)
+        try:
+            bucket = self.__buckets__.get(val)
+        except TypeError: # unhashable value
+            return
+        values[ID] = val
+        if bucket is None:
+            self.__buckets__[val] = {ID:None}
+        else:
+            positions = self.__positions__
+            if positions[ID]<positions[next(reversed(bucket))]:
+                self.__unsorted__.add(val)
+            bucket[ID] = None
+            
+    def discard(self,ID):
+        values = self.__values__
+        if ID not in values: return
+        val = values.pop(ID)
+        bucket = self.__buckets__[val]
+        del bucket[ID]
+        if not bucket:
+            del self.__buckets__[val]
+            self.__unsorted__.discard(val)
+            
+    def __bucket__(self,val):
+        bucket = self.__buckets__.get(val)
+        if bucket is None: 
+            return []
+        if val in self.__unsorted__:
+            bucket = {ID:None for ID in self.__positions__.sort(bucket)}
+            self.__buckets__[val] = bucket
+            self.__unsorted__.discard(val)
+        return list(bucket)
+            
+    def lookup(self,val):
+        """
+        Get IDs of the items where column is equal to val.
+        """
+        return self.__bucket__(val)
+        
+    def lookup_many(self,vals):
+        """
+        Get IDs of the items where column is equal to any of vals.
+        """
+        buckets = [self.__bucket__(val) for val in set(vals)]
+        if len(buckets)==1:
+            return buckets[0]
+        return self.__positions__.sort(it.chain(*buckets))
+        
+    def group(self):
+        """
+        Get the group index {value:[IDs]} (see Collection.group).
+        """
+        return {val:self.__bucket__(val) for val in list(self.__buckets__)}
+
+class SortedIndex:
+    """
+    Non-unique secondary index keeping the column values sorted.
+    Supports equality and range lookups by bisection, and splitting
+    by the boundary values. Column values must be mutually comparable;
+    None and NaN values are not indexed (they never satisfy the range conditions),
+    neither are the values added later which are not comparable with the indexed ones.
+    """
+    
+    kind = 'sorted'
+    
+    BULK_THRESHOLD = 64 # number of changes triggering the lazy re-sorting
+    
+    def __init__(self,colname,positions):
+        self.colname = colname
+        self.__positions__ = positions
+        self.__values__ = {} # ID -> value
+        self.__keys__ = [] # sorted values
+        self.__ids__ = [] # IDs aligned with keys
+        self.__dirty__ = False # keys need re-sorting
+        
+    def __len__(self):
+        return len(self.__values__)
+        
+    def __repr__(self):
+        return "%s('%s', %d items)"%(self.__class__.__name__,
+            self.colname,len(self.__values__))
+        
+    def build(self,pairs):
+        """
+        Build index from the sequence of (ID,value) pairs.
+        """
+        self.__values__ = {ID:val for ID,val in pairs if val is not None and val==val}
+        self.__dirty__ = True
+        self.__sort__()
+        
+    def __sort__(self):
+        if not self.__dirty__: return
+        try:
+            pairs = sorted(self.__values__.items(),key=lambda pair: pair[1])
+        except TypeError:
+            raise Exception('values of "%s" are not comparable, cannot create sorted index'%self.colname)
+        self.__keys__ = [val for _,val in pairs]
+        self.__ids__ = [ID for ID,_ in pairs]
+        self.__dirty__ = False
+        
+    def prepare(self,nchanges):
+        if nchanges>self.BULK_THRESHOLD:
+            self.__dirty__ = True
+        
+    def set(self,ID,val):
+        if val is None or val!=val:
+            self.discard(ID)
+            return
+        values = self.__values__
+        if ID in values:
+            if values[ID]==val:
+                return
+            self.discard(ID)
+        if values:
+            try:
+                val<next(iter(values.values()))
+            except TypeError: # not comparable with the indexed values
+                return
+        values[ID] = val
+        if not self.__dirty__:
+            i = bisect.bisect_right(self.__keys__,val)
+            self.__keys__.insert(i,val)
+            self.__ids__.insert(i,ID)
+            
+    def discard(self,ID):
+        values = self.__values__
+        if ID not in values: return
+        val = values.pop(ID)
+        if not self.__dirty__:
+            keys = self.__keys__
+            i = bisect.bisect_left(keys,val)
+            j = bisect.bisect_right(keys,val)
+            k = self.__ids__.index(ID,i,j)
+            del keys[k]
+            del self.__ids__[k]
+            
+    def __slice__(self,i,j):
+        return self.__positions__.sort(self.__ids__[i:j])
+        
+    def __bounds__(self,op,val):
+        """
+        Get the slice of the sorted keys satisfying "column <op> val".
+        """
+        keys = self.__keys__
+        if op=='==':
+            return bisect.bisect_left(keys,val),bisect.bisect_right(keys,val)
+        elif op=='<':
+            return 0,bisect.bisect_left(keys,val)
+        elif op=='<=':
+            return 0,bisect.bisect_right(keys,val)
+        elif op=='>':
+            return bisect.bisect_right(keys,val),len(keys)
+        elif op=='>=':
+            return bisect.bisect_left(keys,val),len(keys)
+        else:
+            raise Exception('unsupported index operation: %s'%op)
+        
+    def select(self,conditions):
+        """
+        Get IDs of the items satisfying all the conditions, given
+        as (op,value) pairs with op one of "==", "<", "<=", ">", ">=".
+        """
+        self.__sort__()
+        i,j = 0,len(self.__keys__)
+        for op,val in conditions:
+            i_,j_ = self.__bounds__(op,val)
+            i = max(i,i_); j = min(j,j_)
+        return self.__slice__(i,j) if i<j else []
+        
+    def lookup(self,val):
+        """
+        Get IDs of the items where column is equal to val.
+        """
+        return self.select([('==',val)])
+        
+    def between(self,lo=None,hi=None,inclusive=(True,True)):
+        """
+        Get IDs of the items where lo <= column <= hi.
+        Bound set to None is omitted; inclusive flags 
+        switch between strict and non-strict comparisons.
+        """
+        conditions = []
+        if lo is not None: conditions.append(('>=' if inclusive[0] else '>',lo))
+        if hi is not None: conditions.append(('<=' if inclusive[1] else '<',hi))
+        return self.select(conditions)
+        
+    def less(self,val,inclusive=False):
+        """
+        Get IDs of the items where column < val (or <= if inclusive).
+        """
+        return self.select([('<=' if inclusive else '<',val)])
+        
+    def greater(self,val,inclusive=False):
+        """
+        Get IDs of the items where column > val (or >= if inclusive).
+        """
+        return self.select([('>=' if inclusive else '>',val)])
+        
+    def bucket(self,vals):
+        """
+        Split the indexed items by the boundary values in one pass:
+        column<=vals[0], vals[0]<column<=vals[1], ..., column>vals[-1].
+        Returns the list of len(vals)+1 ID lists (see Collection.split).
+        """
+        self.__sort__()
+        keys = self.__keys__
+        cuts = [0]+[bisect.bisect_right(keys,val) for val in vals]+[len(keys)]
+        return [self.__slice__(cuts[i],cuts[i+1]) if cuts[i]<cuts[i+1] else []
+            for i in range(len(cuts)-1)]
+        
+    def lookup_many(self,vals):
+        """
+        Get IDs of the items where column is equal to any of vals.
+        """
+        self.__sort__()
+        keys = self.__keys__
+        IDs = []
+        for val in set(vals):
+            IDs += self.__ids__[bisect.bisect_left(keys,val):bisect.bisect_right(keys,val)]
+        return self.__positions__.sort(IDs)
+        
+    def runs(self):
+        """
+        Iterate over the (value,IDs) pairs in the order of values,
+        IDs of each value are in the order of the collection (see join_index_).
+        """
+        self.__sort__()
+        keys = self.__keys__
+        i,n = 0,len(keys)
+        while i<n:
+            j = bisect.bisect_right(keys,keys[i],i)
+            yield keys[i],self.__slice__(i,j)
+            i = j
+        
+INDEX_KINDS = {
+    'hash': HashIndex,
+    'sorted': SortedIndex,
+}
+
+# =======================================================
+# ============= Schema catalogue ========================
+# =======================================================
+
+def item_signature(item):
+    """
+    Signature of the item: tuple of keys and tuple of the value types.
+    """
+    if type(item) is CompactRow: # keys are shared by the schema
+        return item.__schema__.keys,tuple(map(type,item.__values__))
+    return tuple(item),tuple(map(type,item.values()))
+
+class SchemaCatalogue:
+    """
+    Live catalogue of the collection columns (see Collection.keys and get_types).
+    Keeps the signature of each item (see item_signature); equal signatures
+    are shared, so the column names, counts and types are collected 
+    from the distinct signatures only, i.e. in O(columns) for the homogeneous collections.
+    Catalogue is stamped with the epoch of the collection: the epoch is advanced 
+    by each change of the items and shared by the collections having the same items 
+    (e.g. subset), so the stale catalogue is detected and rebuilt.
+    Items changed in place through the references obtained before the last 
+    keys or get_types call are not detected (see Collection.create_catalogue).
+    """
+    
+    def __init__(self,dicthash,epoch):
+        self.__epoch__ = epoch
+        self.stamp = epoch[0]
+        self.__counts__ = {} # signature -> [signature,number of items]
+        intern = self.__intern__
+        self.__signatures__ = {ID:intern(item_signature(item)) for ID,item in dicthash.items()}
+        
+    def __repr__(self):
+        return 'SchemaCatalogue(%d items, %d signatures)'%\
+            (len(self.__signatures__),len(self.__counts__))
+        
+    def __intern__(self,sig):
+        entry = self.__counts__.get(sig)
+        if entry is None:
+            entry = self.__counts__[sig] = [sig,0]
+        entry[1] += 1
+        return entry[0]
+        
+    def __release__(self,sig):
+        entry = self.__counts__[sig]
+        entry[1] -= 1
+        if not entry[1]:
+            del self.__counts__[sig]
+        
+    def valid(self,dicthash):
+        """
+        Check that no items have been changed since the catalogue was updated.
+        """
+        return self.stamp==self.__epoch__[0] and len(self.__signatures__)==len(dicthash)
+        
+    def update(self,dicthash,IDs,colnames=None):
+        """
+        Update signatures of the items with given IDs (added, changed or deleted).
+        If colnames are given, only these columns of the items could be changed.
+        """
+        signatures = self.__signatures__
+        for ID in IDs:
+            sig = signatures.get(ID)
+            if ID in dicthash:
+                item = dicthash[ID]
+                if colnames is not None and sig is not None and \
+                        self.__same_columns__(sig,item,colnames): 
+                    continue
+                sig_ = item_signature(item)
+                if sig_==sig: continue # the same keys and types
+                signatures[ID] = self.__intern__(sig_)
+            else:
+                signatures.pop(ID,None)
+            if sig is not None:
+                self.__release__(sig)
+                
+    @staticmethod
+    def __same_columns__(sig,item,colnames):
+        """
+        Check that the columns of the item have the same presence and types as in signature.
+        """
+        keys,types = sig
+        for colname in colnames:
+            if colname in item:
+                if colname not in keys or types[keys.index(colname)] is not type(item[colname]):
+                    return False
+            elif colname in keys:
+                return False
+        return True
+        
+    def remap(self,func):
+        """
+        Replace each distinct signature sig by func(sig),
+        e.g. after deleting or renaming the columns.
+        """
+        counts = self.__counts__
+        self.__counts__ = {}
+        mapping = {}
+        for sig,n in counts.values():
+            sig_ = func(sig)
+            entry = self.__counts__.get(sig_)
+            if entry is None:
+                entry = self.__counts__[sig_] = [sig_,0]
+            entry[1] += n
+            mapping[sig] = entry[0]
+        self.__signatures__ = {ID:mapping[sig] for ID,sig in self.__signatures__.items()}
+        
+    def drop(self,colnames):
+        """
+        Account for the deletion of the columns from all items.
+        """
+        colnames = set(colnames)
+        def func(sig):
+            pairs = [(key,ty) for key,ty in zip(*sig) if key not in colnames]
+            return tuple([key for key,_ in pairs]),tuple([ty for _,ty in pairs])
+        self.remap(func)
+        
+    def rename(self,oldname,newname):
+        """
+        Account for renaming the column in all items (item[new] = item.pop(old)).
+        """
+        def func(sig):
+            keys,types = sig
+            if oldname not in keys:
+                return sig
+            pairs = dict(zip(keys,types))
+            pairs[newname] = pairs.pop(oldname)
+            return tuple(pairs),tuple(pairs.values())
+        self.remap(func)
+        
+    def keys(self):
+        """
+        Get the dictionary {column:number of items having the column}.
+        """
+        keys = {}
+        for (sig_keys,_),n in self.__counts__.values():
+            for key in sig_keys:
+                keys[key] = keys.get(key,0)+n
+        return keys
+        
+    def types(self):
+        """
+        Get the dictionary {column:set of value types}.
+        """
+        types = {}
+        for (sig_keys,sig_types),_ in self.__counts__.values():
+            for key,ty in zip(sig_keys,sig_types):
+                if key not in types:
+                    types[key] = {ty}
+                else:
+                    types[key].add(ty)
+        return types
 
 #class TabObject:
 #    """
@@ -171,6 +991,13 @@ class Collection:
         return 'Collection (%d lines)'%len(self.ids())
 
     def initialize(self,path=None,fmt=None,name='Default',**argv):
+        index_kinds = {colname:index.kind for colname,index in getattr(self,'__indexes__',{}).items()}
+        catalogued = getattr(self,'__catalogued__',False) # catalogue setting survives clear()
+        self.__indexes__ = {} # secondary indexes (see create_index)
+        self.__positions__ = ItemPositions()
+        self.__catalogue__ = None # schema catalogue (see create_catalogue)
+        self.__catalogued__ = catalogued # schema catalogue is enabled
+        self.__epoch__ = [0] # shared by the collections having the same items (see SchemaCatalogue)
         self.maxid = -1
         self.order = [] # order of columns (optional)
         self.types = None # numpy-compatible typing header (for export to DB)
@@ -187,13 +1014,15 @@ class Collection:
                     self.import_xlsx(path,**argv)
                 elif fmt=='fixcol':
                     self.import_fixcol(path,**argv)
+                elif fmt=='binary':
+                    self.import_binary(path,**argv)
                 else:
                     raise Exception('Unknown type: %s'%fmt)
                 self.__type__ = fmt
                 self.__path__ = path
                 self.__name__ = name
             elif type(path) is list:
-                self.__dicthash__ = {}
+                self.__dicthash__ = self.__create_dicthash__()
                 self.__name__ = ''
                 self.__path__ = './'
                 self.__type__ = '__init__'
@@ -202,12 +1031,22 @@ class Collection:
             else:
                 raise Exception('unknown content type: %s'%type(path))
         else:
-            self.__dicthash__ = {}
+            self.__dicthash__ = self.__create_dicthash__()
             self.__name__ = ''
             self.__path__ = './'
             self.__type__ = '__init__'
             #self.__dicthash__ = OrderedDict()
             #self.__dicthash__ = Dict() # !!! ATTENTION !!! when fetching non-existing item, creates it => non-standard behaviour
+        for colname,kind in index_kinds.items(): # index definitions survive clear()
+            self.create_index(colname,kind)
+            
+    def __create_dicthash__(self):
+        """
+        Create an empty item storage.
+        Storage backends (e.g. ColumnarCollection) override this method
+        to return their own mapping-like object.
+        """
+        return {}
             
     def export(self,path=None,type=None,**argv):
         """
@@ -223,6 +1062,8 @@ class Collection:
             self.export_json_list(path,**argv)
         elif type=='xlsx':
             self.export_xlsx(path,**argv)
+        elif type=='binary':
+            self.export_binary(path,**argv)
         else:
             raise Exception('Unknown type: %s'%type)        
         
@@ -233,15 +1074,52 @@ class Collection:
     #    """
     #    pass
     
-    def copy(self,name='Default',path=''): # CAN BE BUGGY!!
+    def copy(self,name='Default',path='',colnames=None):
         """
-        Copy the collection using the deep copy feature.
-        https://www.geeksforgeeks.org/copy-python-deep-copy-shallow-copy/
+        Copy the collection. Items are copied by clone_item, which shares
+        the immutable values and copies the containers recursively; 
+        other attributes are deep-copied, secondary indexes are rebuilt.
+        If colnames are given, only these columns are copied.
         """
-        col = copy.deepcopy(self)
+        col = copy.copy(self)
+        for attr,val in self.__dict__.items():
+            if attr not in {'__dicthash__','__indexes__','__positions__','__catalogue__','__epoch__'}:
+                setattr(col,attr,copy.deepcopy(val))
+        col.__dicthash__ = self.__clone_dicthash__(colnames)
+        col.__catalogue__ = None
+        col.__epoch__ = [0]
+        if colnames is not None:
+            col.order = [colname for colname in col.order if colname in colnames]
+        col.__indexes__ = {}
+        col.__positions__ = ItemPositions()
+        for colname,index in self.__indexes__.items():
+            if colnames is None or colname in colnames:
+                col.create_index(colname,index.kind)
         col.__name__ = name
         col.__path__ = path # don't use the parent's path by default
         return col
+        
+    def __clone_dicthash__(self,colnames=None):
+        """
+        Copy the item storage (see copy).
+        """
+        if colnames is not None:
+            return {ID:clone_item(item,colnames) for ID,item in self.__dicthash__.items()}
+        flat = CLONE_IMMUTABLE.issuperset
+        return {ID:item.copy() if flat(map(type,item.values())) else clone_item(item) \
+            for ID,item in self.__dicthash__.items()}
+
+    def to_columnar(self):
+        """
+        Convert collection to the columnar storage backend (see ColumnarCollection).
+        IDs, order and type header are preserved.
+        """
+        col = ColumnarCollection()
+        col.__dicthash__.load(list(self.__dicthash__),self.getitems())
+        col.order = list(self.order)
+        col.types = self.types
+        col.maxid = self.maxid
+        return col
 
     def setorder(self,order):
         self.order = order
@@ -258,6 +1136,7 @@ class Collection:
             #raise Exception('no such ID in __dicthash__: %s'%ID)
             raise KeyError('no such ID in __dicthash__: %s'%ID) # I think that this will mess up the workflow
             #return None
+        self.__epoch__[0] += 1 # item can be changed in place
         return self.__dicthash__[ID]
     
     def getitems(self,IDs=-1,mode='strict'):
@@ -267,6 +1146,7 @@ class Collection:
         """
         if IDs == -1:
             IDs = self.ids()
+        self.__epoch__[0] += 1 # items can be changed in place
         buffer = []
         for ID in IDs:
             # some dictionaries create item when it is not found,
@@ -303,7 +1183,32 @@ class Collection:
             shuffled_list.append(self.subset(shuffled_sublist))
         return shuffled_list
 
-    def ids(self,filter='True',proc=False):
+    def ids(self,filter='True',proc=False,vectorized=False):
+        """
+        Get IDs of the items satisfying the filter.
+        Filter can be a function on item, or a string expression on "var".
+        String filters containing equality ("==") or membership ("in") conditions
+        on the indexed columns, or range conditions on the columns with the 
+        sorted index, are resolved using the indexes (see create_index).
+        If vectorized is True, the string filter is compiled to VectorFilter
+        and evaluated over the whole columns at once; in this mode the columns
+        can also be referred by bare names (as with proc=True), and items
+        missing the referred columns are skipped instead of raising KeyError.
+        Filters with the syntax unsupported by VectorFilter fall back 
+        to the item-wise evaluation.
+        The vectorized mode pays off most for ColumnarCollection, where
+        the columns are already stored as arrays.
+        """
+        if type(filter)==str and self.__indexes__:
+            IDs = self.__indexed_ids__(filter,proc,vectorized)
+            if IDs is not None: return IDs
+        if vectorized and type(filter)==str:
+            try:
+                compile_filter(filter)
+            except NotImplementedError:
+                pass
+            else:
+                return self.__vectorized_ids__(filter)
         if proc: # allows filter be much more simple to input
             filter = process_exp(filter) # experimental
         if type(filter)==str: # simple
@@ -323,7 +1228,48 @@ class Collection:
             if flag:
                 id_list.append(ID)
         return id_list
-        
+
+    def __vectorized_ids__(self,expression,IDs=None):
+        """
+        Get IDs satisfying the string filter using the vectorized evaluation.
+        If IDs are given, only these items are checked.
+        """
+        vfilter = compile_filter(expression)
+        columns = self.__filter_columns__(vfilter.colnames,IDs)
+        if IDs is None:
+            selection = vfilter.evaluate(columns,len(self))
+            return self.__selected_ids__(selection)
+        selection = vfilter.evaluate(columns,len(IDs))
+        return [IDs[i] for i in selection.nonzero()[0].tolist()]
+
+    def __filter_columns__(self,colnames,IDs=None):
+        """
+        Gather columns for the vectorized filter in the form {colname:(data,mask)}.
+        """
+        if IDs is None:
+            items = list(self.__dicthash__.values())
+        else:
+            items = [self.__dicthash__[ID] for ID in IDs]
+        columns = {}
+        for colname in colnames:
+            try: # fast path: column is present in all items
+                values = [item[colname] for item in items]
+                mask = None
+            except KeyError:
+                mask = [colname in item for item in items]
+                values = [item[colname] if flag else None for item,flag in zip(items,mask)]
+            column = ColumnArray.from_list(values,mask)
+            columns[colname] = (column.data,column.mask)
+        return columns
+
+    def __selected_ids__(self,selection):
+        """
+        Get IDs corresponding to the boolean selection array.
+        """
+        import numpy as np
+        IDs = list(self.__dicthash__)
+        return [IDs[i] for i in np.flatnonzero(selection).tolist()]
+
 #    def keys(self):
 #        # old version
 #        keys = set()
@@ -334,6 +1280,14 @@ class Collection:
 #        return keys
     
     def keys(self):
+        """
+        Get the dictionary {column:number of items having the column}.
+        If the schema catalogue is enabled (see create_catalogue), it is used 
+        instead of scanning the items.
+        """
+        catalogue = self.__get_catalogue__()
+        if catalogue is not None:
+            return catalogue.keys()
         # new version, slow but more informative
         keys = {}
         for ID in self.__dicthash__:
@@ -364,15 +1318,30 @@ class Collection:
 #                    keys[key] += keys_[key_tuple]
 #        return keys
 
-    def subset(self,expr=None): # keys must be the same as in the original collection
+    def __subset_ids__(self,expr=None):
+        """
+        Resolve the subset expression (filter function, ID sequence or None)
+        to the list of IDs. String expressions are evaluated by the vectorized filter
+        when possible (see Collection.ids), so that the items missing the referred 
+        columns are skipped; unsupported expressions are evaluated item-wise,
+        and the missing columns raise KeyError as usual.
+        """
         if type(expr) is type(lambda:None):
             IDs = self.ids(expr)
+        elif type(expr) is str:
+            IDs = self.ids(expr,vectorized=True)
         elif type(expr) in {list,tuple,set,dict}:
             IDs = list(expr)
         elif expr is None:
             IDs = self.ids()
         else:
             raise Exception('unknown type of input expression')
+        return IDs
+
+    def subset(self,expr=None,view=False): # keys must be the same as in the original collection
+        if view: # zero-copy view, see CollectionView
+            return CollectionView(self,expr)
+        IDs = self.__subset_ids__(expr)
         #new_coll = Collection()
         #items = [self.__dicthash__[ID] for ID in IDs]
         #new_coll.update(items,IDs)
@@ -380,19 +1349,30 @@ class Collection:
         #return new_coll
         new_coll = Collection()
         new_coll.__dicthash__ = {ID:self.__dicthash__[ID] for ID in IDs}
+        new_coll.__epoch__ = self.__epoch__ # items are shared
         #new_coll.__dicthash__ # ??
         new_coll.order = self.order
         new_coll.maxid = max(IDs) if len(IDs)!=0 else -1
         return new_coll
         
-    def subset_group(self,grpi):
+    def view(self,expr=None):
+        """
+        Create zero-copy view of the collection (see CollectionView).
+        Expression is the same as in subset.
+        """
+        return CollectionView(self,expr)
+        
+    def subset_group(self,grpi,view=False):
         """
         Create subset using the group index.
         In this case the subset IDs will be the concatenation
         of IDs of group keys.
         The resulting collection is a "proxy", wich means that
         it's items are the same that the items of self.
+        If view is True, the copy-on-write view is returned instead (see CollectionView).
         """
+        if view:
+            return CollectionView(self,it.chain.from_iterable(grpi[key] for key in grpi))
         new_coll = Collection()
         dicthash = {}
         maxid = None
@@ -403,6 +1383,7 @@ class Collection:
                 if maxid==None or id_>maxid: # TODO: get rid of maxid everywhere
                     maxid = id_
         new_coll.__dicthash__ = dicthash
+        new_coll.__epoch__ = self.__epoch__ # items are shared
         new_coll.order = self.order
         new_coll.maxid = maxid
         return new_coll
@@ -495,6 +1476,7 @@ class Collection:
                     var[col] = tp(var[col])
             if flag_changed:
                 nchanged += 1
+        self.__reindex__(IDs,list(type_dict))
         return {'changed':nchanged}
     
     def batch_(self,expr,IDs=-1):
@@ -506,6 +1488,7 @@ class Collection:
                 raise Exception('no such ID in __dicthash__: %s'%ID)
             var = self.__dicthash__[ID]
             exec(expr) # very slow!!!
+        self.__reindex__(IDs)
     
     def assign(self,par,expr,IDs=-1):
         """
@@ -523,6 +1506,7 @@ class Collection:
                 raise Exception('no such ID in __dicthash__: %s'%ID)
             var = self.__dicthash__[ID]
             var[par] = expr(var)
+        self.__reindex__(IDs,[par])
         #self.__order__.append(par)
         if par not in self.order:
             self.order.append(par)
@@ -549,6 +1533,7 @@ class Collection:
             vals = expr(var)
             for par in vals:
                 var[par] = vals[par]
+        self.__reindex__(IDs)
         #self.__order__ += list(dct.keys())
 
     def assign__(self,dct,IDs=-1):  # expr => dct
@@ -577,6 +1562,7 @@ class Collection:
                 #var[par] = vals[par]
             for par in dct:
                 var[par] = dct[par](var)
+        self.__reindex__(IDs,list(dct))
         #self.__order__ += list(dct.keys())
         
     def index(self,expr): # ex-"reform"
@@ -614,6 +1600,7 @@ class Collection:
             ID_ = new_id_func(item)
             #item['__id__'] = ID_
             self.__dicthash__[ID_] = item
+        self.__reindex__()
         return self
         
     def get(self,ID,colname):
@@ -634,7 +1621,7 @@ class Collection:
         return cur_obj
         
     def getcols(self,colnames,IDs=-1,strict=True,mode=None,
-                functions=None,process=None): # get rid of "strict" argument in ver. 4.0
+                functions=None,process=None,as_array=False): # get rid of "strict" argument in ver. 4.0
         """
         Extract columns from collection.
         If parameter "strict" set to true,
@@ -644,6 +1631,10 @@ class Collection:
         Another update: now colname can have a properties,
         such as "col.var"
         __ID__ is a special parameter which corresponds to the local __dicthash__ ID.
+        If as_array is True (or "masked"), columns are returned as typed numpy arrays,
+        dtypes are taken from the types header or the values (see typed_array); missing values
+        (mode="greedy") and None values are masked (np.ma.MaskedArray).
+        If as_array is "nan", they are replaced by NaN.
         """
         # mode options: 'strict', 'silent', 'greedy'   # add this to docstring in ver. 4.0.
         if not mode: mode = 'strict' if strict else 'silent' 
@@ -655,42 +1646,94 @@ class Collection:
             colnames = [colnames]
         elif type(colnames) is not list:
             raise Exception('Column names should be either list or string')
-        cols = []
         for colname in colnames:
             if type(colname) not in [str,unicode]:
                 raise Exception('Column name should be a string')
-            cols.append([])
-        for ID in IDs:
-            for i,colname in enumerate(colnames):
-                if colname == '__ID__':
-                    cols[i].append(ID)
-                    continue                    
+        cols = self.__extract__(colnames,IDs,mode,functions)
+        if as_array:
+            cols = self.__typed_arrays__(colnames,cols,as_array)
+        if process:
+            cols = [process(col) for col in cols]
+        return cols
+        
+    def __extract__(self,colnames,IDs,mode,functions,rows=False):
+        """
+        Extract columns for getcols (or rows for getrows, if rows is True). 
+        Column names are compiled to accessors once (see column_accessor), 
+        which are mapped over the items. If the column has missing values 
+        (KeyError or AttributeError), mode defines what to do: "strict" raises, 
+        "silent" skips them, "greedy" gives item.get(colname); 
+        missing values in rows are always replaced by None.
+        Compact rows with the same schema are read by the positions of values.
+        """
+        IDs = list(IDs)
+        items = values = None
+        if any(colname!='__ID__' for colname in colnames):
+            dicthash = self.__dicthash__
+            for ID in IDs:
+                if ID not in dicthash:
+                    raise Exception('ID=%s is not in dicthash'%str(ID))
+            items = list(map(dicthash.__getitem__,IDs))
+            compact = bool(items) and all(type(item) is CompactRow for item in items)
+            if compact:
+                schema = items[0].__schema__
+                if all(item.__schema__ is schema for item in items):
+                    values = [item.__values__ for item in items] # value tuples sharing the schema
+        plain = all(colname not in functions and colname!='__ID__' and '.' not in colname \
+            for colname in colnames)
+        if rows and plain and len(colnames)>1: # rows are made by a single getter
+            if values is not None and all(colname in schema.positions for colname in colnames):
+                return list(map(operator.itemgetter(*[schema.positions[colname] for colname in colnames]),values))
+            try:
+                getter = compact_getter(colnames) if compact else operator.itemgetter(*colnames)
+                return list(map(getter,items))
+            except KeyError as e: 
+                if mode=='strict':
+                    raise e
+        cols = []
+        for colname in colnames:
+            if colname == '__ID__':
+                cols.append(list(IDs))
+                continue
+            accessor = column_accessor(colname,functions)
+            col = None
+            if values is not None and colname in schema.positions and colname not in functions:
+                col = list(map(operator.itemgetter(schema.positions[colname]),values))
+            elif mode=='strict' or colname not in functions: # functions are not called twice
                 try:
-                    #cols[i].append(self.__dicthash__[ID][colname]) % old
-                    if colname not in functions:
-                        cols[i].append(self.get(ID,colname)) # "get" this should be a method of item in the next version of Jeanny
-                    else:
-                        cols[i].append(functions[colname](self.__dicthash__[ID]))
+                    col = list(map(accessor,items))
                 except (KeyError, AttributeError) as e: 
                     if mode=='strict':
                         raise e
-                    elif mode=='silent':
-                        pass
-                    elif mode=='greedy':
-                        cols[i].append(self.__dicthash__[ID].get(colname))
-                    else:
-                        raise Exception('unknown mode: %s'%mode)
-                    #if strict: raise e # old version with "strict" argument
-        if process:
-            cols = [process(col) for col in cols]
-        return cols
+            if col is None:
+                if mode not in {'silent','greedy'}:
+                    raise Exception('unknown mode: %s'%mode)
+                col = []
+                for item in items:
+                    try:
+                        col.append(accessor(item))
+                    except (KeyError, AttributeError): 
+                        if rows:
+                            col.append(None)
+                        elif mode=='greedy':
+                            col.append(item.get(colname))
+            cols.append(col)
+        return list(zip(*cols)) if rows else cols
+        
+    def __typed_arrays__(self,colnames,cols,as_array):
+        """
+        Convert extracted columns to typed numpy arrays (see getcols).
+        """
+        missing = array_missing(as_array)
+        types = self.types or {} # otherwise dtypes are deduced from the values, as in get_types
+        return [typed_array(col,types.get(colname),missing=missing) for colname,col in zip(colnames,cols)]
         
-    def getcol(self,colname,IDs=-1,strict=True,mode='greedy',functions=None): # get rid of "strict" argument in ver. 4.0
+    def getcol(self,colname,IDs=-1,strict=True,mode='greedy',functions=None,as_array=False): # get rid of "strict" argument in ver. 4.0
         """
         Wrapper for a single-column call.
         """
         colnames = [colname,]
-        return self.getcols(colnames=colnames,IDs=IDs,strict=strict,mode=mode,functions=functions)[0]
+        return self.getcols(colnames=colnames,IDs=IDs,strict=strict,mode=mode,functions=functions,as_array=as_array)[0]
         
     def getrows(self,colnames,IDs=-1,strict=True,mode=None,
                 functions=None,process=None): # get rid of "strict" argument in ver. 4.0
@@ -717,29 +1760,10 @@ class Collection:
         for colname in colnames:
             if type(colname) not in [str,unicode]:
                 raise Exception('Column name should be a string')
-        rows = []
-        for ID in IDs:
-            row = []
-            for i,colname in enumerate(colnames):
-                if colname == '__ID__':
-                    row.append(ID)
-                    continue
-                try:
-                    if colname not in functions:
-                        row.append(self.get(ID,colname)) # "get" this should be a method of item in the next version of Jeanny
-                    else:
-                        row.append(functions[colname](self.__dicthash__[ID]))
-                except (KeyError, AttributeError) as e: 
-                    if mode=='strict':
-                        raise e
-                    elif mode=='silent':
-                        row.append(None)
-                    elif mode=='greedy':
-                        row.append(None)
-                    else:
-                        raise Exception('unknown mode: %s'%mode)
-                    #if strict: raise e # old version with "strict" argument
-            rows.append(tuple(row))
+        if colnames:
+            rows = self.__extract__(colnames,IDs,mode,functions,rows=True)
+        else:
+            rows = [() for ID in IDs]
         if process:
             rows = [process(row) for row in rows]
         return rows
@@ -761,6 +1785,8 @@ class Collection:
             for newcol,val in zip(newcols,vals):
                 item[newcol] = val
             del item[colname]
+        self.__indexes__.pop(colname,None)
+        self.__reindex__()
             
     def splitcol_(self,colname,newcols=None):
         """
@@ -849,40 +1875,79 @@ class Collection:
             colnames = [colnames]
         for i,cname in enumerate(self.order):
             if cname in colnames: self.order.pop(i)
-        for item in self.getitems():
+        for item in self.__dicthash__.values():
             for colname in colnames:
                 if colname in item:
                     del item[colname]
+        self.__drop_indexes__(colnames)
+        self.__recatalogue__(func=lambda catalogue: catalogue.drop(colnames))
+                    
+    def __drop_indexes__(self,colnames):
+        """
+        Drop indexes of the deleted columns.
+        """
+        for colname in colnames:
+            self.__indexes__.pop(colname,None)
                     
     def renamecol(self,oldname,newname):
         """
         Rename column of collection.
         """
         # delete from items
-        for item in self.getitems():
+        for item in self.__dicthash__.values():
             if oldname in item:
                 item[newname] = item.pop(oldname)
+        self.__recatalogue__(func=lambda catalogue: catalogue.rename(oldname,newname))
         # delete from order
         findall = lambda lst,val: [i for i,x in enumerate(lst) if x==val]
         if self.order is not None:
             indices = findall(self.order,oldname)
         for ind in indices:
             self.order[ind] = newname
-        
-    def split(self,colname,vals):
+        self.__rename_index__(oldname,newname)
+            
+    def __rename_index__(self,oldname,newname):
+        """
+        Move the index of the renamed column to the new name.
+        The index is rebuilt, since the items could already have the new column.
+        """
+        if oldname not in self.__indexes__ and newname not in self.__indexes__:
+            return
+        index = self.__indexes__.pop(oldname,None)
+        if index is None:
+            index = self.__indexes__.pop(newname)
+        self.__indexes__.pop(newname,None)
+        self.create_index(newname,index.kind)
+        
+    def split(self,colname,vals):
         """ Split collection using sharding of column by values.
-            Column 'colname' must have numeric format. """
-        cols = []
-        for i,val in enumerate(vals):
-            if i==0:
-                col = self.subset(self.ids(lambda v:v[colname]<=val))
-            else:
-                val_ = vals[i-1]
-                col = self.subset(self.ids(lambda v:val_<v[colname]<=val))
+            Column 'colname' must have numeric format. 
+            Shards are: col<=vals[0], vals[0]<col<=vals[1], ..., col>vals[-1].
+            If the column has a sorted index, the shards are cut from it,
+            otherwise the collection is scanned once. """
+        index = self.get_index(colname,'sorted')
+        if index is not None and len(index)==len(self):
+            return [self.subset(IDs) for IDs in index.bucket(vals)]
+        vals = list(vals)
+        if vals!=sorted(vals): # general case: shard by shard
+            cols = []
+            for i,val in enumerate(vals):
+                if i==0:
+                    col = self.subset(self.ids(lambda v:v[colname]<=val))
+                else:
+                    val_ = vals[i-1]
+                    col = self.subset(self.ids(lambda v:val_<v[colname]<=val))
+                cols.append(col)
+            col = self.subset(self.ids(lambda v:v[colname]>val))
             cols.append(col)
-        col = self.subset(self.ids(lambda v:v[colname]>val))
-        cols.append(col)
-        return cols
+            return cols
+        buckets = [[] for _ in range(len(vals)+1)]
+        dicthash = self.__dicthash__
+        for ID in dicthash:
+            val = dicthash[ID][colname]
+            if val!=val: continue # NaN doesn't fall into any shard
+            buckets[bisect.bisect_left(vals,val)].append(ID)
+        return [self.subset(IDs) for IDs in buckets]
 
     def tabulate(self,colnames=None,IDs=-1,mode='greedy',fmt='simple',file=None,append=None,functions=None,raw=False,floatfmt=None): # switched default to "greedy" instead of "strict"
         """
@@ -915,7 +1980,7 @@ class Collection:
                 
         if colnames==None:
             #colnames = list(self.keys().keys()) # this will prevent bug in Python3 since {}.keys() return dict_keys object instead of a list
-            allkeys = list(self.keys().keys()) # BOTTLENECK
+            allkeys = list(self.keys().keys()) # schema catalogue (see SchemaCatalogue)
             #colnames = self.order + list(set(allkeys)-set(self.order))
             if self.order:
                 order_set = set(self.order)
@@ -1038,7 +2103,15 @@ class Collection:
     
     # old WORKING version
     def update(self,items,IDs=None):
-        if type(items) is dict:
+        """
+        Add the copies of the items to the collection, or merge them into
+        the existing items if IDs are given. Wide items (at least 
+        SETTINGS['COMPACT_KEYS'] keys) sharing the key sets are stored as compact rows 
+        (see compact_items): these are mappings but not dict instances, 
+        so getitem doesn't always return dict. Set SETTINGS['COMPACT_KEYS'] 
+        to 0 to always store plain dictionaries.
+        """
+        if isinstance(items,Mapping):
             items = [items]
         elif type(items) not in [list,tuple]:
             raise Exception('Items should be either list or tuple')
@@ -1048,10 +2121,45 @@ class Collection:
         #    IDs = [IDs]
         elif type(IDs) is not list:
             raise Exception('Wrong IDs type: %s (expected list or integer)'%type(IDs))
-        for ID,item in zip(IDs,items):
-            if ID not in self.__dicthash__:
-                self.__dicthash__[ID] = {}
-            self.__dicthash__[ID].update(item)
+        dicthash = self.__dicthash__
+        for ID,item,row in zip(IDs,items,compact_items(items)):
+            if ID not in dicthash:
+                dicthash[ID] = row
+            else:
+                dicthash[ID].update(item)
+        self.__reindex__(IDs[:len(items)])
+
+    def extend(self,items,chunksize=100000):
+        """
+        Append new items to the collection. Unlike update, the collection
+        takes ownership of the items: dictionaries are stored without copying
+        (wide items are still converted to compact rows, see compact_items),
+        so they must not be used by the caller afterwards.
+        Items can be given by any iterable, e.g. by generator; they are consumed
+        by chunks, and IDs are allocated for the whole chunk at once.
+        A single item can be given as well.
+        """
+        if isinstance(items,Mapping):
+            items = [items]
+        items = iter(items)
+        while True:
+            chunk = list(it.islice(items,chunksize))
+            if not chunk: break
+            start = self.maxid+1
+            self.maxid += len(chunk)
+            IDs = range(start,self.maxid+1)
+            self.__extend__(IDs,chunk)
+            self.__reindex__(IDs)
+            
+    def __extend__(self,IDs,items):
+        """
+        Store the chunk of new items under the new IDs (see extend).
+        """
+        dicthash = self.__dicthash__
+        if not dicthash.keys().isdisjoint(IDs): # IDs are taken by update with explicit IDs
+            self.update(items,list(IDs)) # items are merged
+            return
+        dicthash.update(zip(IDs,compact_items(items,copy=False)))
 
     # new unreliable version
     #def update(self,items,merge=False): # this version assumes IDs are in items
@@ -1079,13 +2187,38 @@ class Collection:
     def delete(self,IDs):
         for ID in IDs:
             del self.__dicthash__[ID]
+        self.__reindex__(IDs)
         
     def group(self,expr): # TODO: add process_exp
         # special case: grouping by __ID__ for stacking collections
         if expr=='__ID__':
             return {k:[k] for k in self.__dicthash__}
+        # grouping by the indexed column
+        if self.__indexes__:
+            buffer = self.__indexed_group__(expr)
+            if buffer is not None: return buffer
         # normal grouping by expression
         buffer = {}
+        for ID,group_value in self.__group_pairs__(expr):
+            if group_value not in buffer:
+                buffer[group_value] = []
+            buffer[group_value].append(ID)
+        return buffer
+        
+    def group_index(self,expr):
+        """
+        Get the compact group index (see GroupIndex) for the group 
+        expression (see group). Keys go in order of their first appearance.
+        """
+        return GroupIndex.from_dict(self.group(expr))
+        
+    def __group_pairs__(self,expr):
+        """
+        Stream the (ID,value) pairs of the group expression
+        (see group; secondary indexes are not used).
+        """
+        if expr=='__ID__':
+            return ((ID,ID) for ID in self.__dicthash__)
         if type(expr)==str:
             #expr_ = eval('lambda var: var["' + expr + '"]') # simple
             colnames = expr.split()
@@ -1097,15 +2230,11 @@ class Collection:
             expr_ = lambda v: tuple([v[k] for k in expr])
         else:
             expr_ = expr
-        for ID in self.__dicthash__:
-            var = self.__dicthash__[ID] 
-            group_value = expr_(var)
-            if group_value not in buffer:
-                buffer[group_value] = []
-            buffer[group_value].append(ID)
-        return buffer
+        dicthash = self.__dicthash__
+        return ((ID,expr_(dicthash[ID])) for ID in dicthash)
         
-    def stat(self,keynames,grpi,valname,map=None,reduce=None,plain=False):  # Taken from Jeanny v.4 with some changes
+    def stat(self,keynames,grpi,valname,map=None,reduce=None,plain=False,
+             nprocs=None,colnames=None):  # Taken from Jeanny v.4 with some changes
         """
         Calculate function on index values.
         User must provide:
@@ -1114,43 +2243,54 @@ class Collection:
         MAPPER: item->value (can be scalar or vector)
         REDUCER: item_dict_array->value (can be scalar or vector)
         Flat: True - return plain stat index, False - return Collection
+        If nprocs>1, groups are processed by the pool of nprocs processes 
+        (see __parallel_stat__); mapper and reducer must be picklable then,
+        and colnames (required) are the item keys sent to the processes.
         """
-        if map is None: map = lambda v: v
-        if reduce is None: reduce = lambda ee: ee
-        group_buffer = grpi
-        stat_index = {}
-        for index_id in group_buffer:
-            ids = group_buffer[index_id]
-            items = self.getitems(ids)
-            map_values = [map(item) for item in items]
-            reduce_value = reduce(map_values)
-            stat_index[index_id] = reduce_value
+        if nprocs and nprocs>1:
+            stat_index = self.__parallel_stat__(grpi,[map],[reduce],nprocs,colnames)
+            stat_index = {index_id:stat_index[index_id][0] for index_id in stat_index}
+        else:
+            if map is None: map = lambda v: v
+            if reduce is None: reduce = lambda ee: ee
+            group_buffer = grpi
+            stat_index = {}
+            for index_id in group_buffer:
+                ids = group_buffer[index_id]
+                items = self.getitems(ids)
+                map_values = [map(item) for item in items]
+                reduce_value = reduce(map_values)
+                stat_index[index_id] = reduce_value
         if plain: # return only stat index
             return stat_index 
         else: # return index-based collection
-            if type(keynames) is str:
-                keynames = keynames.split()
-            elif type(keynames) not in {tuple,list}:
-                raise Exception('keynames must be str, tuple, or list')
-            nkeys = len(keynames)
-            col = Collection()
-            #col.__dicthash__ = {
-            #    key:{keyname:key,valname:stat_index[key]} \
-            #    for key in stat_index}
-            for keyvals in stat_index:
-                if nkeys==1: 
-                    keyvals_ = (keyvals,)
-                else:
-                    keyvals_ = keyvals
-                item = {}
-                for keyname,keyval in zip(keynames,keyvals_):
-                    item[keyname] = keyval
-                item[valname] = stat_index[keyvals]
-                col.__dicthash__[keyvals] = item
-            col.order = keynames + [valname,]
-            return col
+            stat_index = {keyvals:{valname:stat_index[keyvals]} for keyvals in stat_index}
+            return self.__stat_collection__(keynames,stat_index,[valname])
+            
+    def __stat_collection__(self,keynames,stat_index,valnames):
+        """
+        Create index-based collection from the stat index {keyvals:{valname:value}}.
+        """
+        if type(keynames) is str:
+            keynames = keynames.split()
+        elif type(keynames) not in {tuple,list}:
+            raise Exception('keynames must be str, tuple, or list')
+        nkeys = len(keynames)
+        col = Collection()
+        for keyvals in stat_index:
+            if nkeys==1: 
+                keyvals_ = (keyvals,)
+            else:
+                keyvals_ = keyvals
+            item = {}
+            for keyname,keyval in zip(keynames,keyvals_):
+                item[keyname] = keyval
+            item.update(stat_index[keyvals])
+            col.__dicthash__[keyvals] = item
+        col.order = list(keynames) + list(valnames)
+        return col
             
-    def stat_(self,keynames,grpi,map=None,reduce=None):
+    def stat_(self,keynames,grpi,map=None,reduce=None,nprocs=None,colnames=None):
         """
         Calculate function on index values.
         User must provide:
@@ -1162,7 +2302,9 @@ class Collection:
            each of which is the equivalent of the valname.
            If some keys are absent in mapper, the default 
            mapping is used for this statkey.
-        Flat: True - return plain stat index, False - return Collection
+        All statistics are calculated in a single pass over the group index.
+        For the built-in reducers on columns see aggregate.
+        For nprocs and colnames see stat.
         """
         if map is None: map = {}
         if reduce is None: reduce = {}
@@ -1173,29 +2315,116 @@ class Collection:
         
         # Get the sequence of keys for statistics
         statkeys = list(reduce.keys())
-                
-        # Make first table.
-        stat = self.stat(
-            keynames,grpi,
-            statkeys[0],
-            map = map.get(statkeys[0]),
-            reduce = reduce[statkeys[0]],
-        )
+        mappers = [map.get(statkey) for statkey in statkeys]
+        reducers = [reduce[statkey] for statkey in statkeys]
         
-        # Loop over other stats.
-        for statkey in statkeys[1:]:
-            stat.join(
-                keynames,
-                self.stat(
-                    keynames,grpi,
-                    statkey,
-                    map = map.get(statkey),
-                    reduce = reduce[statkey],
-                ),
-                [statkey]
-            )
+        # Calculate all statistics group by group.
+        if nprocs and nprocs>1:
+            stat_index = self.__parallel_stat__(grpi,mappers,reducers,nprocs,colnames)
+            stat_index = {index_id:dict(zip(statkeys,stat_index[index_id])) for index_id in stat_index}
+        else:
+            mappers = [map_ or (lambda v: v) for map_ in mappers]
+            stat_index = {}
+            for index_id in grpi:
+                items = self.getitems(grpi[index_id])
+                stat_index[index_id] = {statkey:reduce_([map_(item) for item in items]) \
+                    for statkey,map_,reduce_ in zip(statkeys,mappers,reducers)}
+        
+        return self.__stat_collection__(keynames,stat_index,statkeys)
         
-        return stat
+    def __parallel_stat__(self,grpi,mappers,reducers,nprocs,colnames=None):
+        """
+        Calculate statistics in the process pool (see JobScheduler).
+        Groups are distributed over the chunks of balanced total size (see stat_chunks);
+        only colnames of the items are sent to the processes, so they must be given.
+        Returns the stat index {keyvals:[values]} in order of grpi
+        regardless of the order in which the chunks are finished.
+        """
+        if colnames is None:
+            raise Exception('colnames must be given for the parallel stat')
+        funcs = [func for func in mappers+reducers if func is not None]
+        assert all(getattr(func,'__name__',None)!='<lambda>' for func in funcs),'lambda functions are not supported so far'
+        keys = list(grpi)
+        chunks = stat_chunks([len(grpi[key]) for key in keys],nprocs*4)
+        def pairs():
+            for n,chunk in enumerate(chunks):
+                groups = []
+                for i in chunk:
+                    items = self.getitems(grpi[keys[i]])
+                    items = [{key:item[key] for key in colnames if key in item} for item in items]
+                    groups.append((i,items))
+                yield n,{'groups':groups,'map':mappers,'reduce':reducers}
+        results = [None]*len(keys)
+        scheduler = JobScheduler(nprocs=nprocs)
+        try:
+            for n,output in scheduler.map_pairs(stat_job,pairs(),wrap=False):
+                for i,values in output:
+                    results[i] = values
+        finally:
+            scheduler.close()
+        return dict(zip(keys,results))
+        
+    def aggregate(self,keynames,aggs,grpi=None):
+        """
+        Calculate aggregates of the groups in a single pass.
+        Keynames are the grouping columns (see group), also used 
+        to name the key columns of the output; group index grpi
+        can be supplied instead of grouping by keynames.
+        Aggs is a dictionary {valname:spec}, spec is one of:
+            'count' -> number of items in group;
+            (colname,reducer,*args) -> built-in reducer on the column values:
+                'count', 'sum', 'mean', 'min', 'max', 'std' (args: ddof),
+                'first', 'last', 'median', 'quantile' (args: q);
+            (colname,func) -> user function on the array of the column values;
+            (None,func) -> user function on the list of items.
+        Missing and None values are skipped; aggregates of the groups
+        without values are None.
+        Each column is gathered once, built-in reducers are vectorized with numpy.
+        Returns index-based collection (see stat).
+        """
+        import numpy as np
+        if grpi is None:
+            grpi = self.group_index(keynames)
+        elif not isinstance(grpi,GroupIndex):
+            grpi = GroupIndex.from_dict(grpi)
+        keys = list(grpi)
+        sizes = grpi.sizes()
+        IDs = grpi.ids()
+        codes = np.repeat(np.arange(len(keys)),sizes)
+        # parse specifications
+        specs = {}
+        for valname,spec in aggs.items():
+            if spec=='count':
+                spec = (None,'count')
+            if type(spec) not in {tuple,list} or len(spec)<2:
+                raise Exception('bad aggregate specification for %s: %s'%(valname,str(spec)))
+            specs[valname] = spec
+        # gather columns once
+        if isinstance(self.__dicthash__,ColumnStore):
+            gather = compare_columns(self,IDs)
+        else:
+            items = [self.__dicthash__[ID] for ID in IDs]
+            gather = lambda colname: ([item.get(colname) for item in items],None)
+        columns = {}
+        for colname,*_ in specs.values():
+            if colname is not None and colname not in columns:
+                values,mask = group_values(*gather(colname))
+                columns[colname] = (values,codes[mask])
+        # calculate aggregates
+        results = {}
+        for valname,(colname,how,*args) in specs.items():
+            if colname is None and how=='count':
+                results[valname] = sizes
+            elif colname is None:
+                items = self.getitems(IDs)
+                offsets = np.cumsum([0]+sizes).tolist()
+                results[valname] = [how(items[i:j]) for i,j in zip(offsets[:-1],offsets[1:])]
+            else:
+                values,codes_ = columns[colname]
+                results[valname] = group_reduce(values,codes_,len(keys),how,*args)
+        stat_index = {key:{valname:results[valname][i] for valname in specs} \
+            for i,key in enumerate(keys)}
+        return self.__stat_collection__(keynames,stat_index,list(specs))
     
     def sort(self,colnames,IDs=-1,strict=True,mode='greedy',functions=None): # switched default to "greedy" instead of "strict"
         """
@@ -1204,6 +2433,9 @@ class Collection:
         if IDs==-1:
             IDs = self.ids()
         vals = self.getcols(colnames=colnames,IDs=IDs,strict=strict,mode=mode,functions=functions)
+        IDs_res = lexsort_ids(vals,IDs)
+        if IDs_res is not None:
+            return IDs_res
         vals = [list(e)+[id] for e,id in zip(zip(*vals),IDs)]
         IDs_res = [e[-1] for e in sorted(vals)]
         return IDs_res
@@ -1254,9 +2486,14 @@ class Collection:
                 if colnames_empty: order_set[colname_] = None
         
         if colnames_empty: 
-            self.order += list(order_set)
+            new_colnames = list(order_set)
         else:
-            self.order += [prefix+colname for colname in colnames]
+            new_colnames = [prefix+colname for colname in colnames]
+        self.order += new_colnames
+        self.__recatalogue__()
+        for colname in new_colnames: # rebuild indexes on the joined columns
+            if colname in self.__indexes__:
+                self.create_index(colname,self.__indexes__[colname].kind)
         
     def deduplicate(self,colnames=None):
         """
@@ -1298,6 +2535,214 @@ class Collection:
             
         return self.subset(ids_dedup)
         
+    # =======================================================
+    # ================= SECONDARY INDEXES ===================
+    # =======================================================
+    def create_index(self,colname,kind='hash'):
+        """
+        Create (or rebuild) the non-unique secondary index on the column.
+            kind='hash': hash index for the equality lookups and grouping;
+            kind='sorted': index keeping the column values sorted, 
+                which also supports the range lookups (see SortedIndex).
+        Indexes are maintained by the collection methods (update, delete,
+        assign, renamecol, deletecols etc.), and used automatically by
+        ids and subset (string filters with "==" and "in" conditions,
+        and also "<", "<=", ">", ">=" for the sorted indexes), split,
+        group and create_join_index.
+        Changing the items in place bypasses the index maintenance:
+        in this case the index must be re-created.
+        """
+        if kind not in INDEX_KINDS:
+            raise Exception('unknown index kind: %s'%kind)
+        if not self.__indexes__:
+            self.__positions__ = ItemPositions(self.__dicthash__)
+        index = INDEX_KINDS[kind](colname,self.__positions__)
+        index.build(self.__column_pairs__(colname))
+        self.__indexes__[colname] = index
+        return index
+        
+    def drop_index(self,colname):
+        """
+        Delete the secondary index on the column.
+        """
+        del self.__indexes__[colname]
+        
+    def get_index(self,colname,kind=None):
+        """
+        Get the secondary index on the column (None if it doesn't exist).
+        """
+        index = self.__indexes__.get(colname)
+        if index is None or (kind is not None and index.kind!=kind):
+            return None
+        return index
+        
+    def indexes(self):
+        """
+        Get the dictionary {colname:kind} of the existing indexes.
+        """
+        return {colname:index.kind for colname,index in self.__indexes__.items()}
+        
+    def __column_pairs__(self,colname):
+        """
+        Get the (ID,value) pairs of the items having the column.
+        """
+        return [(ID,item[colname]) for ID,item in self.__dicthash__.items() if colname in item]
+        
+    def __reindex__(self,IDs=None,colnames=None):
+        """
+        Bring the secondary indexes up to date after the items with given IDs
+        have been added, changed or deleted. If IDs is None, rebuild all indexes.
+        If colnames are given, only these columns of the items could be changed.
+        The schema catalogue is updated as well (see __recatalogue__).
+        """
+        if IDs is not None:
+            IDs = list(IDs)
+        self.__recatalogue__(IDs,colnames=colnames)
+        if not self.__indexes__: return
+        if IDs is None:
+            self.__positions__ = ItemPositions(self.__dicthash__)
+            for colname,index in list(self.__indexes__.items()):
+                self.create_index(colname,index.kind)
+            return
+        dicthash = self.__dicthash__
+        positions = self.__positions__
+        indexes = [index for index in self.__indexes__.values() \
+            if colnames is None or index.colname in colnames]
+        for index in indexes:
+            index.prepare(len(IDs))
+        for ID in IDs:
+            if ID in dicthash:
+                item = dicthash[ID]
+                positions.add(ID)
+                for index in indexes:
+                    colname = index.colname
+                    if colname in item:
+                        index.set(ID,item[colname])
+                    else:
+                        index.discard(ID)
+            else:
+                for index in indexes:
+                    index.discard(ID)
+                positions.discard(ID)
+                
+    def create_catalogue(self):
+        """
+        Enable the schema catalogue (see SchemaCatalogue), which makes keys 
+        and get_types O(columns) for the homogeneous collections. The catalogue 
+        is built on the first call of keys or get_types and maintained 
+        by the collection methods afterwards (update, delete, assign etc.),
+        and by getitem and getitems, which mark the items as possibly changed.
+        Changing the items in place through the references kept since before
+        the last call of keys or get_types bypasses the catalogue maintenance:
+        in this case the catalogue must be re-created.
+        """
+        self.__catalogued__ = True
+        self.__catalogue__ = None
+        
+    def drop_catalogue(self):
+        """
+        Disable the schema catalogue: keys and get_types scan the items.
+        """
+        self.__catalogued__ = False
+        self.__catalogue__ = None
+        
+    def __get_catalogue__(self):
+        """
+        Get the up-to-date schema catalogue, (re)building it if needed.
+        Returns None if the catalogue is disabled (see create_catalogue),
+        or if the item storage is not a plain dictionary.
+        """
+        dicthash = self.__dicthash__
+        if not self.__catalogued__ or type(dicthash) is not dict:
+            return None
+        catalogue = self.__catalogue__
+        if catalogue is None or not catalogue.valid(dicthash):
+            catalogue = self.__catalogue__ = SchemaCatalogue(dicthash,self.__epoch__)
+        return catalogue
+        
+    def __recatalogue__(self,IDs=None,func=None,colnames=None):
+        """
+        Advance the epoch of the items and bring the schema catalogue up to date 
+        after the items with given IDs have been added, changed or deleted
+        (only in colnames, if given), and/or apply func to the catalogue 
+        (e.g. after deleting the columns).
+        If none of them is given, or the catalogue is stale, it is dropped
+        and will be rebuilt on demand.
+        """
+        epoch = self.__epoch__
+        catalogue = self.__catalogue__
+        valid = catalogue is not None and catalogue.stamp==epoch[0]
+        epoch[0] += 1
+        if not valid or (IDs is None and func is None):
+            self.__catalogue__ = None
+            return
+        if IDs is not None:
+            catalogue.update(self.__dicthash__,IDs,colnames)
+        if func is not None:
+            func(catalogue)
+        catalogue.stamp = epoch[0]
+        
+    def __indexed_ids__(self,expression,proc=False,vectorized=False):
+        """
+        Resolve the string filter using the secondary indexes.
+        Equality, membership and (for the sorted indexes) range conditions 
+        on the indexed columns give the candidate items, then the whole filter
+        is checked on the candidates only. 
+        Returns None if none of the indexes is applicable.
+        """
+        try:
+            conditions = compile_filter(expression).conditions()
+        except (NotImplementedError,SyntaxError):
+            return None
+        lookups = {} # colname -> list of (op,value) for the sorted indexes
+        candidates = None
+        for colname,op,value in conditions:
+            index = self.__indexes__.get(colname)
+            if index is None or op in {'!=','not in'}: continue
+            if index.kind=='sorted':
+                if op=='in' and value and None not in value:
+                    lookups.setdefault(colname,[]).append(('in',value))
+                elif op!='in' and value is not None:
+                    lookups.setdefault(colname,[]).append((op,value))
+                continue
+            if op not in {'==','in'}: continue
+            IDs = index.lookup(value) if op=='==' else index.lookup_many(value)
+            if candidates is None or len(IDs)<len(candidates):
+                candidates = IDs
+        for colname,ops in lookups.items():
+            index = self.__indexes__[colname]
+            try:
+                IDs = index.select([(op,value) for op,value in ops if op!='in'])
+                for op,value in ops:
+                    if op!='in': continue
+                    IDs_ = set(index.lookup_many(value))
+                    IDs = [ID for ID in IDs if ID in IDs_]
+            except TypeError: # value is not comparable with the indexed values
+                continue
+            if candidates is None or len(IDs)<len(candidates):
+                candidates = IDs
+        if candidates is None:
+            return None
+        if vectorized:
+            return self.__vectorized_ids__(expression,candidates)
+        if proc:
+            expression = process_exp(expression)
+        expr = eval('lambda var: ' + expression)
+        dicthash = self.__dicthash__
+        return [ID for ID in candidates if expr(dicthash[ID])]
+        
+    def __indexed_group__(self,expr):
+        """
+        Get the group index from the hash index on the column, 
+        if it exists and covers all items. Otherwise returns None.
+        """
+        if type(expr) is not str or len(expr.split())!=1:
+            return None
+        index = self.get_index(expr,'hash')
+        if index is None or len(index)!=len(self):
+            return None
+        return index.group()
+        
     # =======================================================
     # =================== UNROLL/UNWIND =====================
     # =======================================================
@@ -1326,70 +2771,50 @@ class Collection:
                 return val
             else: # other cases; TODO: should add iterables separately in the future
                 return [val]
-        for item in self.getitems(IDs):
-            # get the keys from the list which are present in the current item
-            active_keys = []
-            for key in keys:
-                if key in item: active_keys.append(key)
-            if not active_keys: # no keys at all
-                col.update(item)
-            else: # some keys have been found
-                for vals in it.product(*[to_list(item[key]) for key in active_keys]):
-                    new_item = item.copy()
-                    #new_item.update({key:val for key,val in zip(active_keys,vals)}) # this doesn't work in earlier Python versions
-                    for key,val in zip(active_keys,vals):
-                        new_item[key] = val
-                    col.update(new_item)
+        def unrolled():
+            for item in self.getitems(IDs):
+                # get the keys from the list which are present in the current item
+                active_keys = []
+                for key in keys:
+                    if key in item: active_keys.append(key)
+                if not active_keys: # no keys at all
+                    yield item.copy()
+                else: # some keys have been found
+                    for vals in it.product(*[to_list(item[key]) for key in active_keys]):
+                        new_item = item.copy()
+                        #new_item.update({key:val for key,val in zip(active_keys,vals)}) # this doesn't work in earlier Python versions
+                        for key,val in zip(active_keys,vals):
+                            new_item[key] = val
+                        yield new_item
+        col.extend(unrolled())
         return col
 
     # =======================================================
     # ======================= CSV ===========================
     # =======================================================
     
-    def import_csv(self,filename,delimiter=';',quotechar='"',header=None,duck=True): # old_version
+    def import_csv(self,filename,delimiter=';',quotechar='"',header=None,duck=True,
+            append=False,chunksize=100000,sample=1000): # old_version
         """
         Reads csv-formatted files in more or less robust way.
         Includes avoiding many parsing errors due to "illegal"
         usage of delimiters and quotes.
+        The file is read and added to collection by chunks of "chunksize" lines,
+        so the whole list of items is never built at once.
+        Duck typing converters are chosen per column on the first "sample" lines.
+        If append is True, the items are added to the existing ones.
         """
         # TODO: use csv.Sniffer to deduce the format automatically
-        items = []
-        with open(filename,'r') as f:
-            reader = csv.reader(f,delimiter=delimiter,quotechar=quotechar)
-            if not header:                
-                colnames = next(reader) # take the first line as header (even if it's really absent)
-            else:
-                colnames = header            
-            nitems = 0
-            for vals in reader:
-                nitems += 1
-                item = {}
-                for colname,val in zip(colnames,vals):
-                    if val in [None,'']: continue
-                    if duck: # duck typing
-                        try:
-                            val = int(val)
-                        except ValueError as e:
-                            try:
-                                val = float(val)
-                            except ValueError as e:
-                                if val.strip().lower() in ['f','false','.false.']:
-                                    val = False
-                                elif val.strip().lower() in ['t','true','.true.']:
-                                    val = True
-                                else:
-                                    pass
-                    if type(val) in [str,unicode]: # f..king encoding problems 
-                        try:
-                            unicode(val)
-                        except UnicodeDecodeError:
-                            raise Exception('encoding/decoding problems with %s'%val)
-                    #if val: item[colname] = val
-                    item[colname] = val
-                items.append(item)
-        self.clear()
-        self.update(items)
-        self.order = colnames
+        if not append: self.clear()
+        nitems = 0
+        for colnames,items in csv_chunks(filename,chunksize=chunksize,delimiter=delimiter,
+                quotechar=quotechar,header=header,duck=duck,sample=sample):
+            self.extend(items)
+            nitems += len(items)
+        if not append:
+            self.order = colnames
+        else:
+            self.order += [colname for colname in colnames if colname not in self.order]
         return {'nitems':nitems}
         
     def import_csv_(self,filename): # new_version
@@ -1408,7 +2833,7 @@ class Collection:
                 item = {key:val for key,val in zip(header,vals)}
                 items.append(item)
             self.clear()
-            self.update(items)
+            self.extend(items)
             self.order = header
         
     def export_csv(self,filename,delimiter=';',quotechar='"',order=[],append=False):
@@ -1481,42 +2906,69 @@ class Collection:
             if item: items.append(item) 
 
         self.clear()
-        self.update(items)
+        self.extend(items)
         return {'nitems':nitems}
         
     # =======================================================
     # ===================== Folder ==========================
     # =======================================================
             
-    def import_folder(self,dirname,regex='\.json$'):
+    def import_folder(self,dirname,regex='\.json$',nthreads=None,backend='json',progress=False):
+        """
+        Import folder of JSON files, one item per file.
+        Files are read by the pool of nthreads threads (if given), which is much
+        faster on the network file systems. Backend can be 'json', 'orjson', 'ujson'
+        or 'auto' (see json_backend). Progress is either True (print to stdout)
+        or a function taking the numbers of processed and all files.
+        """
         FILENAME_ID = SETTINGS['FILENAME_ID']
-        filenames = scanfiles(dirname,regex)
-        items = []
-        for filename in filenames:
-            with open(os.path.join(dirname,filename)) as f:
+        filenames = [filename for filename in scanfiles(dirname,regex) if filename!=SETTINGS['MANIFEST']]
+        loads,_ = json_backend(backend)
+        def load(filename):
+            with open(os.path.join(dirname,filename),'rb') as f:
                 try:
-                    item = json.load(f)
+                    item = loads(f.read())
                 except:
                     print('ERROR: %s'%filename)
                     raise
-                #if FILENAME_ID in item:
-                #    raise Exception('%s has a key %s'%(filenames,FILENAME_ID))
-                item[FILENAME_ID] = filename
-                items.append(item)
+            #if FILENAME_ID in item:
+            #    raise Exception('%s has a key %s'%(filenames,FILENAME_ID))
+            item[FILENAME_ID] = filename
+            return item
+        items = folder_map(load,filenames,nthreads,progress)
         self.clear()
-        self.update(items)
+        self.extend(items)
     
-    def export_folder(self,dirname,ext='json',default=json_serial):
+    def export_folder(self,dirname,ext='json',default=json_serial,nthreads=None,backend='json',progress=False):
         """
         Updated version with integrity checking
         to prevent overwriting items in the folder
         in the case when there are similar file names.
+        Files are written by the pool of nthreads threads (if given).
+        For backend and progress see import_folder.
         """
         FILENAME_ID = SETTINGS['FILENAME_ID']
-        ITEM_ID = SETTINGS['ITEM_ID']
         if not os.path.isdir(dirname):
             #os.mkdir(dirname) # this doesn't work if there are sub-folders
             os.makedirs(dirname)
+        FILENAMES = self.__folder_filenames__(ext)
+        # if everything is OK save the collection
+        _,dumps = json_backend(backend)
+        def dump(ID):
+            item = self.__dicthash__[ID].copy()
+            if FILENAME_ID in item:
+                del item[FILENAME_ID]
+            filename = FILENAMES[ID]
+            with open(os.path.join(dirname,filename),'wb') as f:
+                f.write(dumps(item,default)) # custom "dumper"
+        folder_map(dump,list(self.__dicthash__),nthreads,progress)
+                     
+    def __folder_filenames__(self,ext):
+        """
+        Get the file names of the items in the folder (ID -> filename).
+        """
+        FILENAME_ID = SETTINGS['FILENAME_ID']
+        ITEM_ID = SETTINGS['ITEM_ID']
         # prepare file name index
         FILENAMES = {}
         for ID in self.__dicthash__:
@@ -1538,27 +2990,29 @@ class Collection:
         #if len(set(FILENAMES.keys()))!=len(FILENAMES.keys()):# BUG!!!!!!
         if len(set(FILENAMES.values()))!=len(FILENAMES.values()):
             raise Exception('%s index is not unique'%FILENAME_ID)
-        # if everything is OK save the collection
-        for ID in self.__dicthash__:
-            item = self.__dicthash__[ID].copy()
-            if FILENAME_ID in item:
-                del item[FILENAME_ID]
-            filename = FILENAMES[ID]
-            with open(os.path.join(dirname,filename),'w') as f:
-                #json.dump(item,f,indent=2) # default "dumper"
-                json.dump(item,f,indent=2,default=default) # custom "dumper"
-                     
-    def update_folder(self,dirname,regex=''):
+        return FILENAMES
+
+    def update_folder(self,dirname,regex='',check=None,nthreads=None,progress=False,ext='json'):
         """
         Update the Jeanny folder collection with self.
         !!! BOTH COLLECTIONS MUST HAVE THE SAME IDS !!!
         !!! ONE MUST USE THE FILENAME_ID FOR THESE PARAMETERS !!!
+        If check is None, the whole folder is imported, merged and exported.
+        If check is 'mtime' or 'hash', only new and changed items are written.
+        The hashes of the written items are saved to the manifest file,
+        so the unchanged files are not parsed in the next update.
+        In this case the list of the written file names is returned.
+        The manifest entry of the file is trusted if the modification time
+        and size ('mtime') or the MD5 sum ('hash') of the file have not changed.
+        The ext is the extension of the item files, as in export_folder.
         """
+        if check is not None:
+            return self.__update_folder__(dirname,regex,check,nthreads,progress,ext)
         FILENAME_ID = SETTINGS['FILENAME_ID']
         dest_col = Collection()
         if os.path.isdir(dirname):
             dest_col.import_folder(dirname,regex)
-            dest_col.index('var["%s"]'%FILENAME_ID)
+            dest_col.index(FILENAME_ID)
         for item in self.getitems():
             FILENAME = item[FILENAME_ID]
             if FILENAME in dest_col.__dicthash__.keys():
@@ -1566,7 +3020,48 @@ class Collection:
                 dest_item.update(item)
             else:
                 dest_col.update(item)
-        dest_col.export_folder(dirname)
+        dest_col.export_folder(dirname,ext=ext)
+
+    def __update_folder__(self,dirname,regex,check,nthreads,progress,ext):
+        """
+        Incremental version of update_folder.
+        """
+        if check not in {'mtime','hash'}:
+            raise Exception('unknown check: %s'%check)
+        FILENAME_ID = SETTINGS['FILENAME_ID']
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        manifest = read_manifest(dirname)
+        FILENAMES = self.__folder_filenames__(ext)
+        _,dumps = json_backend('json')
+        def update(ID):
+            item = self.__dicthash__[ID]
+            filename = FILENAMES[ID]
+            path = os.path.join(dirname,filename)
+            values = {key:item[key] for key in item if key!=FILENAME_ID}
+            exists = os.path.isfile(path) and filterstr([filename],regex)
+            entry = manifest.get(filename)
+            if exists and entry is not None and manifest_valid(entry,path,check):
+                hashes = entry['keys']
+                if all(hashes.get(key)==json_hash(values[key]) for key in values):
+                    return filename,entry,False
+            if exists:
+                with open(path,'rb') as f:
+                    dest_item = json.loads(f.read())
+                dest_item.pop(FILENAME_ID,None)
+                if all(key in dest_item and json_hash(dest_item[key])==json_hash(values[key]) for key in values):
+                    return filename,manifest_entry(path,dest_item),False
+                dest_item.update(values)
+            else:
+                dest_item = values
+            with open(path,'wb') as f:
+                f.write(dumps(dest_item,json_serial))
+            return filename,manifest_entry(path,dest_item),True
+        results = folder_map(update,list(self.__dicthash__),nthreads,progress)
+        for filename,entry,_ in results:
+            manifest[filename] = entry
+        write_manifest(dirname,manifest)
+        return [filename for filename,_,written in results if written]
 
     # =======================================================
     # ===================== JSON List =======================
@@ -1575,11 +3070,8 @@ class Collection:
     def import_json_list(self,filename,id=None):
         with open(filename,'r') as f:
             buffer = json.load(f)
-        items = []
-        for item in buffer:
-            items.append(item)
         self.clear()
-        self.update(items)
+        self.extend(buffer)
         
     def export_json_list(self,filename,default=json_serial):
         buffer = self.getitems(self.ids())
@@ -1600,7 +3092,7 @@ class Collection:
     # ============= Fixcol/Parse from string ================
     # =======================================================
             
-    def import_fixcol(self,filename,ignore=True,substitute=None):
+    def import_fixcol(self,filename,ignore=True,substitute=None,nprocs=None):
         """
         Create collection from the specially formatted column-fixed file.
         THe file must be supplied in the following format (type can be omitted):
@@ -1618,70 +3110,28 @@ class Collection:
         Comments are marked with hashtag (#) and ignored.
         
         If ignore set to False, exception is thrown at any conversion problems.
-        """               
-        TYPES = {'float':float,'int':int,'str':str}
         
-        f = open(filename)
-    
-        # Search for //HEADER section.    
-        for line in f:
-            if '//HEADER' in line: break
-    
-        # Scan //HEADER section.     
-        HEAD = {}        
-        for line in f:
-            line = line.strip()
-            if not line: continue
-            if line[0]=='#': continue
-            if '//DATA' in line: break
-            vals = [_ for _ in line.split() if _]
-            token = vals[0]
-            if token in HEAD:
-                raise Exception('ERROR: duplicate key was found: %s'%vals[0])
-            vtype = TYPES[vals[2]] if len(vals)>2 else str           
-            HEAD[token] = {}
-            HEAD[token]['token'] = token
-            HEAD[token]['name'] = vals[1]
-            HEAD[token]['type'] = vtype # vtype
-                        
-        # Get tokenized mark-up.
-        for line in f:
-            widths = line.rstrip(); break # readline doesn't work because of the "Mixing iteration and read methods"
-        matches = re.finditer('([^_]+_*)',widths)
-        tokens = []; names = []
-        for match in matches:
-            i_start = match.start()
-            i_end = match.end()
-            token = re.sub('_','',widths[i_start:i_end])
-            if token not in HEAD: continue                
-            tokens.append(token)
-            names.append(HEAD[token]['name'])
-            HEAD[token]['i_start'] = i_start
-            HEAD[token]['i_end'] = i_end
-        #markup = re.findall('([^_]+_*)',widths) # doesn't give indexes
-        
-        # Scan //DATA section.     
-        items = []
-        for line in f:
-            if line.strip()=='': continue
-            if line.lstrip()[0]=='#': continue
-            line = line.rstrip()
-            #item = {HEAD[token]['name']:HEAD[token]['type'](line[HEAD[token]['i_start']:HEAD[token]['i_end']]) for token in HEAD} # doesn't work in earlier versions of Python
-            item = {}
-            for token in HEAD:
-                try:
-                    buf = line[HEAD[token]['i_start']:HEAD[token]['i_end']]
-                    val = HEAD[token]['type'](buf)
-                except ValueError as e:
-                    if not ignore:
-                        raise Exception(e)
-                    else:
-                        val = substitute
-                item[HEAD[token]['name']] = val
-            items.append(item) 
+        Data lines are decoded column-wise (see fixcol_columns).
+        If nprocs>1, the data section is split into byte ranges 
+        which are decoded in parallel by nprocs processes.
+        """               
+        HEAD,names,offset = fixcol_header(filename)
+        fields = [(HEAD[token]['name'],HEAD[token]['i_start'],HEAD[token]['i_end'],
+            HEAD[token]['type']) for token in HEAD]
+        if nprocs and nprocs>1:
+            ranges = fixcol_ranges(filename,offset,nprocs)
+            with Pool(nprocs) as pool:
+                parts = pool.starmap(fixcol_columns,[(filename,start,end,fields,ignore,substitute,True)
+                    for start,end in ranges])
+            tolist = lambda col: col if type(col) is list else col.tolist()
+            columns = [list(it.chain(*map(tolist,cols))) for cols in zip(*parts)] if parts else [[] for _ in fields]
+        else:
+            columns = fixcol_columns(filename,offset,None,fields,ignore,substitute)
+        colnames = [field[0] for field in fields]
+        items = [dict(zip(colnames,row)) for row in zip(*columns)]
         self.clear()
         self.setorder(names)
-        self.update(items)    
+        self.extend(items)
     
     def export_fixcol(self,filename):
         """ 
@@ -1706,7 +3156,7 @@ class Collection:
         types = {}
         ids = self.ids()
         for id_ in ids:
-            item = self.getitem(id_)
+            item = self.__dicthash__[id_]
             if not set(order)-checked: break
             for colname in order:
                 if colname in item and item[colname] is not None:
@@ -1725,28 +3175,19 @@ class Collection:
             f.write('\n//DATA\n')
             # get columns and find widths
             COLS = self.getcols(order)
-            COLS_STR = [[to_str(e) for e in col] for col in COLS]
-            get_width = lambda col: max([len(s) for s in col])
-            widths = [get_width(col) for col in COLS_STR]
+            COLS_STR = [list(map(to_str,col)) for col in COLS]
+            widths = [max(map(len,col),default=0) for col in COLS_STR]
             # write tokenized header
             dw = 3 # gap between columns
             for token,width in zip(tokens,widths):
                 f.write(token+'_'*(width-1+dw))
             f.write('\n')
-            # write the content, do conversion checks
-            ncols = len(COLS_STR)
-            for i in range(len(ids)):
-                for j in range(ncols):
-                    type_ = types[order[j]]
-                    strval = COLS_STR[j][i]
-                    trueval = COLS[j][i]
-                    if trueval is not None: 
-                        # this should signalize if there are conversion problems
-                        if trueval!=type_(strval):
-                            raise Exception('conversion error: ',trueval,type_(strval)) 
-                    width = widths[j]
-                    f.write('%%%ds'%(width+dw)%strval)
-                f.write('\n')
+            # do conversion checks column-wise
+            for colname,col,col_str in zip(order,COLS,COLS_STR):
+                fixcol_check(col,col_str,types[colname])
+            # write the content, line format is made once
+            fmt = ''.join(['%%%ds'%(width+dw) for width in widths])+'\n'
+            f.writelines(fmt%row for row in zip(*COLS_STR))
     
     # =======================================================
     # ============= XSCDB/HAPI2.0 STUFF =====================
@@ -1780,6 +3221,7 @@ class Collection:
                 v[colname] = tuple(vals)
             else:
                 v[colname] = tuple(vals)[0]
+        self.__reindex__(IDs,[colname])
                 
     # =======================================================
     # ============= Checksums and integrity =================
@@ -1814,6 +3256,11 @@ class Collection:
     def get_types(self,nitems=None): # NEW VERSION INCLUDING MIXED TYPE
         types = {}
         dicthash = self.__dicthash__
+        if nitems is None or nitems>=len(dicthash):
+            catalogue = self.__get_catalogue__()
+            if catalogue is not None:
+                types = catalogue.types()
+                return {key:list(tt)[0] if len(tt)==1 else self.MIXED for key,tt in types.items()}
         if nitems is None:
             nitems = len(dicthash)
         for i,c in zip(range(nitems),dicthash):
@@ -1831,7 +3278,7 @@ class Collection:
             if len(types[key])==1:
                 types[key] = list(types[key])[0]
             else:
-                types[key] = MIXED
+                types[key] = self.MIXED
         return types
 
     # =======================================================
@@ -2581,14 +4028,1874 @@ class Collection:
         return col    
         
     # =======================================================
-    # ============= Other unfinished stuff... ===============
+    # ================= Binary format =======================
     # =======================================================
         
-    def import_binary(self,filename):
-        pass
+    def import_binary(self,filename,mmap=True):
+        """
+        Import collection from the binary file (see export_binary).
+        For the ColumnarCollection, columns are decoded lazily on the first access,
+        and uncompressed numeric columns are memory-mapped (copy-on-write, 
+        so the file is never changed), which makes opening of huge files nearly instant.
+        The file must not be removed or rewritten while the collection is in use.
+        Other collections are fully loaded.
+        !!! Object columns are pickled, so don't open the files from untrusted sources !!!
+        """
+        store,header,types = binary_store(filename,mmap)
+        self.clear()
+        if isinstance(self.__dicthash__,ColumnStore):
+            self.__dicthash__ = store
+        else:
+            self.__dicthash__ = store.to_dicts()
+        self.order = header['order']
+        self.types = types
+        self.maxid = header['maxid']
+        self.__reindex__()
         
-    def export_binary(self,filename):
-        pass
+    def export_binary(self,filename,compression=None):
+        """
+        Export collection to the compact binary file.
+        The file consists of the JSON header (schema, order, IDs and block offsets)
+        followed by the column-wise encoded data: numeric columns and validity masks 
+        are stored as raw arrays, other columns are pickled.
+        Compression can be None, 'zlib', 'bz2' or 'lzma' (compressed columns
+        cannot be memory-mapped, and are decompressed on access).
+        """
+        store = self.__dicthash__
+        if not isinstance(store,ColumnStore):
+            store = ColumnStore()
+            store.load(list(self.__dicthash__),self.getitems())
+        binary_write(filename,store,self.order,self.types,self.maxid,compression)
+
+# =======================================================
+# ============= Columnar storage engine =================
+# =======================================================
+
+def column_dtype(val):
+    """
+    Get numpy dtype for storing the scalar value in a typed column.
+    Values without the native numpy representation (strings, None,
+    containers etc...) are stored as Python objects.
+    """
+    import numpy as np
+    tp = type(val)
+    if tp is bool:
+        return np.dtype(bool)
+    elif tp is int:
+        if -2**63<=val<2**63:
+            return np.dtype(np.int64)
+        return np.dtype(object)
+    elif tp is float:
+        return np.dtype(np.float64)
+    else:
+        return np.dtype(object)
+        
+def object_array(values):
+    """
+    Create 1D object array from the list of values.
+    Nested sequences are stored as objects, and are not broadcasted.
+    """
+    import numpy as np
+    return np.fromiter(values,dtype=object,count=len(values))
+    
+ARRAY_MISSING = {'masked','nan'} # representations of the missing values (see typed_array)
+
+def array_missing(as_array):
+    """
+    Get the representation of missing values from the as_array argument of getcols.
+    """
+    missing = 'masked' if as_array is True else as_array
+    if missing not in ARRAY_MISSING:
+        raise Exception('unknown representation of missing values: %s'%missing)
+    return missing
+
+def typed_array(values,tp=None,valid=None,missing='masked'):
+    """
+    Convert the list of column values to the typed numpy array (see Collection.getcols).
+    Column type tp (int, float or bool, see Collection.get_types) gives the dtype,
+    if it agrees with the values; otherwise the dtype is deduced from the values 
+    (mix of int and float gives float, numeric numpy scalars give their common dtype, 
+    see np.result_type), other values are kept as objects.
+    Values are missing where valid is False, None values are missing too.
+    Missing values are masked (missing="masked", np.ma.MaskedArray is returned), 
+    or replaced by NaN (missing="nan", integer columns are converted to float,
+    boolean columns to objects with None).
+    """
+    import numpy as np
+    types = set(map(type,values))
+    if valid is not None:
+        valid = np.array(valid,dtype=bool)
+    if type(None) in types:
+        if valid is None: 
+            valid = np.ones(len(values),dtype=bool)
+        valid[[i for i,val in enumerate(values) if val is None]] = False
+    complete = valid is None or bool(valid.all())
+    present = values
+    if not complete:
+        present = [val for val,flag in zip(values,valid) if flag]
+        types = set(map(type,present))
+    if tp in {int,float,bool} and (types<={tp} or (tp is float and types<={int,float})):
+        dtype = tp
+    elif len(types)==1 and types<={int,float,bool}:
+        dtype = types.pop()
+    elif types=={int,float}:
+        dtype = float
+    elif any(issubclass(ty,np.generic) for ty in types) and \
+            all(issubclass(ty,(np.integer,np.floating,np.bool_)) or ty in {int,float,bool} for ty in types):
+        dtype = np.result_type(*types) # numpy scalars, e.g. results of numpy computations
+    else:
+        dtype = object
+    data = None
+    if dtype is not object:
+        filled = values if complete else [val if flag else 0 for val,flag in zip(values,valid)]
+        dtype = {int:np.int64,float:np.float64,bool:np.bool_}.get(dtype,dtype)
+        try:
+            data = np.array(filled,dtype=dtype)
+        except OverflowError: # long integers are kept as objects
+            pass
+    if data is None:
+        data = object_array(values)
+    return masked_array(data,valid,missing)
+    
+def lexsort_ids(cols,IDs):
+    """
+    Sort IDs by the values of columns, then by IDs themselves (see Collection.sort).
+    Works for the complete numeric columns and integer IDs, otherwise returns None.
+    """
+    import numpy as np
+    IDs = list(IDs)
+    if not cols or any(len(col)!=len(IDs) for col in cols):
+        return None
+    keys = [typed_array(IDs)]+[typed_array(col) for col in reversed(cols)] # the last key is primary
+    for arr in keys:
+        if np.ma.isMaskedArray(arr) or arr.dtype.kind not in 'biuf':
+            return None
+        if arr.dtype.kind=='f' and np.isnan(arr).any(): # NaN is not ordered
+            return None
+    if keys[0].dtype.kind not in 'iu':
+        return None
+    return [IDs[i] for i in np.lexsort(keys).tolist()]
+
+def masked_array(data,valid,missing='masked'):
+    """
+    Represent the missing values of the typed array (where valid is False)
+    according to "missing" (see typed_array).
+    """
+    import numpy as np
+    if valid is None or valid.all():
+        return data
+    invalid = ~valid
+    if missing=='nan':
+        if data.dtype.kind in 'iu':
+            data = data.astype(np.float64)
+        elif data.dtype.kind=='b':
+            data = data.astype(object)
+        data[invalid] = np.nan if data.dtype.kind=='f' else None
+        return data
+    data[invalid] = {'f':np.nan,'O':None}.get(data.dtype.kind,0)
+    return np.ma.MaskedArray(data,mask=invalid)
+    
+class ColumnArray:
+    """
+    Growable typed array holding a single column of the ColumnarCollection.
+    Presence of the values is tracked by the boolean validity mask,
+    so missing keys don't need any sentinel values.
+    A typed column is promoted to the object dtype as soon as 
+    a value of different type is stored, so the Python types 
+    of the values are always preserved.
+    """
+    
+    def __init__(self,data,mask):
+        self.data = data # values (capacity can exceed the number of rows)
+        self.mask = mask # validity mask, True if the value is present
+        
+    @classmethod
+    def empty(cls,size,dtype):
+        import numpy as np
+        if dtype==object:
+            data = np.empty(size,dtype=object)
+        else:
+            data = np.zeros(size,dtype=dtype)
+        return cls(data,np.zeros(size,dtype=bool))
+        
+    @classmethod
+    def from_list(cls,values,mask=None):
+        """
+        Create column from the list of values.
+        If mask is given, values at the masked positions are ignored.
+        """
+        import numpy as np
+        if mask is None:
+            present = values
+            mask = np.ones(len(values),dtype=bool)
+        else:
+            present = [val for val,flag in zip(values,mask) if flag]
+            mask = np.array(mask,dtype=bool)
+        types = set(map(type,present))
+        data = None
+        if len(types)==1 and types <= {int,float,bool}:
+            dtype = column_dtype(present[0]).type
+            if len(present)!=len(values):
+                values = [val if flag else 0 for val,flag in zip(values,mask)]
+            try:
+                data = np.array(values,dtype=dtype)
+            except OverflowError: # long integers are kept as objects
+                pass
+        if data is None:
+            data = object_array(values)
+        return cls(data,mask)
+        
+    @property
+    def dtype(self):
+        return self.data.dtype
+        
+    def reserve(self,size):
+        """
+        Make room for at least "size" rows, growing geometrically.
+        """
+        capacity = len(self.data)
+        if size<=capacity: return
+        capacity = max(size,2*capacity,16)
+        column = ColumnArray.empty(capacity,self.data.dtype)
+        column.data[:len(self.data)] = self.data
+        column.mask[:len(self.mask)] = self.mask
+        self.data = column.data
+        self.mask = column.mask
+        
+    def retype(self,dtype):
+        """
+        Change dtype of the column. If the column doesn't have any values yet,
+        it is simply reallocated, otherwise it is promoted to objects.
+        """
+        if self.mask.any():
+            self.data = self.data.astype(object)
+        else:
+            self.data = ColumnArray.empty(len(self.data),dtype).data
+        
+    def get(self,row):
+        return self.data.item(row) # item() gives native Python scalars
+        
+    def set(self,row,val):
+        dtype = column_dtype(val)
+        if dtype!=self.data.dtype and self.data.dtype!=object:
+            self.retype(dtype)
+        self.data[row] = val
+        self.mask[row] = True
+        
+    def unset(self,row):
+        if self.data.dtype==object:
+            self.data[row] = None # release reference
+        self.mask[row] = False
+        
+    def put(self,rows,block):
+        """
+        Put values of another column to the given rows (slice or index array).
+        """
+        if block.data.dtype!=self.data.dtype:
+            others = self.mask.copy(); others[rows] = False
+            if others.any():
+                self.data = self.data.astype(object)
+            else:
+                self.data = ColumnArray.empty(len(self.data),block.data.dtype).data
+            if self.data.dtype==object:
+                block = ColumnArray(block.data.astype(object),block.mask)
+        self.data[rows] = block.data
+        self.mask[rows] = block.mask
+        
+    def take(self,rows):
+        return ColumnArray(self.data[rows],self.mask[rows])
+
+class ColumnStore(MutableMapping):
+    """
+    Columnar replacement for the dict-of-dicts __dicthash__.
+    Each column is held in a separate ColumnArray; items are represented
+    by the lightweight ColumnarRow proxies which are created on access.
+    IDs forming a contiguous integer range (which is the most common case)
+    are not stored at all; otherwise the ID list and position index are kept.
+    """
+    
+    def __init__(self):
+        self.__columns__ = {} # colname -> ColumnArray
+        self.__nrows__ = 0
+        self.__start__ = 0 # first ID of the contiguous ID range
+        self.__idlist__ = None # row -> ID (only for non-contiguous IDs)
+        self.__pos__ = None # ID -> row (only for non-contiguous IDs)
+        
+    # ----------- IDs and row positions -----------
+        
+    def __row__(self,ID):
+        if self.__pos__ is not None:
+            return self.__pos__[ID]
+        try:
+            row = operator.index(ID)-self.__start__
+        except TypeError:
+            raise KeyError(ID)
+        if not 0<=row<self.__nrows__:
+            raise KeyError(ID)
+        return row
+        
+    def __rows__(self,IDs):
+        """
+        Get the array of row positions for the sequence of IDs.
+        """
+        import numpy as np
+        if self.__pos__ is not None:
+            pos = self.__pos__
+            return np.array([pos[ID] for ID in IDs],dtype=np.intp)
+        rows = np.asarray(IDs)
+        if rows.size==0:
+            return np.zeros(0,dtype=np.intp)
+        if rows.dtype.kind not in 'iu':
+            return np.array([self.__row__(ID) for ID in IDs],dtype=np.intp)
+        rows = rows.astype(np.intp)-self.__start__
+        bad = (rows<0)|(rows>=self.__nrows__)
+        if bad.any():
+            raise KeyError(IDs[int(np.flatnonzero(bad)[0])])
+        return rows
+        
+    def __dictmode__(self):
+        """
+        Switch from the contiguous ID range to the explicit ID index.
+        """
+        if self.__pos__ is None:
+            self.__idlist__ = list(range(self.__start__,self.__start__+self.__nrows__))
+            self.__pos__ = {ID:row for row,ID in enumerate(self.__idlist__)}
+            
+    def __register__(self,ID):
+        """
+        Register a new ID and return its row position.
+        Column arrays are not touched here.
+        """
+        n = self.__nrows__
+        if self.__pos__ is None:
+            if n==0 and type(ID) is int:
+                self.__start__ = ID
+            elif not (type(ID) is int and ID==self.__start__+n):
+                self.__dictmode__()
+        if self.__pos__ is not None:
+            if ID in self.__pos__:
+                raise Exception('duplicate ID: %s'%str(ID))
+            self.__idlist__.append(ID)
+            self.__pos__[ID] = n
+        self.__nrows__ = n+1
+        return n
+        
+    def __setids__(self,IDs):
+        """
+        Reset IDs of all rows (IDs must be unique).
+        """
+        import numpy as np
+        IDs = list(IDs)
+        self.__nrows__ = len(IDs)
+        ids = np.asarray(IDs)
+        if len(IDs)==0 or (ids.dtype.kind=='i' and type(IDs[0]) is int and \
+                (len(IDs)==1 or (np.diff(ids)==1).all())):
+            self.__start__ = IDs[0] if IDs else 0
+            self.__idlist__ = None
+            self.__pos__ = None
+        else:
+            self.__idlist__ = IDs
+            self.__pos__ = {ID:row for row,ID in enumerate(IDs)}
+            if len(self.__pos__)!=len(IDs):
+                raise Exception('IDs are not unique')
+            
+    @classmethod
+    def from_arrays(cls,arrays,IDs):
+        """
+        Create store from the dictionary of numpy arrays of equal length
+        (all values are present), assigning the given IDs to the rows.
+        """
+        import numpy as np
+        store = cls()
+        for key,data in arrays.items():
+            store.__columns__[key] = ColumnArray(data,np.ones(len(data),dtype=bool))
+        store.__setids__(IDs)
+        return store
+            
+    def ids(self):
+        if self.__pos__ is None:
+            return list(range(self.__start__,self.__start__+self.__nrows__))
+        return list(self.__idlist__)
+        
+    # ----------- Mapping interface -----------
+        
+    def __getitem__(self,ID):
+        self.__row__(ID)
+        return ColumnarRow(self,ID)
+        
+    def __setitem__(self,ID,item):
+        if ID in self:
+            row = self.__row__(ID)
+            for column in self.__columns__.values():
+                column.unset(row)
+        else:
+            row = self.__append__(ID)
+        for key in item:
+            self.__set__(row,key,item[key])
+            
+    def __delitem__(self,ID):
+        self.delete([ID])
+        
+    def __contains__(self,ID):
+        try:
+            self.__row__(ID)
+        except KeyError:
+            return False
+        return True
+        
+    def __iter__(self):
+        return iter(self.ids())
+        
+    def __len__(self):
+        return self.__nrows__
+        
+    def __repr__(self):
+        return 'ColumnStore(%d rows, %d columns)'%(self.__nrows__,len(self.__columns__))
+        
+    def clear(self):
+        self.__init__()
+        
+    def export_to_json(self):
+        return self.to_dicts()
+        
+    # ----------- Row-wise access -----------
+            
+    def __append__(self,ID):
+        row = self.__register__(ID)
+        for column in self.__columns__.values():
+            column.reserve(self.__nrows__)
+        return row
+        
+    def __set__(self,row,key,val):
+        column = self.__columns__.get(key)
+        if column is None:
+            column = ColumnArray.empty(self.__nrows__,column_dtype(val))
+            self.__columns__[key] = column
+        column.set(row,val)
+        
+    def load(self,IDs,items):
+        """
+        Bulk-insert items under the given IDs, column by column.
+        Items with already existing IDs are merged into the stored rows,
+        in the same way as Collection.update does.
+        """
+        new_ids = []; new_items = []; rest = []
+        seen = set()
+        for ID,item in zip(IDs,items):
+            if ID in seen or ID in self:
+                rest.append((ID,item))
+            else:
+                seen.add(ID)
+                new_ids.append(ID)
+                new_items.append(item)
+        n0 = self.__nrows__
+        for ID in new_ids:
+            self.__register__(ID)
+        n = self.__nrows__
+        keys = {}
+        for item in new_items:
+            for key in item:
+                keys[key] = None
+        for key in keys:
+            present = [key in item for item in new_items]
+            values = [item[key] if flag else None for item,flag in zip(new_items,present)]
+            block = ColumnArray.from_list(values,present)
+            column = self.__columns__.get(key)
+            if column is None:
+                column = ColumnArray.empty(n0,block.dtype)
+                self.__columns__[key] = column
+            column.reserve(n)
+            column.put(slice(n0,n),block)
+        for column in self.__columns__.values():
+            column.reserve(n)
+        for ID,item in rest:
+            row = self.__row__(ID)
+            for key in item:
+                self.__set__(row,key,item[key])
+                
+    def delete(self,IDs):
+        import numpy as np
+        rows = self.__rows__(list(IDs))
+        if len(rows)==0: return
+        n = self.__nrows__
+        keep = np.ones(n,dtype=bool)
+        keep[rows] = False
+        kept = np.flatnonzero(keep)
+        if self.__pos__ is None:
+            ids = (kept+self.__start__).tolist()
+        else:
+            idlist = self.__idlist__
+            ids = [idlist[row] for row in kept.tolist()]
+        for key in list(self.__columns__):
+            column = self.__columns__[key]
+            column = ColumnArray(column.data[:n][keep],column.mask[:n][keep])
+            if column.mask.any():
+                self.__columns__[key] = column
+            else:
+                del self.__columns__[key]
+        self.__setids__(ids)
+        
+    def take(self,rows,IDs):
+        """
+        Create new store from the given rows, having the given IDs.
+        """
+        store = ColumnStore()
+        for key,column in self.__columns__.items():
+            column = column.take(rows)
+            if column.mask.any():
+                store.__columns__[key] = column
+        store.__setids__(IDs)
+        return store
+        
+    def clone(self,keys=None):
+        """
+        Copy the store (see Collection.copy); if keys are given, only
+        these columns are copied. Values of the object columns are copied by clone_value.
+        """
+        import numpy as np
+        n = self.__nrows__
+        store = ColumnStore()
+        for key,column in self.__columns__.items():
+            if keys is not None and key not in keys: continue
+            data = column.data[:n].copy()
+            mask = column.mask[:n].copy()
+            if data.dtype==object and not CLONE_IMMUTABLE.issuperset(map(type,data)):
+                for row in np.flatnonzero(mask).tolist():
+                    val = data[row]
+                    if type(val) not in CLONE_IMMUTABLE:
+                        data[row] = clone_value(val)
+            store.__columns__[key] = ColumnArray(data,mask)
+        store.__nrows__ = n
+        store.__start__ = self.__start__
+        if self.__pos__ is not None:
+            store.__idlist__ = list(self.__idlist__)
+            store.__pos__ = dict(self.__pos__)
+        return store
+        
+    def to_dicts(self):
+        """
+        Convert to the dict-of-dicts form.
+        """
+        n = self.__nrows__
+        rows = [{} for _ in range(n)]
+        for key,column in self.__columns__.items():
+            values = column.data[:n].tolist()
+            mask = column.mask[:n].tolist()
+            for row,val,flag in zip(rows,values,mask):
+                if flag: row[key] = val
+        return {ID:row for ID,row in zip(self.ids(),rows)}
+        
+    # ----------- Column-wise access -----------
+        
+    def columns(self):
+        return list(self.__columns__)
+        
+    def column(self,key):
+        return self.__columns__[key]
+        
+    def counts(self):
+        n = self.__nrows__
+        counts = {}
+        for key,column in self.__columns__.items():
+            count = int(column.mask[:n].sum())
+            if count: counts[key] = count
+        return counts
+        
+    def gather(self,key,rows,mode):
+        """
+        Get list of column values for the given rows (slice or index array).
+        Mode defines what to do with missing values: 
+        "strict" raises KeyError, "silent" skips them, "greedy" gives None.
+        """
+        import numpy as np
+        column = self.__columns__.get(key)
+        if column is None:
+            nrows = len(range(self.__nrows__)[rows]) if type(rows) is slice else len(rows)
+            if mode=='strict' and nrows:
+                raise KeyError(key)
+            return [None]*nrows if mode=='greedy' else []
+        data = column.data[rows]
+        mask = column.mask[rows]
+        if mask.all():
+            return data.tolist()
+        if mode=='strict':
+            raise KeyError(key)
+        elif mode=='silent':
+            return data[mask].tolist()
+        elif mode=='greedy':
+            values = data.tolist()
+            for i in np.flatnonzero(~mask).tolist():
+                values[i] = None
+            return values
+        else:
+            raise Exception('unknown mode: %s'%mode)
+            
+    def gather_array(self,key,rows,mode,tp=None,missing='masked'):
+        """
+        Get the typed array of column values for the given rows (see gather and typed_array).
+        Typed columns are taken from the column arrays directly; 
+        object columns are converted by typed_array.
+        """
+        column = self.__columns__.get(key)
+        if column is None or column.dtype==object:
+            return typed_array(self.gather(key,rows,mode),tp,missing=missing)
+        data = column.data[rows]
+        valid = column.mask[rows]
+        if tp is float and data.dtype.kind in 'iu': # declared type of the column
+            data = data.astype(float)
+        elif type(rows) is slice: # don't share memory with the store
+            data = data.copy()
+        if valid.all():
+            return data
+        if mode=='strict':
+            raise KeyError(key)
+        elif mode=='silent':
+            return data[valid]
+        elif mode=='greedy':
+            return masked_array(data,valid,missing)
+        else:
+            raise Exception('unknown mode: %s'%mode)
+            
+    def set_column(self,key,rows,values):
+        """
+        Set values of the column for given rows (index array).
+        """
+        block = ColumnArray.from_list(values)
+        column = self.__columns__.get(key)
+        if column is None:
+            column = ColumnArray.empty(self.__nrows__,block.dtype)
+            self.__columns__[key] = column
+        column.put(rows,block)
+        
+    def drop_column(self,key):
+        self.__columns__.pop(key,None)
+        
+    def rename_column(self,oldkey,newkey):
+        if oldkey not in self.__columns__ or oldkey==newkey: return
+        column = self.__columns__.pop(oldkey)
+        if newkey not in self.__columns__:
+            self.__columns__[newkey] = column
+            return
+        n = self.__nrows__
+        for row,flag in enumerate(column.mask[:n].tolist()):
+            if flag: self.__set__(row,newkey,column.get(row))
+
+class ColumnarRow(MutableMapping):
+    """
+    Item proxy of the ColumnarCollection.
+    Behaves like a dictionary; all changes are written through to the columns.
+    """
+    
+    __slots__ = ('__store__','__id__')
+    
+    def __init__(self,store,ID):
+        self.__store__ = store
+        self.__id__ = ID
+        
+    def __getitem__(self,key):
+        store = self.__store__
+        row = store.__row__(self.__id__)
+        column = store.__columns__[key]
+        if not column.mask[row]:
+            raise KeyError(key)
+        return column.get(row)
+        
+    def __setitem__(self,key,val):
+        store = self.__store__
+        store.__set__(store.__row__(self.__id__),key,val)
+        
+    def __delitem__(self,key):
+        store = self.__store__
+        row = store.__row__(self.__id__)
+        column = store.__columns__[key]
+        if not column.mask[row]:
+            raise KeyError(key)
+        column.unset(row)
+        
+    def __contains__(self,key):
+        store = self.__store__
+        column = store.__columns__.get(key)
+        return column is not None and bool(column.mask[store.__row__(self.__id__)])
+        
+    def __iter__(self):
+        store = self.__store__
+        row = store.__row__(self.__id__)
+        return iter([key for key,column in store.__columns__.items() if column.mask[row]])
+        
+    def __len__(self):
+        store = self.__store__
+        row = store.__row__(self.__id__)
+        return sum([1 for column in store.__columns__.values() if column.mask[row]])
+        
+    def copy(self):
+        store = self.__store__
+        row = store.__row__(self.__id__)
+        return {key:column.get(row) for key,column in store.__columns__.items() \
+            if column.mask[row]}
+            
+    def export_to_json(self):
+        return self.copy()
+        
+    def __repr__(self):
+        return repr(self.copy())
+        
+class ColumnarCollection(Collection):
+    """
+    Collection with the columnar storage backend.
+    Items are stored column-wise in the typed numpy arrays with validity masks,
+    instead of one dictionary per item. This takes much less memory for large 
+    homogeneous tables (e.g. line lists), and makes the column extraction
+    nearly as cheap as copying the arrays.
+    The Collection API is preserved: items are returned as ColumnarRow proxies
+    which behave like dictionaries and write all changes through to the columns.
+    Use Collection.to_columnar() and ColumnarCollection.to_collection() 
+    to convert between the storage backends.
+    """
+    
+    def __create_dicthash__(self):
+        return ColumnStore()
+        
+    def __repr__(self):
+        return 'ColumnarCollection (%d lines)'%len(self)
+        
+    def to_columnar(self):
+        return self.copy()
+        
+    def __clone_dicthash__(self,colnames=None):
+        return self.__dicthash__.clone(colnames)
+        
+    def to_collection(self):
+        """
+        Convert collection to the default dict-of-dicts storage.
+        """
+        col = Collection()
+        col.__dicthash__ = self.__dicthash__.to_dicts()
+        col.order = list(self.order)
+        col.types = self.types
+        col.maxid = self.maxid
+        return col
+        
+    def __rows__(self,IDs):
+        """
+        Get row positions for the IDs; all rows are returned as slice.
+        """
+        store = self.__dicthash__
+        if IDs==-1:
+            return slice(0,len(store))
+        try:
+            return store.__rows__(IDs)
+        except KeyError as e:
+            raise Exception('no such ID in __dicthash__: %s'%e.args[0])
+            
+    def ids(self,filter='True',proc=False,vectorized=True):
+        """
+        Get IDs of the items satisfying the filter (see Collection.ids).
+        String filters are evaluated by the vectorized engine by default,
+        falling back to the item-wise evaluation for unsupported syntax.
+        """
+        if filter=='True' and not proc:
+            return self.__dicthash__.ids()
+        return Collection.ids(self,filter=filter,proc=proc,vectorized=vectorized)
+
+    def __filter_columns__(self,colnames,IDs=None):
+        store = self.__dicthash__
+        if IDs is None:
+            rows = slice(0,len(store))
+            n = len(store)
+        else:
+            rows = store.__rows__(IDs)
+            n = len(rows)
+        columns = {}
+        for colname in colnames:
+            if colname in store.columns():
+                column = store.column(colname)
+                columns[colname] = (column.data[rows],column.mask[rows])
+            else:
+                column = ColumnArray.empty(n,object)
+                columns[colname] = (column.data,column.mask)
+        return columns
+
+    def __selected_ids__(self,selection):
+        import numpy as np
+        store = self.__dicthash__
+        rows = np.flatnonzero(selection)
+        if store.__pos__ is None:
+            return (rows+store.__start__).tolist()
+        idlist = store.__idlist__
+        return [idlist[row] for row in rows.tolist()]
+
+    def subset(self,expr=None,view=False):
+        """
+        Subset of the columnar collection is a new columnar collection,
+        with the columns gathered from the parent.
+        """
+        if view:
+            return CollectionView(self,expr)
+        IDs = self.__subset_ids__(expr)
+        new_coll = ColumnarCollection()
+        new_coll.__dicthash__ = self.__dicthash__.take(self.__rows__(IDs),IDs)
+        new_coll.order = self.order
+        new_coll.maxid = max(IDs) if len(IDs)!=0 else -1
+        return new_coll
+        
+    def update(self,items,IDs=None):
+        if isinstance(items,Mapping):
+            items = [items]
+        elif type(items) not in [list,tuple]:
+            raise Exception('Items should be either list or tuple')
+        if not IDs:
+            IDs = self.getfreeids(len(items))
+        elif type(IDs) is not list:
+            raise Exception('Wrong IDs type: %s (expected list or integer)'%type(IDs))
+        self.__dicthash__.load(IDs,items)
+        self.__reindex__(IDs[:len(items)])
+        
+    def __extend__(self,IDs,items):
+        """
+        Chunk of new items is loaded column by column (see Collection.extend).
+        """
+        self.__dicthash__.load(list(IDs),items)
+        
+    def delete(self,IDs):
+        self.__dicthash__.delete(IDs)
+        self.__reindex__(IDs)
+        
+    def __column_pairs__(self,colname):
+        import numpy as np
+        store = self.__dicthash__
+        if colname not in store.columns():
+            return []
+        n = len(store)
+        column = store.column(colname)
+        rows = np.flatnonzero(column.mask[:n])
+        IDs = store.ids()
+        return [(IDs[row],column.get(row)) for row in rows.tolist()]
+        
+    def assign(self,par,expr,IDs=-1):
+        """
+        Create new parameter and assign 
+        some initial value that may depend on
+        other parameters within the item.
+        Values are calculated item-wise and stored as a whole column.
+        """
+        if IDs==-1:
+            IDs = self.ids()
+        if type(expr)==str: # simple
+            expr = eval('lambda var: ' + expr)
+        rows = self.__rows__(IDs)
+        store = self.__dicthash__
+        vals = [expr(store[ID]) for ID in IDs]
+        store.set_column(par,rows,vals)
+        self.__reindex__(IDs,[par])
+        if par not in self.order:
+            self.order.append(par)
+            
+    def index(self,expr):
+        """
+        Reform the IDs of the collection (see Collection.index).
+        Columns are not touched, only the ID index is replaced.
+        """
+        if type(expr) == str:
+            new_id_func = lambda var: var[expr]
+        elif type(expr) in {tuple,list}:
+            new_id_func = lambda v: tuple([v[k] for k in expr])
+        else:
+            new_id_func = expr # user-supplied function on item
+        store = self.__dicthash__
+        new_id_vals = [new_id_func(store[ID]) for ID in store.ids()]
+        if len(new_id_vals)!=len(set(new_id_vals)):
+            raise Exception('new index is not unique')
+        store.__setids__(new_id_vals)
+        self.__reindex__()
+        return self
+        
+    def getcols(self,colnames,IDs=-1,strict=True,mode=None,
+                functions=None,process=None,as_array=False):
+        """
+        Extract columns from collection (see Collection.getcols).
+        Plain columns are gathered directly from the column arrays
+        (typed arrays are returned without conversion to lists if as_array is set);
+        dotted colnames and functions use the item-wise implementation.
+        """
+        if type(colnames) is str:
+            colnames = [colnames]
+        elif type(colnames) is not list:
+            raise Exception('Column names should be either list or string')
+        for colname in colnames:
+            if type(colname) not in [str,unicode]:
+                raise Exception('Column name should be a string')
+        if functions or any(['.' in colname for colname in colnames]):
+            return Collection.getcols(self,colnames,IDs=IDs,strict=strict,
+                mode=mode,functions=functions,process=process,as_array=as_array)
+        if not mode: mode = 'strict' if strict else 'silent' 
+        rows = self.__rows__(IDs)
+        store = self.__dicthash__
+        if as_array:
+            missing = array_missing(as_array)
+            types = self.types or {}
+        cols = []
+        for colname in colnames:
+            if colname == '__ID__':
+                col = store.ids() if IDs==-1 else list(IDs)
+                cols.append(typed_array(col,missing=missing) if as_array else col)
+            elif as_array:
+                cols.append(store.gather_array(colname,rows,mode,types.get(colname),missing))
+            else:
+                cols.append(store.gather(colname,rows,mode))
+        if process:
+            cols = [process(col) for col in cols]
+        return cols
+        
+    def getrows(self,colnames,IDs=-1,strict=True,mode=None,
+                functions=None,process=None):
+        """
+        Extract rows from collection (see Collection.getrows).
+        """
+        if type(colnames) is str:
+            colnames = [colnames]
+        if functions or type(colnames) is not list or \
+                any(['.' in colname for colname in colnames if type(colname) is str]):
+            return Collection.getrows(self,colnames,IDs=IDs,strict=strict,
+                mode=mode,functions=functions,process=process)
+        if not mode: mode = 'strict' if strict else 'silent' 
+        if mode=='silent': mode = 'greedy' # missing values are replaced by None in rows
+        cols = self.getcols(colnames,IDs=IDs,mode=mode)
+        rows = list(zip(*cols)) if cols else []
+        if process:
+            rows = [process(row) for row in rows]
+        return rows
+        
+    def group(self,expr):
+        """
+        Group by column names is done by factorizing the column arrays
+        (see group_index); other group expressions use the item-wise implementation.
+        """
+        if self.__indexes__:
+            buffer = self.__indexed_group__(expr)
+            if buffer is not None: return buffer
+        if type(expr)==str and expr=='__ID__':
+            return Collection.group(self,expr)
+        if type(expr) in {str,list,tuple}:
+            return self.group_index(expr).to_dict()
+        buffer = {}
+        for ID,key in self.__group_pairs__(expr):
+            if key not in buffer:
+                buffer[key] = [ID]
+            else:
+                buffer[key].append(ID)
+        return buffer
+        
+    def group_index(self,expr):
+        if type(expr)==str and expr!='__ID__':
+            colnames = expr.split()
+        elif type(expr) in {list,tuple}:
+            colnames = list(expr)
+        else:
+            return Collection.group_index(self,expr)
+        import numpy as np
+        if self.__indexes__:
+            buffer = self.__indexed_group__(expr)
+            if buffer is not None: return GroupIndex.from_dict(buffer)
+        store = self.__dicthash__
+        n = len(store)
+        if not n:
+            return GroupIndex([],[0],[])
+        cols = []
+        for colname in colnames:
+            if colname not in store.columns() or not store.column(colname).mask[:n].all():
+                raise KeyError(colname)
+            cols.append(store.column(colname).data[:n])
+        codes,first = factorize(cols)
+        keycols = [data[first].tolist() for data in cols]
+        if type(expr)==str and len(colnames)==1:
+            keys = keycols[0]
+        else:
+            keys = list(zip(*keycols))
+        if store.__pos__ is None:
+            IDs = np.arange(store.__start__,store.__start__+n)
+        else:
+            IDs = store.__idlist__
+        return GroupIndex.from_codes(keys,codes,IDs)
+        
+    def __group_pairs__(self,expr):
+        if type(expr)==str and expr!='__ID__':
+            colnames = expr.split()
+        elif type(expr) in {list,tuple}:
+            colnames = list(expr)
+        else:
+            return Collection.__group_pairs__(self,expr)
+        store = self.__dicthash__
+        IDs = store.ids()
+        rows = slice(0,len(store))
+        cols = [store.gather(colname,rows,'strict') for colname in colnames]
+        if type(expr)==str and len(colnames)==1:
+            keys = cols[0]
+        else:
+            keys = zip(*cols)
+        return zip(IDs,keys)
+        
+    def keys(self):
+        return self.__dicthash__.counts()
+        
+    def get_types(self,nitems=None):
+        if nitems is not None:
+            return Collection.get_types(self,nitems)
+        store = self.__dicthash__
+        n = len(store)
+        types = {}
+        for key in store.columns():
+            column = store.column(key)
+            mask = column.mask[:n]
+            if not mask.any(): continue
+            if column.dtype==object:
+                tt = set(map(type,column.data[:n][mask]))
+            else:
+                tt = {{'b':bool,'i':int,'f':float}[column.dtype.kind]}
+            types[key] = list(tt)[0] if len(tt)==1 else self.MIXED
+        return types
+        
+    def deletecols(self,colnames):
+        if type(colnames) not in [list,tuple]:
+            colnames = [colnames]
+        self.order = [cname for cname in self.order if cname not in colnames]
+        for colname in colnames:
+            self.__dicthash__.drop_column(colname)
+        self.__drop_indexes__(colnames)
+            
+    def renamecol(self,oldname,newname):
+        self.__dicthash__.rename_column(oldname,newname)
+        if self.order is not None:
+            self.order = [newname if cname==oldname else cname for cname in self.order]
+        self.__rename_index__(oldname,newname)
+
+# =======================================================
+# ===================== Compact rows ====================
+# =======================================================
+
+ROW_SCHEMAS = weakref.WeakValueDictionary() # keys -> RowSchema
+ROW_SCHEMA_SETS = weakref.WeakValueDictionary() # frozenset of keys -> first RowSchema with these keys
+
+class RowSchema:
+    """
+    Key schema shared by the compact rows having the same keys (see CompactRow).
+    Schemas are interned by their key tuples (see also canonical); the transitions 
+    to the schemas with added or deleted key are cached.
+    """
+    
+    __slots__ = ('keys','positions','transitions','getter','__weakref__')
+    
+    def __init__(self,keys):
+        self.keys = keys
+        self.positions = {key:i for i,key in enumerate(keys)}
+        self.transitions = {}
+        if len(keys)>1: # getter gives the tuple of values in order of the keys
+            self.getter = operator.itemgetter(*keys)
+        else:
+            self.getter = lambda item: tuple([item[key] for key in keys])
+        
+    @staticmethod
+    def get(keys):
+        schema = ROW_SCHEMAS.get(keys)
+        if schema is None:
+            schema = RowSchema(keys)
+            ROW_SCHEMAS[keys] = schema
+            ROW_SCHEMA_SETS.setdefault(frozenset(keys),schema)
+        return schema
+        
+    @staticmethod
+    def canonical(keys):
+        """
+        Get the schema having the same set of keys in any order 
+        (the first one created), or the new schema for the keys.
+        """
+        schema = ROW_SCHEMA_SETS.get(frozenset(keys))
+        return RowSchema.get(keys) if schema is None else schema
+        
+    def __repr__(self):
+        return 'RowSchema(%s)'%str(self.keys)
+        
+    def add(self,key):
+        schema = self.transitions.get(('+',key))
+        if schema is None:
+            schema = RowSchema.get(self.keys+(key,))
+            self.transitions[('+',key)] = schema
+        return schema
+        
+    def remove(self,key):
+        schema = self.transitions.get(('-',key))
+        if schema is None:
+            schema = RowSchema.get(tuple([k for k in self.keys if k!=key]))
+            self.transitions[('-',key)] = schema
+        return schema
+
+class CompactRow(MutableMapping):
+    """
+    Memory-saving item of the dict-backed collection: the keys are kept 
+    in the shared RowSchema, the row itself keeps only the tuple of values
+    (tuples of scalars are not tracked by the garbage collector, unlike lists).
+    Behaves like a dictionary; adding or deleting keys moves the row to another schema.
+    """
+    
+    __slots__ = ('__schema__','__values__')
+    
+    def __init__(self,schema,values):
+        self.__schema__ = schema
+        self.__values__ = values
+        
+    def __getitem__(self,key):
+        return self.__values__[self.__schema__.positions[key]]
+        
+    def __setitem__(self,key,val):
+        schema = self.__schema__
+        pos = schema.positions.get(key)
+        values = self.__values__
+        if pos is None:
+            self.__schema__ = schema.add(key)
+            self.__values__ = values+(val,)
+        else:
+            self.__values__ = values[:pos]+(val,)+values[pos+1:]
+            
+    def __delitem__(self,key):
+        pos = self.__schema__.positions[key]
+        self.__schema__ = self.__schema__.remove(key)
+        values = self.__values__
+        self.__values__ = values[:pos]+values[pos+1:]
+        
+    def __contains__(self,key):
+        return key in self.__schema__.positions
+        
+    def __iter__(self):
+        return iter(self.__schema__.keys)
+        
+    def __len__(self):
+        return len(self.__values__)
+        
+    def __eq__(self,other):
+        if type(other) is CompactRow and other.__schema__ is self.__schema__:
+            return self.__values__==other.__values__
+        return Mapping.__eq__(self,other)
+        
+    def __repr__(self):
+        return repr(dict(self.items()))
+        
+    def __reduce__(self):
+        return (compact_row,(self.__schema__.keys,self.__values__))
+        
+    def get(self,key,default=None):
+        pos = self.__schema__.positions.get(key)
+        return default if pos is None else self.__values__[pos]
+        
+    def items(self):
+        return list(zip(self.__schema__.keys,self.__values__))
+        
+    def values(self):
+        return list(self.__values__)
+        
+    def copy(self):
+        return CompactRow(self.__schema__,self.__values__)
+        
+    def export_to_json(self):
+        return dict(zip(self.__schema__.keys,self.__values__))
+
+def compact_row(keys,values):
+    """
+    Create compact row from the key tuple and the tuple of values.
+    """
+    return CompactRow(RowSchema.get(keys),tuple(values))
+
+def compact_items(items,copy=True):
+    """
+    Copy the items for storing in the collection (see Collection.update).
+    Items having at least SETTINGS['COMPACT_KEYS'] keys are converted to 
+    the compact rows, if the key sets are shared on average by two items or more;
+    otherwise, and for the narrow items, plain dictionaries are created
+    (if copy is False, these items are taken as they are, see Collection.extend).
+    Items with the same set of keys share the schema even if their key order differs
+    (see RowSchema.canonical), so the keys of such rows go in order of the schema.
+    """
+    minkeys = SETTINGS['COMPACT_KEYS']
+    if not minkeys or not items:
+        return [dict(item) for item in items] if copy else list(items)
+    maxschemas = max(1,len(items)//2)
+    rows = []
+    append = rows.append
+    schemas = {}
+    nkeys = -1 # number of keys of the current schema
+    for item in items:
+        if len(item)==nkeys: # the same keys as in the previous item
+            try:
+                append(CompactRow(schema,schema.getter(item)))
+                continue
+            except KeyError:
+                pass
+        keys = tuple(item)
+        schema = schemas.get(keys)
+        if schema is None:
+            if len(schemas)==maxschemas: # heterogeneous items
+                return [dict(item) for item in items] if copy else list(items)
+            schema = schemas[keys] = RowSchema.canonical(keys) if len(keys)>=minkeys else dict
+        if schema is dict:
+            nkeys = -1
+            append(dict(item) if copy else item)
+        else:
+            nkeys = len(keys)
+            append(CompactRow(schema,schema.getter(item)))
+    return rows
+
+# =======================================================
+# ==================== Item cloning =====================
+# =======================================================
+
+CLONE_IMMUTABLE = frozenset({int,float,complex,bool,str,bytes,type(None),
+    frozenset,datetime,date})
+
+def clone_value(val):
+    """
+    Copy the item value: immutable scalars are shared, lists, dicts, 
+    sets and tuples are copied recursively, other objects are deep-copied.
+    Unlike deepcopy, references shared between the values are not preserved.
+    """
+    tp = type(val)
+    if tp in CLONE_IMMUTABLE:
+        return val
+    elif tp is list:
+        return [v if type(v) in CLONE_IMMUTABLE else clone_value(v) for v in val]
+    elif tp is dict:
+        return {k:v if type(v) in CLONE_IMMUTABLE else clone_value(v) for k,v in val.items()}
+    elif tp is tuple:
+        return tuple([clone_value(v) for v in val])
+    elif tp is set:
+        return set(val) # elements are hashable
+    else:
+        return copy.deepcopy(val)
+
+def clone_item(item,colnames=None):
+    """
+    Copy the item (see clone_value) to the new dictionary.
+    If colnames are given, only these keys are copied.
+    """
+    if colnames is not None:
+        item = {key:item[key] for key in colnames if key in item}
+    if type(item) is CompactRow:
+        values = tuple([val if type(val) in CLONE_IMMUTABLE else clone_value(val) for val in item.__values__])
+        return CompactRow(item.__schema__,values)
+    if CLONE_IMMUTABLE.issuperset(map(type,item.values())): # flat item
+        return dict(item)
+    return {key:val if type(val) in CLONE_IMMUTABLE else clone_value(val) \
+        for key,val in item.items()}
+
+# =======================================================
+# =================== Collection views ==================
+# =======================================================
+
+class ViewStore(MutableMapping):
+    """
+    Item storage of the CollectionView.
+    Refers to the parent collection and the subset expression (see subset),
+    which is resolved to the IDs on the first access.
+    Items are returned as ViewRow proxies reading through to the parent items.
+    Changed items are copied to the view on the first write (copy-on-write,
+    nested containers are copied as well, see clone_item), so the parent 
+    is not changed by the writes. Nested containers of the untouched items
+    are shared with the parent: changing them in place changes the parent.
+    """
+    
+    def __init__(self,parent,expr=None):
+        self.__parent__ = parent
+        self.__expr__ = expr
+        self.__selection__ = None # ID -> None, keeps the order of IDs
+        self.__own__ = {} # items copied on write and new items
+        
+    def __ids__(self):
+        if self.__selection__ is None:
+            parent = self.__parent__
+            expr = self.__expr__
+            if hasattr(expr,'__next__'): # lazy ID sequence
+                IDs = list(expr)
+            else:
+                IDs = parent.__subset_ids__(expr)
+            dicthash = parent.__dicthash__
+            for ID in IDs:
+                if ID not in dicthash:
+                    raise Exception('no such ID in __dicthash__: %s'%ID)
+            self.__selection__ = dict.fromkeys(IDs)
+            self.__expr__ = None
+        return self.__selection__
+        
+    def __touch__(self,ID):
+        """
+        Get the own copy of the item for writing.
+        """
+        own = self.__own__
+        if ID not in own:
+            own[ID] = clone_item(self.__parent__.__dicthash__[ID])
+        return own[ID]
+        
+    def __getitem__(self,ID):
+        own = self.__own__
+        if ID in own:
+            return own[ID]
+        if ID not in self.__ids__():
+            raise KeyError(ID)
+        return ViewRow(self,ID)
+        
+    def __setitem__(self,ID,item):
+        self.__ids__()[ID] = None
+        self.__own__[ID] = item
+        
+    def __delitem__(self,ID):
+        del self.__ids__()[ID]
+        self.__own__.pop(ID,None)
+        
+    def __contains__(self,ID):
+        return ID in self.__ids__()
+        
+    def __iter__(self):
+        return iter(self.__ids__())
+        
+    def __len__(self):
+        return len(self.__ids__())
+        
+    def export_to_json(self):
+        return {ID:dict(self[ID]) for ID in self}
+
+class ViewRow(MutableMapping):
+    """
+    Item proxy of the CollectionView.
+    Reads through to the parent item until the first change, which
+    copies the item to the view (see ViewStore). Until then the nested 
+    containers belong to the parent and should not be changed in place.
+    """
+    
+    __slots__ = ('__store__','__id__')
+    
+    def __init__(self,store,ID):
+        self.__store__ = store
+        self.__id__ = ID
+        
+    def __item__(self):
+        store = self.__store__
+        ID = self.__id__
+        own = store.__own__
+        return own[ID] if ID in own else store.__parent__.__dicthash__[ID]
+        
+    def __getitem__(self,key):
+        return self.__item__()[key]
+        
+    def __setitem__(self,key,val):
+        self.__store__.__touch__(self.__id__)[key] = val
+        
+    def __delitem__(self,key):
+        del self.__store__.__touch__(self.__id__)[key]
+        
+    def __contains__(self,key):
+        return key in self.__item__()
+        
+    def __iter__(self):
+        return iter(self.__item__())
+        
+    def __len__(self):
+        return len(self.__item__())
+        
+    def get(self,key,default=None):
+        return self.__item__().get(key,default)
+        
+    def copy(self):
+        return dict(self.__item__())
+        
+    def export_to_json(self):
+        return self.copy()
+        
+class CollectionView(Collection):
+    """
+    Zero-copy view of the collection: refers to the parent collection 
+    and the selection of its IDs (see ViewStore).
+    Creating the view costs O(1), the selection is resolved on the first access;
+    views of views chain their filters lazily.
+    Changes are copy-on-write: only the touched items are copied to the view
+    (with their nested containers), and the parent collection stays intact. 
+    Untouched items reflect the parent, including their nested containers.
+    """
+    
+    def __init__(self,parent,expr=None):
+        self.__indexes__ = {}
+        self.__positions__ = ItemPositions()
+        self.__catalogue__ = None
+        self.__catalogued__ = False
+        self.__epoch__ = [0]
+        self.__parent__ = parent
+        self.__dicthash__ = ViewStore(parent,expr)
+        self.__name__ = ''
+        self.__path__ = './'
+        self.__type__ = '__view__'
+        self.order = list(parent.order)
+        self.types = parent.types
+        self.maxid = parent.maxid # new IDs don't clash with the parent's
+        
+    def __repr__(self):
+        return 'CollectionView (%d lines)'%len(self)
+        
+    def copy(self,name='Default',path='',colnames=None):
+        """
+        Materialize the view as the independent collection.
+        If colnames are given, only these columns are copied.
+        """
+        col = Collection()
+        dicthash = self.__dicthash__
+        col.__dicthash__ = {ID:clone_item(dicthash[ID],colnames) for ID in dicthash}
+        col.order = list(self.order)
+        if colnames is not None:
+            col.order = [colname for colname in col.order if colname in colnames]
+        col.types = self.types
+        col.maxid = self.maxid
+        col.__name__ = name
+        col.__path__ = path
+        return col
+
+# =======================================================
+# ================= Group aggregation ===================
+# =======================================================
+
+class GroupIndex(Mapping):
+    """
+    Compact group index: unique keys and offsets into the array of IDs
+    permuted by groups, the IDs of i-th group are ids[offsets[i]:offsets[i+1]].
+    Behaves as read-only dictionary {key:[IDs]} (see Collection.group);
+    the dictionary of lists is created on demand by to_dict.
+    """
+    
+    def __init__(self,keys,offsets,ids):
+        self.__keys__ = keys
+        self.__offsets__ = offsets
+        self.__ids__ = ids
+        self.__pos__ = None # key -> group number, created lazily
+        
+    @classmethod
+    def from_dict(cls,buffer):
+        """
+        Create group index from the dictionary {key:[IDs]}.
+        """
+        keys = list(buffer)
+        ids = [ID for key in keys for ID in buffer[key]]
+        offsets = [0]+list(it.accumulate(len(buffer[key]) for key in keys))
+        return cls(keys,offsets,ids)
+        
+    @classmethod
+    def from_codes(cls,keys,codes,IDs):
+        """
+        Create group index from the key codes of IDs (see factorize).
+        """
+        import numpy as np
+        perm = np.argsort(codes,kind='stable')
+        offsets = np.zeros(len(keys)+1,dtype=np.int64)
+        np.cumsum(np.bincount(codes,minlength=len(keys)),out=offsets[1:])
+        IDs_ = np.asarray(IDs)
+        if IDs_.dtype.kind in 'iu':
+            ids = IDs_[perm].tolist()
+        else:
+            ids = [IDs[i] for i in perm.tolist()]
+        return cls(keys,offsets.tolist(),ids)
+        
+    def __repr__(self):
+        return '%s(%d groups, %d IDs)'%(self.__class__.__name__,
+            len(self.__keys__),len(self.__ids__))
+        
+    def __len__(self):
+        return len(self.__keys__)
+        
+    def __iter__(self):
+        return iter(self.__keys__)
+        
+    def __contains__(self,key):
+        return key in self.__positions__()
+        
+    def __getitem__(self,key):
+        i = self.__positions__()[key]
+        return self.__ids__[self.__offsets__[i]:self.__offsets__[i+1]]
+        
+    def __positions__(self):
+        if self.__pos__ is None:
+            self.__pos__ = {key:i for i,key in enumerate(self.__keys__)}
+        return self.__pos__
+        
+    def ids(self):
+        """
+        Get the IDs permuted by groups.
+        """
+        return self.__ids__
+        
+    def offsets(self):
+        return self.__offsets__
+        
+    def sizes(self):
+        offsets = self.__offsets__
+        return [j-i for i,j in zip(offsets[:-1],offsets[1:])]
+        
+    def to_dict(self):
+        """
+        Get the group index as dictionary {key:[IDs]}.
+        """
+        ids = self.__ids__
+        offsets = self.__offsets__
+        return {key:ids[i:j] for key,i,j in zip(self.__keys__,offsets[:-1],offsets[1:])}
+
+def factorize(columns):
+    """
+    Factorize the key columns (numpy arrays of equal length) into integer codes.
+    Returns the codes numbering the unique keys in order of their 
+    first appearance, and the positions of the first appearances.
+    """
+    import numpy as np
+    n = len(columns[0])
+    codes = None
+    for data in columns:
+        if data.dtype==object or (data.dtype.kind=='f' and np.isnan(data).any()):
+            pos = {} # hashing is used for objects; each NaN makes its own key
+            codes_ = np.fromiter((pos.setdefault(val,len(pos)) for val in data.tolist()),
+                dtype=np.int64,count=n)
+            nuniq = len(pos)
+            first_ = None
+        else:
+            uniq,first_,codes_ = np.unique(data,return_index=True,return_inverse=True)
+            nuniq = len(uniq)
+        if codes is None and first_ is not None:
+            codes,first = codes_,first_
+        else:
+            codes = codes_ if codes is None else codes*nuniq+codes_
+            _,first,codes = np.unique(codes,return_index=True,return_inverse=True) # keep codes compact
+    # renumber the keys by their first appearance
+    order = np.argsort(first,kind='stable')
+    rank = np.empty(len(order),dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[codes],first[order]
+
+def stat_chunks(sizes,nchunks):
+    """
+    Distribute the groups into nchunks chunks of balanced total size:
+    largest groups go first, each to the lightest chunk.
+    Returns the non-empty lists of group numbers.
+    """
+    heap = [(0,n) for n in range(nchunks)]
+    chunks = [[] for _ in range(nchunks)]
+    for i in sorted(range(len(sizes)),key=lambda i: -sizes[i]):
+        load,n = heapq.heappop(heap)
+        chunks[n].append(i)
+        heapq.heappush(heap,(load+sizes[i],n))
+    return [sorted(chunk) for chunk in chunks if chunk]
+    
+def stat_job(pair):
+    """
+    Calculate statistics for the chunk of groups (see Collection.__parallel_stat__).
+    Missing mapper or reducer means identity.
+    """
+    n,chunk = pair
+    output = []
+    for i,items in chunk['groups']:
+        values = []
+        for map_,reduce_ in zip(chunk['map'],chunk['reduce']):
+            map_values = items if map_ is None else [map_(item) for item in items]
+            values.append(map_values if reduce_ is None else reduce_(map_values))
+        output.append((i,values))
+    return n,output
+
+def group_values(values,mask=None):
+    """
+    Prepare the column values for group_reduce: drop missing and None values 
+    and infer the numpy type of the plain values.
+    Values are either the list or the column array with presence mask.
+    Returns the values and the mask of the kept ones.
+    """
+    import numpy as np
+    if mask is not None:
+        if values.dtype!=object:
+            return values[mask],mask
+        values = values.tolist()
+    try:
+        arr = np.array(values)
+    except ValueError:
+        arr = object_array(values)
+    if arr.dtype!=object and arr.ndim==1 and arr.dtype.kind not in 'US':
+        keep = mask if mask is not None else np.ones(len(arr),dtype=bool)
+        return (arr if mask is None else arr[mask]),keep
+    # None values, sequences or strings
+    keep = np.fromiter((val is not None for val in values),dtype=bool,count=len(values))
+    if mask is not None: keep &= mask
+    vals = [val for val,flag in zip(values,keep) if flag]
+    try:
+        arr = np.array(vals)
+        if arr.ndim!=1: raise ValueError
+    except ValueError: # sequences are kept as objects
+        arr = object_array(vals)
+    if arr.dtype.kind in 'US': # no ufunc loops for numpy strings
+        arr = object_array(vals)
+    return arr,keep
+
+def group_reduce(arr,codes,ngroups,how,*args):
+    """
+    Reduce the column values by groups (see Collection.aggregate).
+    Values (see group_values) are given in the group order, 
+    codes are the sorted group numbers.
+    Reducer "how" is a name of the built-in reducer or user function on the array.
+    Returns the list of ngroups results, None for the groups without values.
+    """
+    import numpy as np
+    counts = np.bincount(codes,minlength=ngroups)
+    if how=='count':
+        return counts.tolist()
+    nonempty = np.flatnonzero(counts)
+    counts_ = counts[nonempty]
+    starts = np.cumsum(counts_)-counts_
+    if arr.dtype==bool and how in {'sum','mean','std'}:
+        arr = arr.astype(int)
+    if how=='sum':
+        res = np.add.reduceat(arr,starts) if len(arr) else arr
+    elif how=='mean':
+        res = np.add.reduceat(arr,starts)/counts_ if len(arr) else arr
+    elif how=='std':
+        ddof = args[0] if args else 0
+        if not len(arr):
+            res = arr
+        else:
+            mean = np.add.reduceat(arr,starts)/counts_
+            dev = arr-np.repeat(mean,counts_)
+            res = np.sqrt(np.add.reduceat(dev*dev,starts)/(counts_-ddof))
+    elif how=='min':
+        res = np.minimum.reduceat(arr,starts) if len(arr) else arr
+    elif how=='max':
+        res = np.maximum.reduceat(arr,starts) if len(arr) else arr
+    elif how=='first':
+        res = arr[starts]
+    elif how=='last':
+        res = arr[starts+counts_-1]
+    elif how in {'median','quantile'}:
+        q = 0.5 if how=='median' else args[0]
+        arr = arr[np.lexsort((arr,codes))] # sort values within groups
+        pos = starts+q*(counts_-1)
+        lo = np.floor(pos).astype(int)
+        hi = np.ceil(pos).astype(int)
+        res = arr[lo]+(arr[hi]-arr[lo])*(pos-lo) # linear interpolation
+    elif callable(how):
+        res = [how(arr[i:i+n]) for i,n in zip(starts.tolist(),counts_.tolist())]
+    else:
+        raise Exception('unknown reducer: %s'%how)
+    output = [None]*ngroups
+    res = res.tolist() if isinstance(res,np.ndarray) else res
+    for i,val in zip(nonempty.tolist(),res):
+        output[i] = val
+    return output
+
+# =======================================================
+# ================ Binary storage format ================
+# =======================================================
+
+BINARY_MAGIC = b'JEANNYB1'
+BINARY_VERSION = 1
+BINARY_ALIGN = 64 # alignment of the data blocks
+
+def binary_codec(compression):
+    """
+    Get the (compress,decompress) pair for the block compression.
+    """
+    if compression=='zlib':
+        import zlib as codec
+    elif compression=='bz2':
+        import bz2 as codec
+    elif compression=='lzma':
+        import lzma as codec
+    else:
+        raise Exception('unknown compression: %s'%compression)
+    return codec.compress,codec.decompress
+
+class LazyColumnArray(ColumnArray):
+    """
+    Column of the binary file (see Collection.export_binary),
+    which is decoded on the first access to its data or mask.
+    """
+    
+    def __init__(self,source):
+        self.__source__ = source # function returning data and mask
+        self.__data__ = None
+        self.__mask__ = None
+        
+    def __load__(self):
+        if self.__source__ is not None:
+            self.__data__,self.__mask__ = self.__source__()
+            self.__source__ = None
+            
+    @property
+    def data(self):
+        self.__load__()
+        return self.__data__
+        
+    @data.setter
+    def data(self,data):
+        self.__load__()
+        self.__data__ = data
+        
+    @property
+    def mask(self):
+        self.__load__()
+        return self.__mask__
+        
+    @mask.setter
+    def mask(self,mask):
+        self.__load__()
+        self.__mask__ = mask
+
+def binary_write(filename,store,order,types,maxid,compression=None):
+    """
+    Write the column store to the binary file (see Collection.export_binary).
+    """
+    import numpy as np
+    import pickle
+    n = len(store)
+    compress = binary_codec(compression)[0] if compression else None
+    blocks = []
+    def block(data,codec):
+        if codec=='pickle':
+            data = pickle.dumps(data,protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            data = np.ascontiguousarray(data)
+            data = data.tobytes() if compress else memoryview(data).cast('B')
+        if compress:
+            data = compress(data)
+        blocks.append(data)
+        return {'index':len(blocks)-1,'codec':codec,'compression':compression}
+    # IDs: nothing for the contiguous range, raw integers or pickled list
+    if store.__pos__ is None:
+        ids = {'start':store.__start__}
+    elif all(type(ID) is int for ID in store.__idlist__):
+        try:
+            ids = {'block':block(np.array(store.__idlist__,dtype=np.int64),'raw')}
+        except OverflowError:
+            ids = {'block':block(store.__idlist__,'pickle')}
+    else:
+        ids = {'block':block(store.__idlist__,'pickle')}
+    # columns with their schema
+    columns = []
+    for key in store.columns():
+        column = store.column(key)
+        data = column.data[:n]; mask = column.mask[:n]
+        if not mask.any(): continue
+        if data.dtype==object:
+            tt = set([type(val).__name__ for val in data[mask]])
+            schema = list(tt)[0] if len(tt)==1 else 'mixed'
+            data_block = block(data,'pickle')
+            dtype = 'object'
+        else:
+            schema = {'b':'bool','i':'int','f':'float'}[data.dtype.kind]
+            data_block = block(data,'raw')
+            dtype = data.dtype.str
+        mask_block = None if mask.all() else block(mask,'raw')
+        columns.append({'name':key,'dtype':dtype,'schema':schema,
+            'data':data_block,'mask':mask_block})
+    header = {
+        'version':BINARY_VERSION,
+        'nrows':n,
+        'maxid':maxid,
+        'order':list(order) if order else [],
+        'types':None if types is None else block(types,'pickle'),
+        'ids':ids,
+        'columns':columns,
+    }
+    # block offsets are relative to the start of the data section
+    offsets = []; offset = 0
+    for data in blocks:
+        offset += -offset%BINARY_ALIGN
+        offsets.append((offset,len(data)))
+        offset += len(data)
+    header['blocks'] = offsets
+    buf = json.dumps(header,default=json_serial).encode()
+    start = len(BINARY_MAGIC)+8+len(buf)
+    with open(filename,'wb') as f:
+        f.write(BINARY_MAGIC)
+        f.write(np.uint64(len(buf)).tobytes())
+        f.write(buf)
+        f.write(b'\0'*(-start%BINARY_ALIGN))
+        position = 0
+        for (offset,_),data in zip(offsets,blocks):
+            f.write(b'\0'*(offset-position))
+            f.write(data)
+            position = offset+len(data)
+            
+def binary_header(filename):
+    """
+    Read the header of the binary file.
+    Returns the header and the offset of the data section.
+    """
+    import numpy as np
+    with open(filename,'rb') as f:
+        if f.read(len(BINARY_MAGIC))!=BINARY_MAGIC:
+            raise Exception('%s is not a Jeanny binary file'%filename)
+        length = int(np.frombuffer(f.read(8),dtype=np.uint64)[0])
+        header = json.loads(f.read(length).decode())
+    start = len(BINARY_MAGIC)+8+length
+    start += -start%BINARY_ALIGN
+    return header,start
+    
+def binary_block(filename,header,start,block,dtype=None,mmap=True):
+    """
+    Read the data block of the binary file.
+    Uncompressed raw blocks are memory-mapped if mmap is True.
+    """
+    import numpy as np
+    import pickle
+    offset,nbytes = header['blocks'][block['index']]
+    if block['codec']=='raw' and not block['compression'] and mmap:
+        if nbytes==0:
+            return np.zeros(0,dtype=dtype)
+        return np.memmap(filename,dtype=dtype,mode='c',offset=start+offset,
+            shape=(nbytes//np.dtype(dtype).itemsize,))
+    with open(filename,'rb') as f:
+        f.seek(start+offset)
+        data = f.read(nbytes)
+    if block['compression']:
+        data = binary_codec(block['compression'])[1](data)
+    if block['codec']=='pickle':
+        return pickle.loads(data)
+    return np.frombuffer(bytearray(data),dtype=dtype)
+    
+def binary_store(filename,mmap=True):
+    """
+    Open the binary file as a ColumnStore with lazily decoded columns.
+    Returns the store, header and the type header of the collection.
+    """
+    import numpy as np
+    header,start = binary_header(filename)
+    n = header['nrows']
+    store = ColumnStore()
+    for column in header['columns']:
+        def source(column=column):
+            dtype = object if column['dtype']=='object' else np.dtype(column['dtype'])
+            data = binary_block(filename,header,start,column['data'],dtype,mmap)
+            if column['mask'] is None:
+                mask = np.ones(n,dtype=bool)
+            else:
+                mask = binary_block(filename,header,start,column['mask'],bool,mmap)
+            return data,mask
+        name = column['name']
+        if type(name) is list: name = tuple(name) # JSON has no tuples
+        store.__columns__[name] = LazyColumnArray(source)
+    ids = header['ids']
+    if 'start' in ids:
+        store.__nrows__ = n
+        store.__start__ = ids['start']
+    else:
+        IDs = binary_block(filename,header,start,ids['block'],np.int64,False)
+        store.__setids__(IDs.tolist() if isinstance(IDs,np.ndarray) else IDs)
+    types = header['types']
+    if types is not None:
+        types = binary_block(filename,header,start,types)
+    return store,header,types
+
+def import_binary(filename,columnar=False,mmap=True):
+    """
+    Import the binary file (see Collection.export_binary).
+    If columnar is True, ColumnarCollection with lazily loaded columns is created.
+    """
+    col = ColumnarCollection() if columnar else Collection()
+    col.import_binary(filename,mmap=mmap)
+    return col
 
 class Tree: # can a collection do that ??????????
     """
@@ -2847,6 +6154,133 @@ def get_dirnames(dirname):
 def filterstr(lst,regex):
     return [entry for entry in lst if re.search(regex,entry)]
 
+def json_backend(backend='json'):
+    """
+    Get the (loads,dumps) pair for the JSON backend:
+    'json' (standard library), 'orjson', 'ujson', or 'auto' (the fastest installed one).
+    Function loads takes bytes; dumps(obj,default) gives bytes indented by 2 spaces.
+    Values not supported by the faster parsers (e.g. NaN) are loaded by the standard one.
+    Items which orjson would write differently from the standard library (NaN 
+    and Infinity, which it turns into null, and non-string keys) are written 
+    by the standard one.
+    Note that orjson and ujson write non-ASCII characters as UTF-8 without escaping.
+    """
+    if backend=='auto':
+        for backend in ['orjson','ujson']:
+            try:
+                __import__(backend)
+                break
+            except ImportError:
+                pass
+        else:
+            backend = 'json'
+    json_dumps = lambda obj,default: json.dumps(obj,indent=2,default=default).encode()
+    if backend=='json':
+        return json.loads,json_dumps
+    elif backend=='orjson':
+        import orjson
+        fast_loads = orjson.loads
+        def dumps(obj,default):
+            try:
+                data = orjson.dumps(obj,default=default,option=orjson.OPT_INDENT_2)
+            except TypeError: # e.g. non-string keys
+                return json_dumps(obj,default)
+            if b'null' in data: # could be NaN or Infinity
+                return json_dumps(obj,default)
+            return data
+    elif backend=='ujson':
+        import ujson
+        fast_loads = ujson.loads
+        dumps = lambda obj,default: ujson.dumps(obj,indent=2,default=default).encode()
+    else:
+        raise Exception('unknown JSON backend: %s'%backend)
+    def loads(data):
+        try:
+            return fast_loads(data)
+        except ValueError:
+            return json.loads(data)
+    return loads,dumps
+    
+def json_hash(value):
+    """
+    Get the MD5 hash of the JSON representation of the value.
+    """
+    buf = json.dumps(value,sort_keys=True,default=json_serial)
+    return hashlib.md5(buf.encode()).hexdigest()
+
+def file_hash(path):
+    """
+    Get the MD5 hash of the file contents.
+    """
+    with open(path,'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+def read_manifest(dirname):
+    """
+    Read the manifest of the folder collection (filename -> entry).
+    """
+    path = os.path.join(dirname,SETTINGS['MANIFEST'])
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(dirname,manifest):
+    """
+    Write the manifest of the folder collection.
+    """
+    path = os.path.join(dirname,SETTINGS['MANIFEST'])
+    with open(path+'.tmp','w') as f:
+        json.dump(manifest,f)
+    os.replace(path+'.tmp',path)
+
+def manifest_entry(path,item):
+    """
+    Make the manifest entry for the file containing the item:
+    modification time, size, MD5 sum and hashes of the values.
+    """
+    stat = os.stat(path)
+    return {'mtime':stat.st_mtime_ns,'size':stat.st_size,'md5':file_hash(path),
+            'keys':{key:json_hash(item[key]) for key in item}}
+
+def manifest_valid(entry,path,check):
+    """
+    Check if the manifest entry is still valid for the file.
+    """
+    if check=='mtime':
+        stat = os.stat(path)
+        return entry['mtime']==stat.st_mtime_ns and entry['size']==stat.st_size
+    else:
+        return entry['md5']==file_hash(path)
+
+def folder_map(func,args,nthreads=None,progress=False):
+    """
+    Apply function to each of the arguments, preserving their order.
+    If nthreads is given, the calls are done in the thread pool
+    (most useful for the I/O bound functions, e.g. reading files).
+    Progress is either True (print to stdout) or a function
+    taking the numbers of processed and all arguments.
+    """
+    total = len(args)
+    if progress is True:
+        step = max(total//100,1)
+        def progress(done,total):
+            if done%step==0 or done==total:
+                print('\r%d/%d'%(done,total),end='\n' if done==total else '')
+    if not nthreads or nthreads<=1:
+        results = []
+        for arg in args:
+            results.append(func(arg))
+            if progress: progress(len(results),total)
+        return results
+    from concurrent.futures import ThreadPoolExecutor
+    results = []
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        for result in executor.map(func,args):
+            results.append(result)
+            if progress: progress(len(results),total)
+    return results
+
 # scan folder for files which obey the given regular expression (PCRE)
 def scanfiles(dirname='./',regex=''):
     return filterstr(get_filenames(dirname),regex)
@@ -2866,11 +6300,9 @@ def copyfile(srcdir,srcnames,destdir,destnames=None):
 # convert old HAPI-formatted table to Collection    
 def collect_hapi(LOCAL_TABLE_CACHE,TableName):
     lines = Collection()
-    for i in range(LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']):
-        line = {}
-        for par in LOCAL_TABLE_CACHE[TableName]['data'].keys():
-            line[par] = LOCAL_TABLE_CACHE[TableName]['data'][par][i]
-        lines.update(line)
+    data = LOCAL_TABLE_CACHE[TableName]['data']
+    nrows = LOCAL_TABLE_CACHE[TableName]['header']['number_of_rows']
+    lines.extend({par:data[par][i] for par in data} for i in range(nrows))
     return lines
     
 # ATTENTION!!! BETTER VERSIONS FOR FUNCTIONS FOR WORKING WITH .PAR HITRAN FORMAT 
@@ -2947,13 +6379,118 @@ def load_dotpar(line):
     if item['local_iso_id']==10: item['local_iso_id']=0
     return item
         
-def import_dotpar(filename):
-    col = Collection()
-    with open(filename) as f:
-        for line in f:
-            item = load_dotpar(line)
-            col.update(item)
-    col.order = list(item.keys())
+# .par fields: name, first and last+1 positions, kind (i: int, x: hex digit, f: float, s: string)
+DOTPAR_FIELDS = (
+    ('molec_id',              0,  2, 'i'),
+    ('local_iso_id',          2,  3, 'x'),
+    ('nu',                    3, 15, 'f'),
+    ('sw',                   15, 25, 'f'),
+    ('a',                    25, 35, 'f'),
+    ('gamma_air',            35, 40, 'f'),
+    ('gamma_self',           40, 45, 'f'),
+    ('elower',               45, 55, 'f'),
+    ('n_air',                55, 59, 'f'),
+    ('delta_air',            59, 67, 'f'),
+    ('global_upper_quanta',  67, 82, 's'),
+    ('global_lower_quanta',  82, 97, 's'),
+    ('local_upper_quanta',   97,112, 's'),
+    ('local_lower_quanta',  112,127, 's'),
+    ('ierr',                127,133, 's'),
+    ('iref',                133,145, 's'),
+    ('gp',                  145,153, 'f'),
+    ('gpp',                 153,160, 'f'),
+)
+DOTPAR_LENGTH = 160
+
+def dotpar_records(filename):
+    """
+    Get the .par file as the 2D array of bytes, one row per record.
+    Files with fixed-length lines are memory-mapped, otherwise 
+    the lines are padded to the record length.
+    """
+    import numpy as np
+    if os.path.getsize(filename)==0:
+        return np.zeros((0,DOTPAR_LENGTH),dtype=np.uint8)
+    raw = np.memmap(filename,dtype=np.uint8,mode='r')
+    newlines = np.flatnonzero(raw[:DOTPAR_LENGTH+2]==10)
+    if len(newlines):
+        reclen = int(newlines[0])+1
+        if reclen>=DOTPAR_LENGTH+1 and len(raw)%reclen==0:
+            records = raw.reshape(-1,reclen)
+            if (records[:,-1]==10).all():
+                return records[:,:DOTPAR_LENGTH]
+    # variable-length lines (e.g. with the trailing spaces stripped)
+    with open(filename,'rb') as f:
+        lines = [line.rstrip(b'\r\n').ljust(DOTPAR_LENGTH)[:DOTPAR_LENGTH] 
+            for line in f if line.strip()]
+    return np.frombuffer(b''.join(lines),dtype=np.uint8).reshape(-1,DOTPAR_LENGTH)
+    
+def dotpar_field(records,kind,start,end):
+    """
+    Decode one fixed-width field for all records at once.
+    """
+    import numpy as np
+    chunk = np.ascontiguousarray(records[:,start:end])
+    if kind=='x':
+        digits = np.full(256,-1,dtype=np.int64)
+        digits[np.frombuffer(b'0123456789',dtype=np.uint8)] = np.arange(10)
+        digits[np.frombuffer(b'ABCDEF',dtype=np.uint8)] = np.arange(10,16)
+        digits[np.frombuffer(b'abcdef',dtype=np.uint8)] = np.arange(10,16)
+        vals = digits[chunk[:,0]]
+        if (vals<0).any():
+            raise Exception('wrong hexadecimal digit in .par field')
+        vals[vals==10] = 0 # isotopologue 10 is encoded as 0
+        return vals
+    strings = chunk.view('S%d'%(end-start)).ravel()
+    if kind=='i':
+        return strings.astype(np.int64)
+    elif kind=='f':
+        return strings.astype(np.float64)
+    else:
+        return object_array(strings.astype('U%d'%(end-start)).tolist())
+    
+def dotpar_columns(filename,numin=None,numax=None,blocksize=1000000):
+    """
+    Decode HITRAN .par file into the dictionary of typed column arrays.
+    If numin and/or numax are given, only the lines with
+    numin<=nu<=numax are decoded (the nu field is read first).
+    Records are processed in blocks of "blocksize" lines.
+    """
+    import numpy as np
+    records = dotpar_records(filename)
+    blocks = {name:[] for name,_,_,_ in DOTPAR_FIELDS}
+    for i in range(0,max(len(records),1),blocksize):
+        block = records[i:i+blocksize]
+        if numin is not None or numax is not None:
+            nu = dotpar_field(block,'f',3,15)
+            selection = np.ones(len(block),dtype=bool)
+            if numin is not None: selection &= nu>=numin
+            if numax is not None: selection &= nu<=numax
+            block = block[selection]
+        for name,start,end,kind in DOTPAR_FIELDS:
+            blocks[name].append(dotpar_field(block,kind,start,end))
+    return {name:np.concatenate(blocks[name]) for name in blocks}
+        
+def import_dotpar(filename,numin=None,numax=None,columnar=False):
+    """
+    Import HITRAN .par file into a collection.
+    Fixed-width fields are decoded in bulk (see dotpar_columns);
+    numin and numax restrict the wavenumber window of the imported lines.
+    If columnar is True, ColumnarCollection is created directly from
+    the decoded column arrays.
+    """
+    columns = dotpar_columns(filename,numin=numin,numax=numax)
+    names = [name for name,_,_,_ in DOTPAR_FIELDS]
+    n = len(columns['nu'])
+    if columnar:
+        col = ColumnarCollection()
+        col.__dicthash__ = ColumnStore.from_arrays(columns,list(range(n)))
+        col.maxid = n-1
+    else:
+        col = Collection()
+        values = [columns[name].tolist() for name in names]
+        col.extend(dict(zip(names,row)) for row in zip(*values))
+    col.order = names
     return col
 
 def import_fixcol(filename,*args,**kwargs):
@@ -2961,11 +6498,297 @@ def import_fixcol(filename,*args,**kwargs):
     col.import_fixcol(filename,*args,**kwargs)
     return col
 
+def fixcol_header(filename):
+    """
+    Read the //HEADER section and the tokenized mark-up of the column-fixed file.
+    Returns the header dictionary (token -> name, type and position),
+    the column names in the mark-up order, and the byte offset of the data lines.
+    """
+    TYPES = {'float':float,'int':int,'str':str}
+    
+    with open(filename,'rb') as f:
+    
+        # Search for //HEADER section.    
+        for line in iter(f.readline,b''):
+            if b'//HEADER' in line: break
+    
+        # Scan //HEADER section.     
+        HEAD = {}        
+        for line in iter(f.readline,b''):
+            line = line.decode().strip()
+            if not line: continue
+            if line[0]=='#': continue
+            if '//DATA' in line: break
+            vals = [_ for _ in line.split() if _]
+            token = vals[0]
+            if token in HEAD:
+                raise Exception('ERROR: duplicate key was found: %s'%vals[0])
+            vtype = TYPES[vals[2]] if len(vals)>2 else str           
+            HEAD[token] = {}
+            HEAD[token]['token'] = token
+            HEAD[token]['name'] = vals[1]
+            HEAD[token]['type'] = vtype # vtype
+                        
+        # Get tokenized mark-up.
+        widths = f.readline().decode().rstrip()
+        offset = f.tell()
+        
+    matches = re.finditer('([^_]+_*)',widths)
+    names = []
+    for match in matches:
+        i_start = match.start()
+        i_end = match.end()
+        token = re.sub('_','',widths[i_start:i_end])
+        if token not in HEAD: continue                
+        names.append(HEAD[token]['name'])
+        HEAD[token]['i_start'] = i_start
+        HEAD[token]['i_end'] = i_end
+        
+    return HEAD,names,offset
+    
+def fixcol_ranges(filename,offset,n):
+    """
+    Split the file starting from offset into n byte ranges aligned to the line starts.
+    """
+    size = os.path.getsize(filename)
+    bounds = [offset]
+    with open(filename,'rb') as f:
+        for i in range(1,n):
+            pos = max(offset+(size-offset)*i//n,bounds[-1])
+            f.seek(pos)
+            if pos>offset: f.readline() # move to the start of the next line
+            bounds.append(max(f.tell(),bounds[-1]))
+    bounds.append(size)
+    return [(start,end) for start,end in zip(bounds[:-1],bounds[1:]) if end>start]
+    
+NON_ASCII = re.compile(b'[^\x00-\x7f]') # bytes.isascii is not available in Python<3.7
+    
+def fixcol_columns(filename,start,end,fields,ignore=True,substitute=None,arrays=False):
+    """
+    Decode the data lines of the column-fixed file between the byte offsets
+    (till the end of file if end is None) into the list of columns.
+    Fields are given as (name,i_start,i_end,type) tuples.
+    Lines are placed into the 2D array of characters (bytes for ASCII files), 
+    from which each field is cut as a whole and converted in bulk; the values 
+    are converted one by one only in the columns having conversion problems.
+    If arrays is True, numeric columns converted in bulk are returned as numpy arrays
+    (this is used to pass the columns between processes).
+    """
+    import numpy as np
+    with open(filename,'rb') as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end-start)
+    if not NON_ASCII.search(data):
+        lines = [line.rstrip() for line in data.split(b'\n')]
+        lines = [line for line in lines if line and line.lstrip()[:1]!=b'#']
+        kind,itemtype = 'S',np.uint8
+    else:
+        lines = [line.rstrip() for line in data.decode().split('\n')]
+        lines = [line for line in lines if line and line.lstrip()[0]!='#']
+        kind,itemtype = 'U',np.uint32
+    width = max(map(len,lines),default=0)
+    chars = np.array(lines,dtype='%s%d'%(kind,max(width,1))).view(itemtype).reshape(len(lines),-1)
+    columns = []
+    for name,i_start,i_end,type_ in fields:
+        i_end = min(i_end,chars.shape[1])
+        i_start = min(i_start,i_end)
+        if i_end>i_start:
+            block = np.ascontiguousarray(chars[:,i_start:i_end])
+            strings = block.view('%s%d'%(kind,i_end-i_start)).ravel()
+            blank = ((block==32)|(block==0)).all(axis=1)
+        else:
+            strings = np.full(len(lines),'',dtype=kind+'1')
+            blank = np.ones(len(lines),dtype=bool)
+        columns.append(fixcol_decode(strings,type_,ignore,substitute,blank,arrays))
+    return columns
+    
+FIXCOL_DTYPES = {int:'int64',float:'float64'}
+    
+def fixcol_decode(strings,type_,ignore=True,substitute=None,blank=None,array=False):
+    """
+    Convert numpy array of strings (str or ASCII bytes) to the list of values of given type.
+    Conversion is done in bulk, falling back to the value-wise conversion
+    if some of the strings are not convertible. Blank strings (marked by
+    the boolean array "blank") are replaced by substitute in bulk as well.
+    If array is True, the result of the bulk conversion is returned as numpy array.
+    """
+    import numpy as np
+    if strings.dtype.kind=='S':
+        if type_ is str:
+            return [buf.decode() for buf in strings.tolist()]
+        elif type_ in FIXCOL_DTYPES:
+            convert = lambda strings: strings.astype(FIXCOL_DTYPES[type_]).tolist()
+        else:
+            convert = lambda strings: [type_(buf.decode()) for buf in strings.tolist()]
+    else:
+        if type_ is str:
+            return strings.tolist()
+        convert = lambda strings: list(map(type_,strings.tolist()))
+    if blank is None or not blank.any():
+        try:
+            if array and strings.dtype.kind=='S' and type_ in FIXCOL_DTYPES:
+                return strings.astype(FIXCOL_DTYPES[type_])
+            return convert(strings)
+        except (ValueError,OverflowError):
+            pass
+    elif ignore:
+        try:
+            values = [substitute]*len(strings)
+            rows = np.flatnonzero(~blank)
+            for row,val in zip(rows.tolist(),convert(strings[rows])):
+                values[row] = val
+            return values
+        except (ValueError,OverflowError):
+            pass
+    values = []
+    for buf in strings.tolist():
+        if type(buf) is bytes: buf = buf.decode()
+        try:
+            val = type_(buf)
+        except ValueError as e:
+            if not ignore:
+                raise Exception(e)
+            else:
+                val = substitute
+        values.append(val)
+    return values
+    
+def fixcol_check(values,strings,type_):
+    """
+    Check that the string representations convert back to the values.
+    The value-wise check is skipped for the columns where the round trip
+    is guaranteed (pure int or str columns, float columns without NaN).
+    """
+    types = set(map(type,values))-{type(None)}
+    if types<={type_} and type_ in {int,str}:
+        return
+    if types<={float} and type_ is float and all([val==val for val in values if val is not None]):
+        return
+    for trueval,strval in zip(values,strings):
+        if trueval is not None: 
+            # this should signalize if there are conversion problems
+            if trueval!=type_(strval):
+                raise Exception('conversion error: ',trueval,type_(strval)) 
+
 def import_csv(filename,*args,**kwargs):
     col = Collection()
     col.import_csv(filename,*args,**kwargs)
     return col
 
+def iter_csv(filename,chunksize=100000,**argv):
+    """
+    Read CSV file by chunks, yielding the collections of at most chunksize items,
+    so that the file of any size can be processed in constant memory.
+    Item IDs are numbered through the whole file, as in the full import.
+    Other arguments are the same as for Collection.import_csv.
+    """
+    offset = 0
+    for colnames,items in csv_chunks(filename,chunksize=chunksize,**argv):
+        if not items: continue
+        col = Collection()
+        col.maxid = offset-1
+        col.extend(items)
+        col.order = list(colnames)
+        offset += len(items)
+        yield col
+        
+def csv_chunks(filename,chunksize=None,delimiter=';',quotechar='"',header=None,duck=True,sample=1000):
+    """
+    Read CSV file by chunks of items (whole file if chunksize is None).
+    Yields (colnames,items) pairs; at least one chunk is produced, even if empty.
+    If duck is True, the converter of each column is chosen once
+    on the first "sample" lines (see duck_converter).
+    """
+    with open(filename,'r') as f:
+        reader = csv.reader(f,delimiter=delimiter,quotechar=quotechar)
+        if not header:
+            colnames = next(reader,[]) # take the first line as header (even if it's really absent)
+        else:
+            colnames = header
+        rows = reader
+        if duck:
+            head = list(it.islice(reader,sample))
+            converters = [duck_converter([vals[i] for vals in head if i<len(vals) and vals[i]!=''])
+                for i in range(len(colnames))]
+            rows = it.chain(head,reader)
+        nchunks = 0
+        items = []
+        for vals in rows:
+            if duck:
+                item = {colname:conv(val) for colname,conv,val in zip(colnames,converters,vals) if val!=''}
+            else:
+                item = {colname:val for colname,val in zip(colnames,vals) if val!=''}
+            items.append(item)
+            if chunksize and len(items)>=chunksize:
+                yield colnames,items
+                nchunks += 1
+                items = []
+        if items or not nchunks:
+            yield colnames,items
+            
+DUCK_BOOLS = {'f':False,'false':False,'.false.':False,'t':True,'true':True,'.true.':True}
+
+def duck_value(val):
+    """
+    Duck typing of the string value: int, float, bool, or the string as is.
+    """
+    try:
+        return int(val)
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        pass
+    return DUCK_BOOLS.get(val.strip().lower(),val)
+    
+def duck_int(val):
+    try:
+        return int(val)
+    except ValueError:
+        return duck_value(val)
+        
+def duck_float(val):
+    try:
+        num = float(val)
+    except ValueError:
+        return duck_value(val)
+    if num.is_integer(): # still can be an integer literal
+        try:
+            return int(val)
+        except ValueError:
+            pass
+    return num
+    
+def duck_bool(val):
+    flag = DUCK_BOOLS.get(val.strip().lower())
+    return duck_value(val) if flag is None else flag
+    
+def duck_str(val):
+    # only the strings starting like numbers or booleans need the duck typing
+    char = val.lstrip()[:1]
+    if char.isdigit() or char in '+-.iInNtTfF':
+        return duck_value(val)
+    return val
+    
+def duck_converter(values):
+    """
+    Choose the duck typing converter for the column by the sample of its values.
+    All converters give the same results as duck_value, but do less work
+    on the values of the expected type.
+    """
+    types = set(map(type,map(duck_value,values)))
+    if not types:
+        return duck_value
+    elif types=={int}:
+        return duck_int
+    elif types<={int,float}:
+        return duck_float
+    elif types=={bool}:
+        return duck_bool
+    else:
+        return duck_str
+
 def export_to_hapi_cache(col,table_name,LOCAL_TABLE_CACHE,HITRAN_DEFAULT_HEADER):
     def append_par(table,parname,parvalue):
         if parname not in table:
@@ -2977,13 +6800,65 @@ def export_to_hapi_cache(col,table_name,LOCAL_TABLE_CACHE,HITRAN_DEFAULT_HEADER)
         for key in item:
             append_par(LOCAL_TABLE_CACHE[table_name]['data'],key,item[key])
 
-## export HITRAN .par file from a collection
-#def export_dotpar(col,filename):
-#    with open(filename,'w') as f:
-#        for id in col.ids():
-#            item = col.__dicthash__[id] # not compatible with future versions
-#            line = dump_dotpar(item)
-#            f.write(line+'\n')
+# .par field formats (fields marked with "*" drop the leading zero, like Fortran does)
+DOTPAR_FORMATS = {
+    'molec_id': '%2d',
+    'local_iso_id': '%1X',
+    'nu': '%12.6f',
+    'sw': '%10.3E',
+    'a': '%10.3E',
+    'gamma_air': '*%5.4f',
+    'gamma_self': '*%5.3f',
+    'elower': '%10.4f',
+    'n_air': '*%4.2f',
+    'delta_air': '*%8.6f',
+    'global_upper_quanta': '%15s',
+    'global_lower_quanta': '%15s',
+    'local_upper_quanta': '%15s',
+    'local_lower_quanta': '%15s',
+    'ierr': '%6s',
+    'iref': '%12s',
+    'gp': '%8.1f',
+    'gpp': '%7.1f',
+}
+
+def fortran_fixed(values,fmt):
+    """
+    Format the column of floats, dropping the leading zero 
+    if the number doesn't fit into the field width (e.g. .0594 instead of 0.0594).
+    Numbers which don't fit into the field even so raise an exception.
+    """
+    width = int(fmt[1:].split('.')[0])
+    strings = list(map(fmt.__mod__,values))
+    for i,st in enumerate(strings):
+        if len(st)<=width: continue
+        if st.startswith('0.'):
+            st = st[1:]
+        elif st.startswith('-0.'):
+            st = '-'+st[2:]
+        if len(st)>width:
+            raise Exception('value %s does not fit into the format %s'%(repr(values[i]),fmt))
+        strings[i] = st
+    return strings
+
+def export_dotpar(col,filename,append=False):
+    """
+    Export collection to HITRAN .par file.
+    Columns are extracted and formatted as a whole, 
+    and each line is assembled by a single format operation.
+    """
+    names = [name for name,_,_,_ in DOTPAR_FIELDS]
+    cols = col.getcols(names)
+    fmt = ''
+    for i,name in enumerate(names):
+        field_fmt = DOTPAR_FORMATS[name]
+        if field_fmt.startswith('*'):
+            cols[i] = fortran_fixed(cols[i],field_fmt[1:])
+            fmt += '%s'
+        else:
+            fmt += field_fmt
+    with open(filename,'a' if append else 'w') as f:
+        f.writelines(fmt%row+'\n' for row in zip(*cols))
                 
 def create_from_buffer(colname,buffer,rstrip=True,lstrip=True,cast=lambda val:val,comment=[]):
     """
@@ -3000,7 +6875,7 @@ def create_from_buffer(colname,buffer,rstrip=True,lstrip=True,cast=lambda val:va
         val = cast(val)
         items.append({colname:val})
     col = Collection()
-    col.update(items)
+    col.extend(items)
     return col
     
 def create_from_buffer_multicol(buffer,cast={},duck=True,header=True,comment=[]):
@@ -3048,12 +6923,120 @@ def create_from_buffer_multicol(buffer,cast={},duck=True,header=True,comment=[])
     
     # Create collection from the list of items.
     col = Collection()
-    col.update(items)
+    col.extend(items)
     col.order = names
     
     return col
   
-def join_index(idx1,idx2,inner=True):
+class JoinIndex:
+    """
+    Compact join index: two parallel lists of the IDs of the joined items
+    (None marks the missing side in the outer joins).
+    Behaves as the list of the (id1,id2) pairs.
+    """
+    
+    def __init__(self,ids1=None,ids2=None):
+        self.ids1 = [] if ids1 is None else ids1
+        self.ids2 = [] if ids2 is None else ids2
+        
+    def __len__(self):
+        return len(self.ids1)
+        
+    def __iter__(self):
+        return zip(self.ids1,self.ids2)
+        
+    def __getitem__(self,i):
+        if type(i) is slice:
+            return JoinIndex(self.ids1[i],self.ids2[i])
+        return self.ids1[i],self.ids2[i]
+        
+    def __eq__(self,other):
+        if isinstance(other,JoinIndex):
+            return self.ids1==other.ids1 and self.ids2==other.ids2
+        return list(self)==[tuple(pair) for pair in other]
+        
+    def __ne__(self,other):
+        return not self==other
+        
+    def __add__(self,other):
+        idx = JoinIndex(list(self.ids1),list(self.ids2))
+        idx.extend(other)
+        return idx
+        
+    def __radd__(self,other):
+        return JoinIndex().__add__(other).__add__(self)
+        
+    def __iadd__(self,other):
+        self.extend(other)
+        return self
+        
+    def __repr__(self):
+        return 'JoinIndex(%d pairs)'%len(self)
+        
+    def append(self,pair):
+        id1,id2 = pair
+        self.ids1.append(id1)
+        self.ids2.append(id2)
+        
+    def extend(self,pairs):
+        if isinstance(pairs,JoinIndex):
+            self.ids1 += pairs.ids1
+            self.ids2 += pairs.ids2
+        else:
+            for pair in pairs:
+                self.append(pair)
+                
+    def swap(self):
+        """
+        Get the join index with the sides exchanged.
+        """
+        return JoinIndex(self.ids2,self.ids1)
+
+def join_mode(inner,how):
+    """
+    Get the join mode ('inner', 'left', 'right' or 'full').
+    Legacy flag inner=False means the full outer join.
+    """
+    if how is None:
+        return 'inner' if inner else 'full'
+    if how not in {'inner','left','right','full'}:
+        raise Exception('unknown join mode: %s'%how)
+    return how
+
+def hash_join(build,probe,probe_outer=False,build_outer=False):
+    """
+    Hash join of the streamed (ID,key) pairs of the probe side
+    with the group index {key:[IDs]} of the build side.
+    Unmatched probe IDs are added if probe_outer is True,
+    unmatched build IDs are added if build_outer is True.
+    Returns the parallel lists of the probe and build IDs.
+    """
+    probe_ids = []; build_ids = []
+    unmatched = []
+    matched = set()
+    get = build.get
+    for ID,key in probe:
+        bucket = get(key)
+        if bucket is None:
+            if probe_outer: unmatched.append(ID)
+            continue
+        if len(bucket)==1:
+            probe_ids.append(ID)
+            build_ids.append(bucket[0])
+        else:
+            probe_ids += [ID]*len(bucket)
+            build_ids += bucket
+        if build_outer: matched.add(key)
+    probe_ids += unmatched
+    build_ids += [None]*len(unmatched)
+    if build_outer:
+        for key,bucket in build.items():
+            if key not in matched:
+                probe_ids += [None]*len(bucket)
+                build_ids += bucket
+    return probe_ids,build_ids
+
+def join_index(idx1,idx2,inner=True,how=None):
     """ 
     
     ALTERNATIVE VERSION, WITH GROUP INDEXES INSTEAD OF COLLECTIONS
@@ -3067,45 +7050,35 @@ def join_index(idx1,idx2,inner=True):
         Flag to perform the inner join. 
         If False, outer join is performed.
         
+    How:
+        Join mode: 'inner', 'left', 'right' or 'full' (overrides inner).
+        
     Output:
-        Join index which is a list of ID pars (id1,id2) with
-        id1 from col1 and id2 from col2.
+        Join index (see JoinIndex) with pairs (id1,id2),
+        id1 from col1 and id2 from col2. Matched pairs go first
+        in the order of idx1, then unmatched IDs of col1 and col2.
     """    
-                    
-    def unroll(ids1,ids2): # unroll to list of pairs
-        pairs = []
-        for id1 in ids1:
-            for id2 in ids2:
-                pairs.append((id1,id2))
-        return pairs
-        
-    # Calculate sets of indexvalues.
-    keys1 = set(idx1.keys())
-    keys2 = set(idx2.keys())
-    
-    # Prepare intersection for the inner part of join.
-    keys_union = keys1.intersection(keys2)
-    
-    # Start forming the join index.
-    idx = ft.reduce(lambda x,y:x+y,
-        [unroll(idx1[k],idx2[k]) for k in keys_union])
-    
-    # If performing outer join, add symmetric difference set to it.
-    if not inner:
-        keys_diff_12 = keys1-keys2
-        keys_diff_21 = keys2-keys1
-        
-        if keys_diff_12:
-            idx += ft.reduce(lambda x,y:x+y,
-                [unroll(idx1[k],[None]) for k in keys_diff_12])
-
-        if keys_diff_21:
-            idx += ft.reduce(lambda x,y:x+y,
-                [unroll([None],idx2[k]) for k in keys_diff_21])
-            
-    return idx
+    how = join_mode(inner,how)
+    ids1 = []; ids2 = []
+    for key,bucket1 in idx1.items():
+        bucket2 = idx2.get(key)
+        if bucket2 is None: continue
+        for id1 in bucket1:
+            ids1 += [id1]*len(bucket2)
+            ids2 += bucket2
+    if how in {'left','full'}:
+        for key,bucket1 in idx1.items():
+            if key not in idx2:
+                ids1 += bucket1
+                ids2 += [None]*len(bucket1)
+    if how in {'right','full'}:
+        for key,bucket2 in idx2.items():
+            if key not in idx1:
+                ids1 += [None]*len(bucket2)
+                ids2 += bucket2
+    return JoinIndex(ids1,ids2)
   
-def create_join_index(col1,col2,key,key2=None,inner=True):
+def create_join_index(col1,col2,key,key2=None,inner=True,how=None):
     """ 
     Join two collections by key and additional conditions.
     
@@ -3120,9 +7093,16 @@ def create_join_index(col1,col2,key,key2=None,inner=True):
         Flag to perform the inner join. 
         If False, outer join is performed.
         
+    How:
+        Join mode: 'inner', 'left', 'right' or 'full' (overrides inner).
+        
     Output:
-        Join index which is a list of ID pars (id1,id2) with
+        Join index (see JoinIndex) with pairs (id1,id2),
         id1 from col1 and id2 from col2.
+        
+    The hash join is used: the smaller collection is grouped,
+    and the keys of the larger one are streamed against it.
+    Matched pairs go first in the order of the larger collection.
     """    
             
     def prepare_key(key): # convert key to lambda form
@@ -3136,20 +7116,31 @@ def create_join_index(col1,col2,key,key2=None,inner=True):
             raise Exception('unknown key format: %s'%str(key))
         return key
         
+    def prepare_group_key(key): # plain column names are grouped by the collection (can use index)
+        if type(key) is str and len(key.split())==1 and key!='__ID__':
+            return key
+        return prepare_key(key)
+        
     # Prepare keys and convert them to the lambda function format.
-    key = prepare_key(key)
+    key = prepare_group_key(key)
     if key2:
-        key2 = prepare_key(key2)
+        key2 = prepare_group_key(key2)
     else:
         key2 = key
         
-    # Calculate indexes for both collections.
-    idx1 = col1.group(key)
-    idx2 = col2.group(key2)
-    
-    idx = join_index(idx1,idx2,inner=inner)
+    how = join_mode(inner,how)
+    left = how in {'left','full'}
+    right = how in {'right','full'}
+        
+    # Group the smaller collection and stream the larger one.
+    if len(col1)>=len(col2):
+        idx2 = col2.group(key2)
+        ids1,ids2 = hash_join(idx2,col1.__group_pairs__(key),left,right)
+    else:
+        idx1 = col1.group(key)
+        ids2,ids1 = hash_join(idx1,col2.__group_pairs__(key2),right,left)
     
-    return idx
+    return JoinIndex(ids1,ids2)
 
 def join(col1,col2,idx,colnames1=lambda c:c,colnames2=lambda c:'_%s'%c):
     """
@@ -3163,89 +7154,89 @@ def join(col1,col2,idx,colnames1=lambda c:c,colnames2=lambda c:'_%s'%c):
     col.order = [colnames1(c) for c in col1.order] + \
                 [colnames2(c) for c in col2.order]
     
-    for id1,id2 in idx:
-        item = {}
-        if id1 is not None:
-            item1 = col1.getitem(id1)
-            for c in item1:
-                c_ = colnames1(c)
-                item[c_] = item1[c]
-        if id2 is not None:
-            item2 = col2.getitem(id2)
-            for c in item2:
-                c_ = colnames2(c)
-                if c_ in item:
-                    raise Exception('column conflict at join: %s'%c_)
-                else:
-                    item[c_] = item2[c]
-        col.update(item)
+    def joined():
+        for id1,id2 in idx:
+            item = {}
+            if id1 is not None:
+                item1 = col1.getitem(id1)
+                for c in item1:
+                    c_ = colnames1(c)
+                    item[c_] = item1[c]
+            if id2 is not None:
+                item2 = col2.getitem(id2)
+                for c in item2:
+                    c_ = colnames2(c)
+                    if c_ in item:
+                        raise Exception('column conflict at join: %s'%c_)
+                    else:
+                        item[c_] = item2[c]
+            yield item
+    col.extend(joined())
     
     return col
 
-def join_index_(*gidxs,inner=True):
+def join_index_(*gidxs,inner=True,lazy=False,presorted=False):
     """ multi-collection version of join_index
     
     Join many collections by key and additional conditions.
     
     gidxs:
-        group indexes (dicts)
+        group indexes (dicts) or sorted indexes (see SortedIndex).
+        Keys must be mutually comparable, except None keys,
+        which are joined with each other and go first.
             
     Inner: 
         Flag to perform the inner join. 
         If False, outer join is performed.
         
+    Lazy:
+        If True, the join index is yielded by the generator
+        (e.g. to stream it through join_ or compare).
+        
+    Presorted:
+        If True, keys of the group indexes are already sorted.
+        
     Output:
         Join index which is a list of ID pars (id1,id2, ...idn) 
     """    
     
-    def get_next(it): # get next value of an iterator
-        return next(it,None)
-        
-    def get_ids(keys,gidxs): # get collection ids from a key tuple
-        return [idx[key] if key is not None else [None] for key,idx in zip(keys,gidxs)]
-    
-    def cproduct(lists): # cartesian product of lists
-        return it.product(*lists)
-    
-    def check_inner(flags):
-        return all(flags)
-
-    def check_outer(flags):
-        return any(flags)
-    
-    def iterate(iters,check): # keys must not be None!!!
-        curkeys = [get_next(it) for it in iters]
-        keyss = []
-        while True:
-            #print('curkeys>>>',curkeys)
-            if all([k is None for k in curkeys]):
-                break
-            minkey = min([k for k in curkeys if k is not None])
-            flags = [k==minkey for k in curkeys]
-            if check(flags):
-                keys = [minkey if f else None for f in flags]
-                keyss.append([minkey,keys])
-            curkeys = [get_next(it) if f else k for k,f,it in zip(curkeys,flags,iters)]
-        #print('keyss>>>',keyss)
-        return keyss
-    
-    iterate_inner = lambda key_iterators: iterate(key_iterators,check=check_inner)
-    iterate_outer = lambda key_iterators: iterate(key_iterators,check=check_outer)
-            
-    key_iterators = [iter(sorted(idx.keys())) for idx in gidxs]
-    
-    if inner:
-        meta_iterator = iterate_inner(key_iterators)
-    else:
-        meta_iterator = iterate_outer(key_iterators)
+    def get_runs(gidx): # iterator of (key,IDs) in the order of keys
+        if isinstance(gidx,SortedIndex):
+            return gidx.runs()
+        if presorted:
+            return iter(gidx.items())
+        keys = [key for key in gidx if key is not None]
+        keys.sort()
+        if None in gidx: keys.insert(0,None)
+        return ((key,gidx[key]) for key in keys)
+        
+    def push(heap,runs,i): # push the next key of i-th index to the heap
+        for key,ids in runs[i]:
+            heapq.heappush(heap,((key is not None,key),i,ids))
+            break
+    
+    def iterate(runs,inner): # heap-based k-way merge of the sorted keys
+        heap = []
+        for i in range(len(runs)):
+            push(heap,runs,i)
+        while heap:
+            sortkey,i,ids = heapq.heappop(heap)
+            group = [None]*len(runs)
+            group[i] = ids
+            popped = [i]
+            while heap and heap[0][0]==sortkey:
+                _,i,ids = heapq.heappop(heap)
+                group[i] = ids
+                popped.append(i)
+            if not inner or len(popped)==len(runs):
+                for i_ in it.product(*[ids if ids is not None else [None] for ids in group]):
+                    yield [sortkey[1],i_]
+            for i in popped:
+                push(heap,runs,i)
+                
+    jidx = iterate([get_runs(gidx) for gidx in gidxs],inner)
     
-    jidx = []
-    for val,keys in meta_iterator:
-        ids = get_ids(keys,gidxs)
-        jidx_ = cproduct(ids)
-        jidx += [[val,i] for i in jidx_]
-            
-    return jidx
+    return jidx if lazy else list(jidx)
 
 #def create_join_index_(cols,keys,inner=True):
 #    """ multi-collection version of create_join_index """
@@ -3253,44 +7244,101 @@ def join_index_(*gidxs,inner=True):
 #    idx = join_index_(idxs,inner=inner)
 #    return idx
 
-def join_(jkey,jidx,*cols):
+class JoinStore(Mapping):
+    """
+    Read-only item storage of the lazy join (see join_).
+    Joined items are resolved from the source collections on access,
+    and are returned as the read-only mappings.
+    """
+    
+    def __init__(self,init_item,jidx,cols):
+        self.__init_item__ = init_item
+        self.__entries__ = jidx if type(jidx) is list else list(jidx)
+        self.__cols__ = cols
+        
+    def __getitem__(self,ID):
+        if not self.__contains__(ID):
+            raise KeyError(ID)
+        jval,keys = self.__entries__[ID]
+        item = self.__init_item__(jval)
+        for ID_,col in zip(keys,self.__cols__):
+            if ID_ is not None:
+                item.update(col.__dicthash__[ID_])
+        return types.MappingProxyType(item)
+        
+    def __contains__(self,ID):
+        return type(ID) is int and 0<=ID<len(self.__entries__)
+        
+    def __iter__(self):
+        return iter(range(len(self.__entries__)))
+        
+    def __len__(self):
+        return len(self.__entries__)
+        
+    def __repr__(self):
+        return 'JoinStore(%d items)'%len(self)
+
+def join_(jkey,jidx,*cols,view=False,batchsize=10000):
     """ 
     Multi-collection version of join.
     Inputs: 
         jkey -> name of join key (i.e. where to store keyvals of jidx)
                 can also be a list/tuple of names with the same length
                 as keys of jidx.
-        jidx -> join index produced by join_index_()
+        jidx -> join index produced by join_index_() (can be lazy)
         cols -> columns to join.
+        view -> if True, joined items are not copied, but resolved 
+                on access (see JoinStore); such collection is read-only.
+        batchsize -> number of joined items added at once.
+    Column conflicts are checked once by the column names of the collections.
     To reduce/rename column keys now one must use
     slice and map collection methods respectively.
     """
 
     col_join = Collection()
     
-    col_join.order = ft.reduce(lambda x,y: x+y,[c.order for c in cols])
+    col_join.order = ft.reduce(lambda x,y: x+y,[list(c.order) for c in cols])
     
     if type(jkey) is str:
         init_item = lambda jval: {jkey:jval}
         col_join.order = [jkey] + col_join.order
+        keys_join = [jkey]
     elif type(jkey) in {tuple,list}:
         init_item = lambda jval: {k:v for k,v in zip(jkey,jval)}
         col_join.order = list(jkey) + col_join.order
+        keys_join = list(jkey)
     else:
         raise Exception('jkey must be either string, list or tuple')
-            
-    for jval,keys in jidx:        
-        item = init_item(jval)
-        for ID,col in zip(keys,cols):
-            if ID is None:
-                continue
-            item_ = col.getitem(ID)
-            for k in item_:
-                if k in item:
-                    raise Exception('column conflict at join: %s'%k)
-                else:
-                    item[k] = item_[k]
-        col_join.update(item)
+        
+    # check column conflicts on the schema level
+    keys_seen = set(keys_join)
+    for col in cols:
+        if isinstance(col.__dicthash__,ColumnStore):
+            keys = col.keys()
+        else:
+            keys = set()
+            for item in col.__dicthash__.values():
+                keys.update(item)
+        for k in keys:
+            if k in keys_seen:
+                raise Exception('column conflict at join: %s'%k)
+        keys_seen.update(keys)
+        
+    if view:
+        col_join.__dicthash__ = JoinStore(init_item,jidx,cols)
+        col_join.maxid = len(col_join.__dicthash__)-1
+        return col_join
+    
+    # fill the joined collection by batches
+    dicthashes = [col.__dicthash__ for col in cols]
+    def joined():
+        for jval,keys in jidx:
+            item = init_item(jval)
+            for ID,dicthash in zip(keys,dicthashes):
+                if ID is not None:
+                    item.update(dicthash[ID])
+            yield item
+    col_join.extend(joined(),chunksize=batchsize) # items are new, no need to copy
     
     return col_join
 
@@ -3298,7 +7346,39 @@ def join_(jkey,jidx,*cols):
 # ADVANCED COMPARISON OF TWO COLLECTIONS #
 ##########################################
 
-def compare(col1,col2,join_by=None,compfuncs=None):
+def compare_columns(col,IDs):
+    """
+    Prepare the column gatherer of the collection for the IDs 
+    of the join index (see compare). Returned function gives the 
+    values (numpy array) and presence mask of the column by its name;
+    None IDs (outer join) correspond to the missing items.
+    """
+    import numpy as np
+    store = col.__dicthash__
+    n = len(IDs)
+    if isinstance(store,ColumnStore):
+        present = np.array([ID is not None for ID in IDs],dtype=bool)
+        rows = store.__rows__([ID for ID in IDs if ID is not None])
+        def gather(key):
+            values = np.empty(n,dtype=object)
+            mask = np.zeros(n,dtype=bool)
+            if key in store.columns():
+                column = store.column(key)
+                data = column.data[rows]
+                if data.dtype!=object:
+                    values = np.zeros(n,dtype=data.dtype)
+                values[present] = data
+                mask[present] = column.mask[rows]
+            return values,mask
+    else:
+        items = [store[ID] if ID is not None else {} for ID in IDs]
+        def gather(key):
+            mask = np.fromiter((key in item for item in items),dtype=bool,count=n)
+            values = object_array([item.get(key) for item in items])
+            return values,mask
+    return gather
+
+def compare(col1,col2,join_by=None,compfuncs=None,atol=None,rtol=None):
     """
     ARGUMENTS:
 
@@ -3306,6 +7386,8 @@ def compare(col1,col2,join_by=None,compfuncs=None):
 
         join_by - parameter defining join mode:
             join_by is a list: using "indexed" join; axcepting output of join_index_
+                (also lazy one, the join index is passed only once)
+            join_by is a JoinIndex: using pairs of IDs from join_index/create_join_index
             join_by is a string/lambda: using the key join
             join_by is None: using "plain" join
            
@@ -3331,6 +7413,15 @@ def compare(col1,col2,join_by=None,compfuncs=None):
         
             N.B.4: there are also additional default comparison function for the numeric columns,
                 which is maximal absolute difference ("MADIFF")
+                
+            N.B.5: comparison functions receive numpy arrays of the values 
+                (numeric for the numeric columns, and object arrays otherwise)
+                
+        atol,rtol - absolute and relative tolerances; if any of them is given,
+            number of the numeric values equal within the tolerance is counted ("NCLOSE"),
+            i.e. abs(val1-val2) <= atol + rtol*abs(val2)
+            
+    Columns are gathered through the join index once and compared with numpy.
     
     HOW TO JOIN TWO COLLECTIONS: 
         grpi1 = col1.group('a')
@@ -3343,9 +7434,6 @@ def compare(col1,col2,join_by=None,compfuncs=None):
         compare(col1,col2) # using default "plain" join, i.e. by __ID__
     """
     
-    # change this later to use the JoinIndex type instead of type(None)
-    assert type(join_by) in {list,str,type(None),type(lambda: None)}
-    
     if compfuncs is None: compfuncs = dict()
     
     # prepare key for plain join
@@ -3356,10 +7444,25 @@ def compare(col1,col2,join_by=None,compfuncs=None):
     if type(join_by) in {str,type(lambda: None)}:
         grpi1 = col1.group(join_by)
         grpi2 = col2.group(join_by)
-        join_by = join_index_(grpi1,grpi2,inner=True)
+        join_by = join_index_(grpi1,grpi2,inner=True,lazy=True)
+        
+    import numpy as np
     
-    # define incremental aggregate comparison functions (NEQ,MADIFF)
-    MADIFF = lambda vals1,vals2: max([abs(val1-val2) for val1,val2 in zip(vals1,vals2)])
+    # get the ID lists of the join index
+    if isinstance(join_by,JoinIndex):
+        ids1,ids2 = join_by.ids1,join_by.ids2
+    else:
+        ids1 = []; ids2 = []
+        for _,(id1,id2) in join_by:
+            ids1.append(id1)
+            ids2.append(id2)
+    gather1 = compare_columns(col1,ids1)
+    gather2 = compare_columns(col2,ids2)
+    
+    # define aggregate comparison functions (MADIFF,NCLOSE)
+    MADIFF = lambda vals1,vals2: np.abs(vals1-vals2).max().item()
+    NCLOSE = lambda vals1,vals2: int(np.isclose(vals1,vals2,rtol=rtol or 0,atol=atol or 0).sum())
+    tolerance = atol is not None or rtol is not None
     
     # get type headers for the collections
     typehead1 = col1.types if col1.types is not None else col1.get_types()
@@ -3379,28 +7482,25 @@ def compare(col1,col2,join_by=None,compfuncs=None):
     #keys = set(typehead1).union(typehead2) # order of keys is chaotic
     keys = [k for k in typehead1]; keys += [k for k in typehead2 if k not in typehead1] # preserving order of keys
     for key in keys:
-        # go through join index
-        n_first_and_second_tot = 0
-        n_first_and_second_eq = 0
-        n_first_minus_second = 0
-        n_second_minus_first = 0
-        vals1 = []
-        vals2 = []
-        for _,ids in join_by:
-            id1,id2 = ids
-            v1 = col1.getitem(id1)
-            v2 = col2.getitem(id2)
-            if key in v1 and key in v2:
-                val1 = v1[key]
-                val2 = v2[key]
-                vals1.append(val1)
-                vals2.append(val2)
-                n_first_and_second_tot += 1             
-                if val1==val2: n_first_and_second_eq += 1
-            elif key in v1 and key not in v2:
-                n_first_minus_second += 1
-            elif key not in v1 and key in v2:
-                n_second_minus_first += 1                    
+        # gather the columns through join index
+        vals1,mask1 = gather1(key)
+        vals2,mask2 = gather2(key)
+        both = mask1&mask2
+        vals1 = vals1[both]
+        vals2 = vals2[both]
+        numeric_types = {int,float,Collection.MIXED} # mixed int/float values are numeric too
+        numeric = typehead1.get(key) in numeric_types and typehead2.get(key) in numeric_types
+        if numeric:
+            if vals1.dtype==object: vals1 = np.array(vals1.tolist())
+            if vals2.dtype==object: vals2 = np.array(vals2.tolist())
+            numeric = vals1.dtype.kind in 'iuf' and vals2.dtype.kind in 'iuf' # long integers are objects
+        n_first_and_second_tot = int(both.sum())
+        if numeric:
+            n_first_and_second_eq = int((vals1==vals2).sum())
+        else:
+            n_first_and_second_eq = sum([1 for val1,val2 in zip(vals1.tolist(),vals2.tolist()) if val1==val2])
+        n_first_minus_second = int((mask1&~mask2).sum())
+        n_second_minus_first = int((~mask1&mask2).sum())
         # initialize stat item
         item = {
             'name': key,
@@ -3412,9 +7512,10 @@ def compare(col1,col2,join_by=None,compfuncs=None):
         }
         if key in typehead1: item['type(1)'] = typehead1[key].__name__
         if key in typehead2: item['type(2)'] = typehead2[key].__name__
-        # set results for MADIFF
-        if typehead1[key] in {int,float} and typehead1[key] in {int,float} and len(vals1)>0:
+        # set results for MADIFF and NCLOSE
+        if numeric and len(vals1)>0:
             item['madiff(1&2)'] = MADIFF(vals1,vals2)
+            if tolerance: item['nclose(1&2)'] = NCLOSE(vals1,vals2)
         # set results for custom comparison functions
         if key in keyfuncs:
             for funcname in keyfuncs[key]:
@@ -3425,6 +7526,7 @@ def compare(col1,col2,join_by=None,compfuncs=None):
         stat.__dicthash__[key] = item
         
     stat.order = 'name eq type(1) type(2) n(1-2) n(2-1) ntot(1&2) neq(1&2) madiff(1&2)'.split()
+    if tolerance: stat.order.append('nclose(1&2)')
     stat.order += list(compfuncs)
     
     return stat
@@ -3434,18 +7536,104 @@ def compare(col1,col2,join_by=None,compfuncs=None):
 # SHOULD CORRECTLY COMPARE NESTED STRUCTURES OF DICTS ################
 ######################################################################
 
-def diff(D1,D2):
+def struct_hash(obj,cache=None):
+    """
+    Structural digest of the nested structure of dicts, lists, tuples and sets.
+    Returns the pair (digest,exact). Scalars are represented by their canonical
+    encoding, where equal numbers (1, 1.0, True) are encoded alike; containers 
+    by the 128-bit BLAKE2 hash of the encodings of their elements,
+    independent of the order for dicts and sets.
+    If exact is True, the structure consists only of the built-in containers, 
+    numbers, strings and None, and the structures are equal if and only if 
+    their digests are equal (up to the hash collisions, which are negligible
+    for 128 bits, and NaN which is equal to itself here).
+    Other objects are encoded by their identity, so exact is False for them.
+    Digests of the containers are cached by the object id,
+    so the cache must not outlive the objects and they must not change.
+    """
+    tp = type(obj)
+    if tp is str:
+        data = obj.encode('utf-8','surrogatepass')
+        return b's%d:'%len(data)+data,True
+    if tp is int or tp is bool:
+        return b'n%d;'%obj,True
+    if obj is None:
+        return b'N',True
+    if isinstance(obj,float):
+        if obj.is_integer():
+            return b'n%d;'%obj,True
+        return b'n%r;'%float(obj),True
+    if isinstance(obj,numbers.Integral):
+        return b'n%d;'%int(obj),True
+    cached = cache is not None and tp in STRUCT_CONTAINERS
+    if cached:
+        h = cache.get(id(obj))
+        if h is not None: return h
+    exact = True
+    if isinstance(obj,Mapping):
+        parts = []
+        for key,val in obj.items():
+            hk,ek = struct_hash(key,cache)
+            hv,ev = struct_hash(val,cache)
+            parts.append(hk+hv)
+            exact = exact and ek and ev
+        parts.sort()
+        tag = b'd'
+    elif tp in STRUCT_CONTAINERS:
+        parts = []
+        for val in obj:
+            hv,ev = struct_hash(val,cache)
+            parts.append(hv)
+            exact = exact and ev
+        if tp is set or tp is frozenset:
+            parts.sort()
+        tag = STRUCT_CONTAINERS[tp]
+    else:
+        parts = [tp.__qualname__.encode(),b'%d'%id(obj)]
+        exact = False
+        tag = b'o'
+    h = b'#'+hashlib.blake2b(tag+b''.join(parts),digest_size=16).digest(),exact
+    if cached: cache[id(obj)] = h
+    return h
+    
+STRUCT_CONTAINERS = {dict:b'd',list:b'l',tuple:b't',set:b'S',frozenset:b'S'} # see struct_hash
+
+def struct_equal(e1,e2,cache):
+    """
+    Check equality of two structures by their digests (see struct_hash):
+    equal digests mean the equal structures, so the subtrees are skipped in O(1)
+    once their digests are cached (and the same objects are skipped right away).
+    Different digests are confirmed by "==" only if the structures 
+    contain objects other than the built-in containers and scalars.
+    """
+    if e1 is e2:
+        return True
+    h1,exact1 = struct_hash(e1,cache)
+    h2,exact2 = struct_hash(e2,cache)
+    if h1==h2:
+        return True
+    if exact1 and exact2:
+        return False
+    return e1==e2
+
+def diff(D1,D2,cache=None):
     """
     Recursvely compare two nested structures consisting of dict
     objects. These objects should contain elements which are comparable,
     i.e. supporting the "==" operation.
-    The result of the diff is ??????
+    The result of the diff is the dictionary with optional parts:
+        'left': {key:value} for the keys present only in D1,
+        'right': {key:value} for the keys present only in D2,
+        'center': {key:change} for the common keys having different values,
+            where change is the nested diff if both values are dicts,
+            or the pair (value1,value2) otherwise.
+    Empty dictionary means that the structures are equal.
+    Subtrees are compared by the cached structural digests (see struct_equal),
+    so the equal branches are skipped and the differing ones are found without full comparison.
+    The hash cache can be shared between the calls on the same objects.
     """
-    raise NotImplementedError
-    # get keys of data structures
-    keys1 = data1.keys()
-    keys2 = data2.keys()  
-      
+    if cache is None: cache = {}
+    
     # get three different areas of comparison:
     #  a) D1 minus D2 
     #  b) D2 minus D1
@@ -3453,22 +7641,84 @@ def diff(D1,D2):
     
     output = {}
     
-    D1_minus_D2 = set(D1)-set(D2) # always part of output
-    if D1_minus_D2: output['left'] = {D1[key] for key in D1_minus_D2}
+    if struct_equal(D1,D2,cache): return output
     
-    D2_minus_D1 = set(D2)-set(D1) # always part of output
-    if D2_minus_D1: output['right'] = {D2[key] for key in D2_minus_D1}
+    D1_minus_D2 = [key for key in D1 if key not in D2] # always part of output
+    if D1_minus_D2: output['left'] = {key:D1[key] for key in D1_minus_D2}
     
-    D1_intersect_D2 = set(D1).intersect(D2) # part of output if there are 
-    center = {}
-    for key in D1_intersect_D2:
+    D2_minus_D1 = [key for key in D2 if key not in D1] # always part of output
+    if D2_minus_D1: output['right'] = {key:D2[key] for key in D2_minus_D1}
+    
+    center = {} # part of output if there are different values
+    for key in D1:
+        if key not in D2: continue
         e1 = D1[key]
         e2 = D2[key]
-        if type(e1)==dict and type(e2)==dict:
-            out = diff(e1,e2)
-            if out: center[key] = out
-        elif type(e1)==dict and type(e2)!=dict:
-            out = {}
+        if struct_equal(e1,e2,cache): continue
+        if isinstance(e1,Mapping) and isinstance(e2,Mapping):
+            center[key] = diff(e1,e2,cache)
+        else:
+            center[key] = (e1,e2)
+    if center: output['center'] = center
+    
+    return output
+    
+def diff_paths(D,prefix=()):
+    """
+    Flatten the result of diff to the lists of added, removed and changed 
+    paths (tuples of keys), taking the first structure as the old one.
+    """
+    added = [prefix+(key,) for key in D.get('right',{})]
+    removed = [prefix+(key,) for key in D.get('left',{})]
+    changed = []
+    for key,change in D.get('center',{}).items():
+        if type(change) is tuple:
+            changed.append(prefix+(key,))
+        else:
+            added_,removed_,changed_ = diff_paths(change,prefix+(key,))
+            added += added_; removed += removed_; changed += changed_
+    return added,removed,changed
+    
+def diff_collection(col1,col2,join_by=None):
+    """
+    Get the change-set between the old (col1) and new (col2) collections.
+    Items are matched by join_by, which is a column name, list of names 
+    or lambda function (see Collection.group); by default items are matched by IDs.
+    Keys must be unique in both collections.
+    Output is a collection of the changed items:
+        {'key':..., 'change':'removed'} for items present only in col1,
+        {'key':..., 'change':'added'} for items present only in col2,
+        {'key':..., 'change':'changed', 'added':[...], 'removed':[...], 'changed':[...]}
+            for the items with different contents, with lists of paths (see diff_paths).
+    """
+    if join_by is None:
+        join_by = '__ID__'
+    grpi1 = col1.group(join_by)
+    grpi2 = col2.group(join_by)
+    for grpi in (grpi1,grpi2):
+        for key in grpi:
+            if len(grpi[key])>1:
+                raise Exception('diff key is not unique: %s'%str(key))
+    cache = {}
+    changes = []
+    for key in grpi1:
+        if key not in grpi2:
+            changes.append({'key':key,'change':'removed'})
+            continue
+        item1 = col1.__dicthash__[grpi1[key][0]]
+        item2 = col2.__dicthash__[grpi2[key][0]]
+        D = diff(item1,item2,cache)
+        if not D: continue
+        added,removed,changed = diff_paths(D)
+        changes.append({'key':key,'change':'changed',
+            'added':added,'removed':removed,'changed':changed})
+    for key in grpi2:
+        if key not in grpi1:
+            changes.append({'key':key,'change':'added'})
+    col = Collection()
+    col.extend(changes)
+    col.order = ['key','change','added','removed','changed']
+    return col
 
 ######################################################################
 # STORAGE BACKENDS PART ##############################################
@@ -3631,9 +7881,7 @@ class StorageConnection:
             
             # Create and fill collection.
             col = Collection()
-            for row in chunk:
-                item = {key:val for key,val in zip(key_header,row)}
-                col.update(item)
+            col.extend({key:val for key,val in zip(key_header,row)} for row in chunk)
 
             # Assign tabulation order to collection.
             col.order = key_header
@@ -5749,13 +9997,28 @@ class JobScheduler:
     def __init__(self,nprocs=1,map_chunksize=1):
         self.__nprocs__ = nprocs
         self.__map_chunksize__ = map_chunksize
+        self.__pool__ = None
         
     def map(self,job,col):
         
         #job.__scheduler__ = self
-                   
-        # normal instancing (not picklable if "job" is a lambda function)
-        wrap = JobWrapper(job=job)
+        
+        dicthash = col.__dicthash__
+        pairs = [(ID,dicthash[ID]) for ID in dicthash]
+        
+        return self.map_pairs(job,pairs)
+        
+    def map_pairs(self,job,pairs,wrap=True):
+        """
+        Map job over the (ID,item) pairs in the process pool.
+        If wrap is True, job results are logged by JobWrapper,
+        otherwise job is called on the pairs directly and must return (ID,result).
+        Returns unordered generator of (ID,result) pairs.
+        """
+        
+        if wrap:
+            # normal instancing (not picklable if "job" is a lambda function)
+            job = JobWrapper(job=job)
         
         # instancing through a metaclass (should be picklable)
         #class JobWrapper_(metaclass=WrapperMeta,job=job): pass
@@ -5765,12 +10028,18 @@ class JobScheduler:
         #    return list(pool.imap_unordered(wrap,col))
             #return pool.imap_unordered(wrap,col)
             
-        pool = Pool(processes=self.__nprocs__)
+        self.__pool__ = Pool(processes=self.__nprocs__)
         
-        dicthash = col.__dicthash__
-        pairs = [(ID,dicthash[ID]) for ID in dicthash]
+        return self.__pool__.imap_unordered(job,pairs,chunksize=self.__map_chunksize__)
         
-        return pool.imap_unordered(wrap,pairs,chunksize=self.__map_chunksize__)
+    def close(self):
+        """
+        Close the process pool when all jobs are done.
+        """
+        if self.__pool__ is not None:
+            self.__pool__.close()
+            self.__pool__.join()
+            self.__pool__ = None
         
 class Job:
 
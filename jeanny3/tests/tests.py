@@ -4,14 +4,686 @@ from jeanny3 import *
 from .unittests import runtest 
 
 def test_diff_arbitrary():
-    raise NotImplementedError
+    D1 = {'a':1,'b':{'c':[1,2],'d':{'e':'x'},'f':-1},'g':None,'h':{'i':1}}
+    D2 = {'a':1,'b':{'c':[1,3],'d':{'e':'x'},'f':-2},'j':2,'h':{'i':1.0}}
+    t = time()
+    D = diff(D1,D2)
+    elapsed_time = time()-t
+    compared = []
+    class Subtree(dict):
+        def __eq__(self,other):
+            compared.append(other)
+            return dict.__eq__(self,other)
+    D_ = diff({'a':1,'b':Subtree(D1)},{'a':2,'b':Subtree(D1)})
+    test_results = Collection()
+    test_results.update([
+        {'case':'equal','equal':diff(D1,D1)=={} and diff(D1,dict(D1))=={}},
+        {'case':'left','equal':D['left']=={'g':None}},
+        {'case':'right','equal':D['right']=={'j':2}},
+        {'case':'center','equal':D['center']=={'b':{'center':{'c':([1,2],[1,3]),'f':(-1,-2)}}}},
+        {'case':'paths','equal':diff_paths(D)==([('j',)],[('g',)],[('b','c'),('b','f')])},
+        {'case':'skip','equal':compared==[] and D_=={'center':{'a':(1,2)}}},
+    ])
+    return elapsed_time,test_results
 
 def test_diff_collection():
-    raise NotImplementedError
+    col1 = Collection()
+    col1.update([{'id':i,'a':i,'b':{'c':[i],'d':'x'}} for i in range(10000)])
+    col2 = Collection()
+    col2.update([{'id':i,'a':i,'b':{'c':[i],'d':'x'}} for i in range(1,10001)])
+    col2.getitem(99)['b']['c'] = [0]
+    col2.getitem(99)['e'] = 1
+    t = time()
+    changes = diff_collection(col1,col2,join_by='id')
+    elapsed_time = time()-t
+    test_results = Collection()
+    test_results.update([
+        {'case':'removed','equal':changes.subset(lambda v: v['change']=='removed').getcols('key')==[[0]]},
+        {'case':'added','equal':changes.subset(lambda v: v['change']=='added').getcols('key')==[[10000]]},
+        {'case':'changed','equal':changes.subset(lambda v: v['change']=='changed').getitems()==
+            [{'key':100,'change':'changed','added':[('e',)],'removed':[],'changed':[('b','c')]}]},
+    ])
+    return elapsed_time,test_results
+
+def test_columnar_backend():
+    col = Collection()
+    col.update([{'a':i,'b':i*0.5,'c':'x%d'%(i%3)} for i in range(10000)])
+    t = time()
+    col_ = col.to_columnar()
+    cols = col_.getcols(['a','b','c'])
+    elapsed_time = time()-t
+    test_results = Collection()
+    test_results.update([
+        {'case':'getcols','equal':cols==col.getcols(['a','b','c'])},
+        {'case':'group','equal':col_.group('c')==col.group('c')},
+        {'case':'convert','equal':col_.to_collection().__dicthash__==col.__dicthash__},
+    ])
+    return elapsed_time,test_results
+
+def test_vectorized_filter():
+    col = Collection()
+    col.update([{'a':i,'b':(i*7)%10,'c':'x%d'%(i%3)} for i in range(10000)])
+    col.update([{'a':-1}])
+    col_ = col.to_columnar()
+    guarded = Collection(); guarded.update([{'a':None},{'a':2},{'a':0}])
+    expr = 'a>100 and (b<3 or c=="x1") and not a%7==0'
+    ids_ref = col.ids(lambda v:'b' in v and v['a']>100 and (v['b']<3 or v['c']=='x1') and not v['a']%7==0)
+    t = time()
+    ids_ = col_.ids(expr)
+    elapsed_time = time()-t
+    test_results = Collection()
+    test_results.update([
+        {'case':'columnar','equal':ids_==ids_ref},
+        {'case':'dict','equal':col.ids(expr,vectorized=True)==ids_ref},
+        {'case':'subset','equal':col.subset(expr).ids()==ids_ref},
+        {'case':'fallback','equal':col_.ids('"b" in var')==col.ids('"b" in var')==col.subset('"b" in var').ids() and \
+            col.subset('var["a"]>9990 and len(var)>2').ids()==[9991,9992,9993,9994,9995,9996,9997,9998,9999]},
+        {'case':'guard','equal':guarded.subset('var["a"] is not None and var["a"]>1').ids()==[1] and \
+            guarded.to_columnar().ids('a is None or a>1')==[0,1]},
+    ])
+    return elapsed_time,test_results
+
+def test_secondary_index():
+    col = Collection()
+    col.update([{'a':i%100,'b':i,'c':'x%d'%(i%3)} for i in range(10000)])
+    col_ = col.copy()
+    col_.create_index('a')
+    col_.create_index('c',kind='sorted')
+    expr = 'var["a"]==5 and var["c"] in ("x1","x2")'
+    ids_ref = col.ids(expr)
+    t = time()
+    ids_ = col_.ids(expr)
+    elapsed_time = time()-t
+    for c in (col,col_):
+        c.assign('a',lambda v: 5,IDs=list(range(0,200,2)))
+        c.delete(list(range(5,1000,10)))
+        c.update([{'a':5,'c':'x1'}])
+    col__ = col_.copy()
+    col__.update([{'a':[5],'c':('x1',)},{'a':5,'c':'x1'}])
+    test_results = Collection()
+    test_results.update([
+        {'case':'lookup','equal':ids_==ids_ref},
+        {'case':'maintained','equal':col_.ids(expr)==col.ids(expr)},
+        {'case':'group','equal':col_.group('a')==col.group('a')},
+        {'case':'unhashable','equal':col__.ids(expr)==col_.ids(expr)+[col__.maxid] and \
+            len(col__.ids())==len(col_.ids())+2},
+    ])
+    return elapsed_time,test_results
+
+def test_range_index():
+    col = Collection()
+    col.update([{'a':(i*37)%1000,'b':i%7} for i in range(10000)])
+    col_ = col.copy()
+    col_.create_index('a',kind='sorted')
+    expr = 'var["a"]>100 and var["a"]<=200 and var["b"]==3'
+    vals = [100,250,600]
+    t = time()
+    ids_ = col_.ids(expr)
+    shards_ = [c.ids() for c in col_.split('a',vals)]
+    elapsed_time = time()-t
+    index = col_.get_index('a')
+    test_results = Collection()
+    test_results.update([
+        {'case':'filter','equal':ids_==col.ids(expr)},
+        {'case':'split','equal':shards_==[c.ids() for c in col.split('a',vals)]},
+        {'case':'between','equal':index.between(100,200,(False,True))==col.ids('var["a"]>100 and var["a"]<=200')},
+    ])
+    return elapsed_time,test_results
+
+def test_iter_csv():
+    import os
+    import tempfile
+    col = Collection()
+    col.update([{'a':i,'b':i/8,'c':'x%d'%i,'d':i%2==0} for i in range(5000)])
+    col.update([{'a':'n/a','b':7}])
+    filename = os.path.join(tempfile.mkdtemp(),'test.csv')
+    col.export_csv(filename)
+    t = time()
+    chunks = list(iter_csv(filename,chunksize=1000))
+    elapsed_time = time()-t
+    col_ = import_csv(filename)
+    col_.import_csv(filename,append=True)
+    os.remove(filename)
+    test_results = Collection()
+    test_results.update([
+        {'case':'import','equal':col_.getitems(col.ids())==col.getitems()},
+        {'case':'chunks','equal':[c.ids() for c in chunks]==[col.ids()[i:i+1000] for i in range(0,5001,1000)]},
+        {'case':'chunk items','equal':sum([c.getitems() for c in chunks],[])==col.getitems()},
+        {'case':'append','equal':len(col_)==2*len(col)},
+    ])
+    return elapsed_time,test_results
+
+def test_dotpar():
+    import os
+    import tempfile
+    lines = [
+        ' 11    0.072059 2.043E-30 5.088E-12.09190.391 1922.82910.760.003700          0 1 0          0 1 0  4  2  2        5  1  5      5545533321287120 7     9.0   11.0',
+        ' 11    0.900086 5.783E-35 1.965E-08.07990.352 5613.36960.57-.002400          0 3 0          0 3 0  8  2  7        7  3  4      4442434432287122 8    51.0   45.0',
+    ]
+    filename = os.path.join(tempfile.mkdtemp(),'test.par')
+    with open(filename,'w') as f:
+        for i in range(1000):
+            f.write(lines[i%2]+'\n')
+    t = time()
+    col = import_dotpar(filename)
+    elapsed_time = time()-t
+    col_ = import_dotpar(filename,numin=0.5,columnar=True)
+    export_dotpar(col,filename+'.out')
+    with open(filename+'.out') as f:
+        lines_ = f.read().split('\n')[:2]
+    os.remove(filename); os.remove(filename+'.out')
+    try:
+        fortran_fixed([10.5],'%4.2f'); overflow = False
+    except Exception:
+        overflow = True
+    test_results = Collection()
+    test_results.update([
+        {'case':'import','equal':col.getitems()[:2]==[load_dotpar(line) for line in lines]},
+        {'case':'window','equal':col_.getcols('nu')[0]==[load_dotpar(lines[1])['nu']]*500},
+        {'case':'export','equal':lines_==lines},
+        {'case':'fixed','equal':fortran_fixed([0.0594,0.5],'%5.4f')==['.0594','.5000'] and \
+            fortran_fixed([-0.594],'%6.4f')==['-.5940'] and overflow},
+    ])
+    return elapsed_time,test_results
+
+def test_fixcol():
+    import os
+    import tempfile
+    col = Collection()
+    col.update([{'a':i,'b':i/3 if i%5 else None,'c':'x%d'%i} for i in range(3000)])
+    col.order = ['a','b','c']
+    filename = os.path.join(tempfile.mkdtemp(),'test.txt')
+    col.export_fixcol(filename)
+    t = time()
+    col_ = import_fixcol(filename)
+    elapsed_time = time()-t
+    col__ = import_fixcol(filename,nprocs=2)
+    os.remove(filename)
+    col_.assign('c',lambda v: v['c'].strip()) # string values are padded in the column-fixed format
+    test_results = Collection()
+    test_results.update([
+        {'case':'import','equal':col_.getitems()==col.getitems()},
+        {'case':'parallel','equal':col__.getrows(['a','b'])==col.getrows(['a','b'])},
+    ])
+    return elapsed_time,test_results
+
+def test_folder():
+    import tempfile
+    col = Collection()
+    col.update([{'a':i,'b':[i,i/3],'c':{'d':'x%d'%i}} for i in range(2000)])
+    col.update([{'a':-1,SETTINGS['ITEM_ID']:'item'}])
+    col.update([{'a':-2,'e':float('inf'),'f':{1:'x'},SETTINGS['ITEM_ID']:'special'}])
+    dirname = tempfile.mkdtemp()
+    col.export_folder(dirname,nthreads=4,backend='auto')
+    t = time()
+    col_ = Collection(path=dirname,fmt='folder',nthreads=4,backend='auto')
+    elapsed_time = time()-t
+    col__ = Collection(path=dirname,fmt='folder')
+    test_results = Collection()
+    test_results.update([
+        {'case':'parallel','equal':col_.getitems()==col__.getitems()},
+        {'case':'items','equal':sorted(col_.getcols('a')[0])==sorted(col.getcols('a')[0])},
+        {'case':'filename','equal':'item.json' in col_.getcols(SETTINGS['FILENAME_ID'])[0]},
+        {'case':'special','equal':col_.getitems(col_.ids('var["a"]==-2'))[0]['e']==float('inf') and \
+            col_.getitems(col_.ids('var["a"]==-2'))[0]['f']=={'1':'x'}},
+    ])
+    return elapsed_time,test_results
+
+def test_update_folder():
+    import tempfile
+    FILENAME_ID = SETTINGS['FILENAME_ID']
+    col = Collection()
+    col.update([{FILENAME_ID:'%d.json'%i,'a':i,'b':'x%d'%i} for i in range(1000)])
+    dirname = tempfile.mkdtemp()
+    col.export_folder(dirname)
+    upd = Collection()
+    upd.update([{FILENAME_ID:'%d.json'%i,'a':i} for i in range(1000) if i!=5])
+    upd.update([{FILENAME_ID:'5.json','a':5,'c':1},{FILENAME_ID:'new.json','a':-1}])
+    written_first = upd.update_folder(dirname,check='mtime')
+    t = time()
+    written = upd.update_folder(dirname,check='mtime')
+    elapsed_time = time()-t
+    written_hash = upd.update_folder(dirname,check='hash')
+    col_ = Collection(path=dirname,fmt='folder')
+    col_.index(FILENAME_ID)
+    written_ext = upd.update_folder(dirname,check='mtime',ext='txt')
+    test_results = Collection()
+    test_results.update([
+        {'case':'first','equal':sorted(written_first)==['5.json','new.json']},
+        {'case':'ext','equal':len(written_ext)==1001 and '5.txt' in written_ext},
+        {'case':'unchanged','equal':written==[] and written_hash==[]},
+        {'case':'merged','equal':col_.getitem('5.json')=={FILENAME_ID:'5.json','a':5,'b':'x5','c':1}},
+        {'case':'items','equal':len(col_)==1001},
+    ])
+    return elapsed_time,test_results
+
+def test_binary():
+    import os
+    import tempfile
+    col = Collection()
+    col.update([{'a':i,'b':i/3,'c':'x%d'%i,'d':[i]} for i in range(5000)])
+    col.update([{'a':2**70,'e':True},{'c':None}])
+    col.order = ['a','b','c']
+    filename = os.path.join(tempfile.mkdtemp(),'test.bin')
+    col.export_binary(filename)
+    t = time()
+    col_ = import_binary(filename,columnar=True)
+    elapsed_time = time()-t
+    col_.assign('b',lambda v: -1,IDs=[0])
+    col__ = import_binary(filename)
+    col.export_binary(filename+'.z',compression='zlib')
+    col_z = import_binary(filename+'.z',columnar=True)
+    test_results = Collection()
+    test_results.update([
+        {'case':'import','equal':col__.__dicthash__==col.__dicthash__},
+        {'case':'columnar','equal':col_.getitems(col.ids()[1:])==col.getitems()[1:]},
+        {'case':'copy-on-write','equal':col__.getitem(0)['b']==0.0},
+        {'case':'compressed','equal':col_z.to_collection()==col and col_z.order==col.order},
+    ])
+    os.remove(filename); os.remove(filename+'.z') # columns are loaded lazily
+    return elapsed_time,test_results
+
+def test_hash_join():
+    col1 = Collection()
+    col1.update([{'k':i%300,'x':i} for i in range(1000)])
+    col2 = Collection()
+    col2.update([{'k':100+i%400,'y':i} for i in range(700)])
+    srt = lambda idx: sorted(idx,key=lambda p:(str(p[0]),str(p[1])))
+    inner = [(id1,id2) for id1 in col1.ids() for id2 in col2.ids() \
+        if col1.getitem(id1)['k']==col2.getitem(id2)['k']]
+    left = inner + [(ID,None) for ID in col1.ids() if col1.getitem(ID)['k']<100]
+    right = inner + [(None,ID) for ID in col2.ids() if col2.getitem(ID)['k']>=300]
+    t = time()
+    idx = create_join_index(col1,col2,'k')
+    elapsed_time = time()-t
+    test_results = Collection()
+    test_results.update([
+        {'case':'inner','equal':srt(idx)==srt(inner)},
+        {'case':'inner swapped','equal':srt(create_join_index(col2,col1,'k').swap())==srt(inner)},
+        {'case':'left','equal':srt(create_join_index(col1,col2,'k',how='left'))==srt(left)},
+        {'case':'right','equal':srt(create_join_index(col1,col2,'k',how='right'))==srt(right)},
+        {'case':'full','equal':srt(create_join_index(col1,col2,'k',inner=False))==srt(set(left+right))},
+        {'case':'group indexes','equal':srt(join_index(col1.group('k'),col2.group('k'),how='left'))==srt(left)},
+    ])
+    return elapsed_time,test_results
+
+def test_merge_join():
+    cols = []
+    for n,shift in [(1000,0),(700,100),(500,50)]:
+        col = Collection()
+        col.update([{'k':shift+i%300,'x%d'%n:i} for i in range(n)])
+        cols.append(col)
+    cols[0].update([{'k':None,'x1000':-1}])
+    cols[1].update([{'k':None,'x700':-1}])
+    gidxs = [col.group('k') for col in cols]
+    keys = [set(gidx) for gidx in gidxs]
+    t = time()
+    jidx = join_index_(*gidxs)
+    elapsed_time = time()-t
+    jidx_outer = join_index_(*gidxs,inner=False,lazy=True)
+    cols[0].create_index('k',kind='sorted')
+    jidx_sorted = join_index_(cols[0].get_index('k'),gidxs[1])
+    count = lambda ks: sum([len(gidxs[0].get(k,[None]))*len(gidxs[1].get(k,[None]))*len(gidxs[2].get(k,[None])) for k in ks])
+    test_results = Collection()
+    test_results.update([
+        {'case':'inner','equal':len(jidx)==count(keys[0]&keys[1]&keys[2])},
+        {'case':'sorted','equal':[k for k,_ in jidx]==sorted([k for k,_ in jidx])},
+        {'case':'outer','equal':sum([1 for _ in jidx_outer])==count(keys[0]|keys[1]|keys[2])},
+        {'case':'sorted index','equal':jidx_sorted==join_index_(gidxs[0],gidxs[1])[1:]}, # None is not indexed
+        {'case':'none','equal':join_index_(gidxs[0],gidxs[1])[0]==[None,(1000,700)]},
+        {'case':'compare','equal':compare(cols[1],cols[1],join_by=join_index_(cols[1].group('__ID__'),cols[1].group('__ID__'),lazy=True)).getitems()==compare(cols[1],cols[1]).getitems()},
+    ])
+    return elapsed_time,test_results
+
+def test_bulk_join():
+    cols = []
+    for n in [1000,700]:
+        col = Collection()
+        col.update([{'k':i%300,'x%d'%n:i} for i in range(n)])
+        col.order = ['x%d'%n]
+        cols.append(col)
+    gidxs = [col.group('k') for col in cols]
+    for col in cols: col.deletecols('k')
+    jidx = join_index_(*gidxs,inner=False)
+    ref = []
+    for jval,(id1,id2) in jidx:
+        item = {'k':jval}
+        if id1 is not None: item.update(cols[0].getitem(id1))
+        if id2 is not None: item.update(cols[1].getitem(id2))
+        ref.append(item)
+    t = time()
+    col = join_('k',jidx,*cols,batchsize=100)
+    elapsed_time = time()-t
+    col_view = join_('k',join_index_(*gidxs,inner=False,lazy=True),*cols,view=True)
+    try:
+        join_('x700',jidx,*cols)
+        conflict = False
+    except Exception:
+        conflict = True
+    test_results = Collection()
+    test_results.update([
+        {'case':'bulk','equal':col.getitems()==ref and col.ids()==list(range(len(ref)))},
+        {'case':'view','equal':col_view.getitems()==ref and col_view.order==['k','x1000','x700']},
+        {'case':'conflict','equal':conflict},
+    ])
+    return elapsed_time,test_results
+
+def test_compare():
+    col1 = Collection()
+    col1.update([{'id':i,'a':i,'b':i/7,'c':'x%d'%(i%5)} for i in range(3000)])
+    col2 = Collection()
+    col2.update([{'id':i,'a':i if i%10 else i+1,'b':i/7+1e-9,'c':'x%d'%(i%5)} for i in range(2500)])
+    col2.update([{'id':-1,'d':0}])
+    compfuncs = {'SUM':{'keys':['a'],'func':lambda vals1,vals2: int(vals1.sum()-vals2.sum())}}
+    t = time()
+    stat = compare(col1,col2,join_by='id',compfuncs=compfuncs,atol=1e-6)
+    elapsed_time = time()-t
+    stat_ = compare(col1.to_columnar(),col2.to_columnar(),join_by='id',compfuncs=compfuncs,atol=1e-6)
+    test_results = Collection()
+    test_results.update([
+        {'case':'neq','equal':stat.getitem('a')['neq(1&2)']==2250 and stat.getitem('c')['eq']},
+        {'case':'madiff','equal':stat.getitem('a')['madiff(1&2)']==1},
+        {'case':'nclose','equal':stat.getitem('b')['nclose(1&2)']==2500 and stat.getitem('b')['neq(1&2)']<2500},
+        {'case':'compfuncs','equal':stat.getitem('a')['SUM']==-250},
+        {'case':'columnar','equal':stat_.getitems()==stat.getitems()},
+    ])
+    return elapsed_time,test_results
+
+def test_aggregate():
+    col = Collection()
+    col.update([{'g':i%3,'h':i%2,'v':float(i),'n':i} for i in range(600)])
+    col.update([{'g':0,'h':0,'n':-1}])
+    aggs = {'cnt':'count','vc':('v','count'),'sum':('v','sum'),'mean':('v','mean'),
+        'min':('n','min'),'max':('n','max'),'med':('n','median'),'std':('v','std'),
+        'top':('n',lambda vals: int(vals.max()))}
+    t = time()
+    stat = col.aggregate(['g','h'],aggs)
+    elapsed_time = time()-t
+    stat_ = col.to_columnar().aggregate(['g','h'],aggs)
+    grpi = col.group(['g','h'])
+    stat__ = col.stat_(['g','h'],grpi,map={'sum':lambda v: v['n']},reduce={'sum':sum,'cnt':len})
+    item = stat.getitem((0,0))
+    test_results = Collection()
+    test_results.update([
+        {'case':'count','equal':item['cnt']==101 and item['vc']==100},
+        {'case':'sum','equal':item['sum']==sum(range(0,600,6)) and item['mean']==297.0},
+        {'case':'minmax','equal':item['min']==-1 and item['max']==594 and item['top']==594},
+        {'case':'median','equal':stat.getitem((1,1))['med']==298.0},
+        {'case':'order','equal':stat.order==['g','h']+list(aggs)},
+        {'case':'columnar','equal':stat_.getitems()==stat.getitems()},
+        {'case':'stat_','equal':stat__.getitem((0,0))=={'g':0,'h':0,'sum':29699,'cnt':101} \
+            and stat__.order==['g','h','sum','cnt']},
+    ])
+    return elapsed_time,test_results
+
+def test_group_index():
+    items = [{'a':i%4,'b':'xyz'[i%3],'c':[None,1.5,'s'][i%3]} for i in range(1200)]
+    col = Collection()
+    col.update(items)
+    col_ = ColumnarCollection()
+    col_.update(items)
+    t = time()
+    gidx = col_.group_index(['a','b'])
+    elapsed_time = time()-t
+    test_results = Collection()
+    test_results.update([
+        {'case':'single','equal':col_.group('a')==col.group('a')},
+        {'case':'composite','equal':col_.group(['a','b'])==col.group(['a','b']) and \
+            list(col_.group('a b'))==list(col.group('a b'))},
+        {'case':'objects','equal':col_.group(['c','a'])==col.group(['c','a'])},
+        {'case':'compact','equal':len(gidx)==12 and sum(gidx.sizes())==1200 and \
+            gidx[(1,'y')]==col.group(['a','b'])[(1,'y')]},
+        {'case':'to_dict','equal':gidx.to_dict()==col.group(['a','b'])},
+    ])
+    return elapsed_time,test_results
+
+def test_parallel_stat():
+    from operator import itemgetter
+    col = Collection()
+    col.update([{'g':(i*i)%17,'v':i,'s':'x'*10} for i in range(2000)])
+    grpi = col.group('g')
+    map = {'sum':itemgetter('v'),'max':itemgetter('v'),'n':None}
+    reduce = {'sum':sum,'max':max,'n':len}
+    stat = col.stat_('g',grpi,map=map,reduce=reduce)
+    t = time()
+    stat_ = col.stat_('g',grpi,map=map,reduce=reduce,nprocs=2,colnames=['v'])
+    elapsed_time = time()-t
+    plain = col.stat('g',grpi,'sum',map=itemgetter('v'),reduce=sum,plain=True,nprocs=3,colnames=['v'])
+    test_results = Collection()
+    test_results.update([
+        {'case':'stat_','equal':stat_.getitems()==stat.getitems() and stat_.order==stat.order},
+        {'case':'plain','equal':list(plain.items())==[(k,stat.getitem(k)['sum']) for k in grpi]},
+        {'case':'chunks','equal':stat_chunks([10,1,1,5,3,8],3)==[[0],[1,5],[2,3,4]]},
+    ])
+    return elapsed_time,test_results
+
+def test_view():
+    col = Collection()
+    col.update([{'a':i,'b':i%3,'l':[i]} for i in range(30)])
+    t = time()
+    view = col.view('b==1')
+    elapsed_time = time()-t
+    view_ = view.view(lambda var: var['a']>10)
+    view.assign('c','var["a"]*10')
+    view.getitem(4)['a'] = -4
+    view.getitem(4)['l'].append(-4)
+    view.update([{'a':100}])
+    view.delete([1])
+    copy = view.copy()
+    copy.getitem(7)['a'] = 0
+    part = view.copy(colnames=['a','c'])
+    grpi = col.group('b')
+    test_results = Collection()
+    test_results.update([
+        {'case':'lazy','equal':view_.ids()==[13,16,19,22,25,28,30]},
+        {'case':'cow','equal':col.getitem(4)=={'a':4,'b':1,'l':[4]} and view.getitem(4)['a']==-4 \
+            and view.getitem(4)['l']==[4,-4] \
+            and 'c' not in col.keys()},
+        {'case':'update','equal':view.ids()==[4,7,10,13,16,19,22,25,28,30] and len(col)==30},
+        {'case':'copy','equal':view.getitem(7)['a']==7 and type(copy.getitem(7)) is dict},
+        {'case':'colnames','equal':part.getitem(4)=={'a':-4,'c':40} and part.ids()==view.ids()},
+        {'case':'subset_group','equal':col.subset_group(grpi,view=True).ids()==col.subset_group(grpi).ids()},
+    ])
+    return elapsed_time,test_results
+
+def test_copy():
+    col = Collection()
+    col.update([{'a':i,'b':'x%d'%i,'c':[i,[i]],'d':{'e':i}} for i in range(1000)])
+    col.order = ['a','b','c','d']
+    col.create_index('a')
+    t = time()
+    col_ = col.copy()
+    elapsed_time = time()-t
+    col_.getitem(1)['c'][1].append(0)
+    col_.getitem(1)['d']['e'] = -1
+    part = col.copy(colnames=['a','c'])
+    columnar = col.to_columnar()
+    columnar_ = columnar.copy()
+    columnar_.getitem(2)['c'].append(0)
+    test_results = Collection()
+    test_results.update([
+        {'case':'items','equal':col_.getitems(range(2,1000))==col.getitems(range(2,1000)) \
+            and col_.order==col.order and col_.maxid==col.maxid},
+        {'case':'deep','equal':col.getitem(1)=={'a':1,'b':'x1','c':[1,[1]],'d':{'e':1}}},
+        {'case':'index','equal':col_.indexes()=={'a':'hash'} and col_.ids('var["a"]==5')==[5]},
+        {'case':'colnames','equal':part.getitem(3)=={'a':3,'c':[3,[3]]} and part.order==['a','c']},
+        {'case':'columnar','equal':columnar.getitem(2)['c']==[2,[2]] and columnar_.getitem(2)['c']==[2,[2],0]},
+    ])
+    return elapsed_time,test_results
+
+def test_compact_rows():
+    import pickle
+    from jeanny3.jeanny3 import CompactRow
+    items = [{'c%d'%k:i*k for k in range(10)} for i in range(1000)]
+    t = time()
+    col = Collection()
+    col.update(items)
+    elapsed_time = time()-t
+    row1 = col.getitem(1); row2 = col.getitem(2)
+    row2['extra'] = 'x'; del row2['c0']
+    mixed = Collection()
+    mixed.update([{'k%d'%i:i for i in range(10+j)} for j in range(10)])
+    narrow = Collection()
+    narrow.update([{'a':i} for i in range(10)])
+    reordered = Collection()
+    reordered.update([dict(reversed(list(item.items()))) for item in items[:10]])
+    other = Collection(); other.update(row1)
+    other_col = ColumnarCollection(); other_col.update(row1)
+    test_results = Collection()
+    test_results.update([
+        {'case':'compact','equal':type(row1) is CompactRow and \
+            row1.__schema__ is col.getitem(3).__schema__},
+        {'case':'items','equal':col.getitems(range(3,1000))==items[3:] and row1==items[1]},
+        {'case':'transition','equal':row2=={**{'c%d'%k:2*k for k in range(1,10)},'extra':'x'} and \
+            col.getcol('extra',IDs=[1,2])==[None,'x']},
+        {'case':'fallback','equal':type(mixed.getitem(0)) is dict and type(narrow.getitem(0)) is dict},
+        {'case':'copy','equal':pickle.loads(pickle.dumps(row2))==row2 and col.copy().getitems()==col.getitems()},
+        {'case':'reordered','equal':reordered.getitem(5).__schema__ is row1.__schema__ and \
+            reordered.getitems()==items[:10]},
+        {'case':'mapping','equal':other.getitems()==[items[1]] and other.getitem(0) is not row1 and \
+            other_col.getitems()==[items[1]]},
+    ])
+    return elapsed_time,test_results
+
+def test_schema_catalogue():
+    col = Collection()
+    col.update([{'a':i,'b':'x%d'%i,'c':float(i)} for i in range(1000)])
+    item = col.getitem(0)
+    default = col.keys(); item['new'] = 1
+    default = col.keys()=={'a':1000,'b':1000,'c':1000,'new':1}; del item['new']
+    col.create_catalogue()
+    t = time()
+    keys = col.keys(); types = col.get_types()
+    elapsed_time = time()-t
+    col.update([{'a':'s','d':None}])
+    col.delete([0,1])
+    col.assign('e','var["a"]')
+    after_update = col.keys()=={'a':999,'b':998,'c':998,'d':1,'e':999} and col.get_types()['a'] is Collection.MIXED
+    col.deletecols('c'); col.renamecol('b','f')
+    col.subset([2,3]).assign('g','1')
+    col.getitem(4)['h'] = 1
+    scan = {}
+    for item in col.__dicthash__.values():
+        for key in item: scan[key] = scan.get(key,0)+1
+    cleared = Collection(); cleared.create_catalogue()
+    cleared.update([{'a':1}]); cleared.clear(); cleared.update([{'b':'x'}])
+    cleared = cleared.__catalogued__ and cleared.keys()=={'b':1} and cleared.get_types()=={'b':str}
+    test_results = Collection()
+    test_results.update([
+        {'case':'build','equal':keys=={'a':1000,'b':1000,'c':1000} and \
+            types=={'a':int,'b':str,'c':float}},
+        {'case':'update','equal':after_update},
+        {'case':'columns','equal':col.keys()==scan and col.get_types()['f'] is str},
+        {'case':'default','equal':default},
+        {'case':'clear','equal':cleared},
+    ])
+    return elapsed_time,test_results
+
+def test_column_accessors():
+    from types import SimpleNamespace
+    col = Collection()
+    col.update([{'a':i,'b':SimpleNamespace(c=SimpleNamespace(d=i)),'e':'x%d'%i} for i in range(1000)])
+    col.update([{'a':-1,'b':None}])
+    IDs = list(range(1000))
+    t = time()
+    cols = col.getcols(['a','b.c.d','__ID__'],IDs=IDs)
+    elapsed_time = time()-t
+    rows = col.getrows(['a','e'],IDs=[1,2])
+    greedy = col.getcols(['e','b.c.d'],IDs=[999,1000],mode='greedy')
+    silent = col.getcols(['e','b.c.d','f'],IDs=[999,1000],mode='silent',functions={'f':lambda v: v['a']})
+    rows_silent = col.getrows(['a','e'],IDs=[999,1000],mode='silent')
+    try:
+        col.getcols('e'); strict = False
+    except KeyError:
+        strict = True
+    test_results = Collection()
+    test_results.update([
+        {'case':'columns','equal':cols==[IDs,IDs,IDs]},
+        {'case':'rows','equal':rows==[(1,'x1'),(2,'x2')] and rows_silent==[(999,'x999'),(-1,None)]},
+        {'case':'missing','equal':greedy==[['x999',None],[999,None]] and \
+            silent==[['x999'],[999],[999,-1]] and strict},
+    ])
+    return elapsed_time,test_results
+
+def test_typed_arrays():
+    import numpy as np
+    items = [{'i':k,'f':k/2,'s':'x%d'%k} for k in range(1000)]
+    items[1].pop('i'); items[2]['f'] = None
+    col = Collection(); col.update(items)
+    columnar = col.to_columnar()
+    t = time()
+    arrays = col.getcols(['i','f','s'],mode='greedy',as_array=True)
+    elapsed_time = time()-t
+    arrays_ = columnar.getcols(['i','f','s'],mode='greedy',as_array=True)
+    nans = col.getcols(['i','f'],mode='greedy',as_array='nan')
+    scalars = Collection(); scalars.update([{'x':np.float64(k/2),'y':np.int64(k)} for k in range(10)])
+    scalars = scalars.getcols(['x','y'],as_array=True)
+    def same(a,b):
+        return a.dtype==b.dtype and np.ma.getmaskarray(a).tolist()==np.ma.getmaskarray(b).tolist() \
+            and np.ma.filled(a,0).tolist()==np.ma.filled(b,0).tolist()
+    test_results = Collection()
+    test_results.update([
+        {'case':'dtypes','equal':[a.dtype.kind for a in arrays]==['i','f','O']},
+        {'case':'masked','equal':np.ma.getmaskarray(arrays[0]).nonzero()[0].tolist()==[1] and \
+            np.ma.getmaskarray(arrays[1]).nonzero()[0].tolist()==[2] and not np.ma.isMaskedArray(arrays[2])},
+        {'case':'nan','equal':nans[0].dtype.kind=='f' and np.isnan(nans[0]).nonzero()[0].tolist()==[1] and \
+            np.isnan(nans[1]).nonzero()[0].tolist()==[2]},
+        {'case':'columnar','equal':all(same(a,b) for a,b in zip(arrays,arrays_))},
+        {'case':'numpy','equal':[a.dtype for a in scalars]==[np.float64,np.int64]},
+        {'case':'sort','equal':col.sort(['s','f'],IDs=[3,5,4])==[3,4,5] and \
+            col.sort(['f','__ID__'],IDs=[5,3,4])==[3,4,5]},
+    ])
+    return elapsed_time,test_results
+
+def test_extend():
+    items = [{'a':k,'b':[k,-k] if k%2 else k} for k in range(1000)]
+    col = Collection(); col.update(items)
+    t = time()
+    col_ = Collection(); col_.extend(iter([dict(item) for item in items]),chunksize=300)
+    elapsed_time = time()-t
+    mixed = Collection(); mixed.update({'a':0},[1]); mixed.extend([{'a':1},{'a':2}])
+    mixed_ = Collection(); mixed_.update({'a':0},[1]); mixed_.update([{'a':1},{'a':2}])
+    columnar = ColumnarCollection(); columnar.extend({'a':k} for k in range(10))
+    single = Collection(); single.extend({'ab':1,'cd':2})
+    unrolled = col.unroll(['b'])
+    test_results = Collection()
+    test_results.update([
+        {'case':'extend','equal':col_.ids()==col.ids() and col_.getcol('b')==col.getcol('b')},
+        {'case':'owned','equal':col_.getitem(3) is not items[3] and col_.maxid==999},
+        {'case':'collision','equal':mixed.ids()==mixed_.ids() and mixed.getcol('a')==mixed_.getcol('a')},
+        {'case':'columnar','equal':columnar.getcol('a')==list(range(10))},
+        {'case':'single','equal':single.getitems()==[{'ab':1,'cd':2}]},
+        {'case':'unroll','equal':len(unrolled.ids())==1500 and unrolled.getcol('b')[:3]==[0,1,-1]},
+    ])
+    return elapsed_time,test_results
 
 TEST_CASES = [
     test_diff_arbitrary,
-    test_diff_collection
+    test_diff_collection,
+    test_columnar_backend,
+    test_vectorized_filter,
+    test_secondary_index,
+    test_range_index,
+    test_iter_csv,
+    test_dotpar,
+    test_fixcol,
+    test_folder,
+    test_update_folder,
+    test_binary,
+    test_hash_join,
+    test_merge_join,
+    test_bulk_join,
+    test_compare,
+    test_aggregate,
+    test_group_index,
+    test_parallel_stat,
+    test_view,
+    test_copy,
+    test_compact_rows,
+    test_schema_catalogue,
+    test_column_accessors,
+    test_typed_arrays,
+    test_extend,
 ]
 
 def do_tests(TEST_CASES,testgroup=None,session_name=None): # test all functions    